@@ -0,0 +1 @@
+"""Performance benchmarks for the data merge tool. Run modules with ``python -m benchmarks.<name>``."""
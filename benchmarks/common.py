@@ -0,0 +1,135 @@
+"""Shared helpers for the benchmarks: synthetic data and an in-memory stand-in for the lookup table."""
+import datetime
+import logging
+import random
+import re
+import sqlite3
+from decimal import Decimal
+from typing import Dict, List
+
+import pandas as pd
+
+import data_merge
+from data_merge import DataEnricher, TARGET_COLUMNS
+
+REFERENCE_COLUMNS = ["PNR_Number", "Airline_Code", "Travel_Sector"]
+AIRLINES = ["6E", "AI", "UK", "SG", "QP"]
+SECTORS = ["DEL-BOM", "BOM-BLR", "BLR-HYD", "HYD-DEL", "MAA-CCU", "CCU-DEL"]
+# "DECIMAL TEXT" keeps text affinity (so "1000.50" is not stored as a REAL) while
+# SQLiteLookupBackend still converts the column by its first word, DECIMAL
+COLUMN_TYPES = {
+    'Taxable_Amount': "DECIMAL TEXT", 'NonTaxable_Amount': "DECIMAL TEXT", 'Cgst_Total': "DECIMAL TEXT",
+    'Sgst_Total': "DECIMAL TEXT", 'Igst_Total': "DECIMAL TEXT", 'Invoice_Total_GST': "DECIMAL TEXT",
+    'Booking_Date': "DATE",
+}
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+
+
+def quiet_logging():
+    """Keep per-batch INFO logging out of the measurements."""
+    logging.getLogger(data_merge.__name__).setLevel(logging.WARNING)
+
+
+def make_key(i: int):
+    return (f"PNR{i:07d}", AIRLINES[i % len(AIRLINES)], SECTORS[i % len(SECTORS)])
+
+
+def make_table(keys: int) -> Dict[tuple, Dict]:
+    """Build the stand-in lookup table: reference key -> full database row."""
+    table = {}
+    for i in range(keys):
+        key = make_key(i)
+        row = dict(zip(REFERENCE_COLUMNS, key))
+        row.update({
+            'Taxable_Amount': Decimal(1000 + i % 9000) + Decimal("0.50"),
+            'NonTaxable_Amount': Decimal("0.00"),
+            'Cgst_Total': Decimal("45.00"),
+            'Sgst_Total': Decimal("45.00"),
+            'Igst_Total': None,
+            'Booking_Date': datetime.date(2024, 1, 1) + datetime.timedelta(days=i % 365),
+            'GST_Name': f"Customer {i % 50}",
+            'GST_Number': f"29ABCDE{i % 10000:04d}F1Z5",
+            'Invoice_Number': f"INV{i:08d}",
+            'Invoice_Total_GST': Decimal("90.00"),
+            'Airline_Gst_Number': f"07AAACI{i % 100:04d}A1ZQ",
+            'Airline_Gst_Name': AIRLINES[i % len(AIRLINES)] + " Airlines",
+        })
+        table[key] = row
+    return table
+
+
+def make_frame(rows: int, distinct_keys: int, match_rate: float = 0.8, seed: int = 7) -> pd.DataFrame:
+    """Build an input sheet with the real Excel headers from config.json."""
+    rng = random.Random(seed)
+    pnrs, airlines, sectors = [], [], []
+    for _ in range(rows):
+        i = rng.randrange(distinct_keys)
+        if rng.random() >= match_rate:
+            i += distinct_keys  # outside the table -> no match
+        pnr, airline, sector = make_key(i)
+        pnrs.append(pnr)
+        airlines.append(airline)
+        sectors.append(sector)
+    return pd.DataFrame({
+        "S.No": range(1, rows + 1),
+        "Airline PNR": pnrs,
+        "Airline Code": airlines,
+        "Sector": sectors,
+        "Fare": [round(rng.uniform(1000, 20000), 2) for _ in range(rows)],
+    })
+
+
+class InMemoryEnricher(DataEnricher):
+    """DataEnricher whose queries are answered from a dict instead of MySQL."""
+
+    _select_re = re.compile(r"SELECT (.*?) FROM", re.S)
+
+    def __init__(self, table: Dict[tuple, Dict], **kwargs):
+        super().__init__(host="", database="", user="", password="", **kwargs)
+        self.table = table
+        self.query_count = 0
+
+    def connect(self) -> bool:
+        return True
+
+    def disconnect(self):
+        pass
+
+    def get_all_columns(self, table_name: str) -> List[str]:
+        return REFERENCE_COLUMNS + TARGET_COLUMNS
+
+    def use_temp_table(self, key_count: int) -> bool:
+        # Only the IN-list queries can be answered from the dict
+        return False
+
+    def execute_query_with_retry(self, query: str, params: List = None, connection=None,
+                                 prepared: bool = False) -> List[Dict]:
+        self.query_count += 1
+        columns = [c.strip().strip('`') for c in self._select_re.search(query).group(1).split(',')]
+        width = len(REFERENCE_COLUMNS)
+        results = []
+        params = params or []
+        for i in range(0, len(params), width):
+            row = self.table.get(tuple(params[i:i + width]))
+            if row is not None:
+                results.append({c: row[c] for c in columns})
+        return results
+
+
+def seed_sqlite_table(path: str, table_name: str, table: Dict[tuple, Dict]):
+    """Create a SQLite stand-in for the lookup table, with the composite reference index MySQL has."""
+    columns = REFERENCE_COLUMNS + TARGET_COLUMNS
+    columns_sql = ", ".join(f"`{c}` {COLUMN_TYPES.get(c, 'TEXT')}" for c in columns)
+    with sqlite3.connect(path) as db:
+        db.execute(f"DROP TABLE IF EXISTS `{table_name}`")
+        db.execute(f"CREATE TABLE `{table_name}` (`id` INTEGER PRIMARY KEY, {columns_sql})")
+        db.execute(f"CREATE INDEX `idx_reference` ON `{table_name}` "
+                   f"({', '.join(f'`{c}`' for c in REFERENCE_COLUMNS)})")
+        db.executemany(
+            f"INSERT INTO `{table_name}` ({', '.join(f'`{c}`' for c in columns)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))})",
+            (tuple(row[c] for c in columns) for row in table.values())
+        )
+    db.close()
@@ -0,0 +1,108 @@
+"""
+Benchmark the column-oriented enrichment path against the previous iterrows
+implementation, using an in-memory stand-in for the lookup table.
+
+Usage:
+    python -m benchmarks.enrich --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+import data_merge
+from benchmarks.common import InMemoryEnricher, make_frame, make_table, quiet_logging
+
+
+def legacy_enrich(enricher, df_excel: pd.DataFrame, plan, table_name: str):
+    """The iterrows batch loop as it was before vectorization (kept here for comparison)."""
+    reference_columns = plan["reference_columns"]
+    missing_columns = plan["missing_columns"]
+    excel_to_db_mapping = plan["excel_to_db_mapping"]
+    enriched_data = []
+    match_count = 0
+    no_match_count = 0
+    for batch_start in range(0, len(df_excel), data_merge.BATCH_SIZE):
+        batch_df = df_excel.iloc[batch_start:batch_start + data_merge.BATCH_SIZE]
+        row_keys = {}
+        rows_with_missing_refs = set()
+        for idx, row in batch_df.iterrows():
+            key_values = []
+            valid = True
+            for ref_col in reference_columns:
+                excel_col = None
+                for excel_name, db_name in excel_to_db_mapping.items():
+                    if db_name == ref_col:
+                        excel_col = excel_name
+                        break
+                if excel_col is None:
+                    excel_col = ref_col
+                value = row[excel_col]
+                if enricher.is_empty_value(value):
+                    valid = False
+                    break
+                key_values.append(value)
+            if valid:
+                row_keys[idx] = tuple(key_values)
+            else:
+                rows_with_missing_refs.add(idx)
+        unique_keys = list(dict.fromkeys(row_keys.values()))
+        lookup = {}
+        if unique_keys:
+            for r in enricher._query_lookup(unique_keys, plan, table_name):
+                key = tuple(r[c] for c in reference_columns)
+                if key not in lookup:
+                    lookup[key] = {col: r.get(col) for col in missing_columns}
+        for idx, row in batch_df.iterrows():
+            complete_row = row.to_dict()
+            key = row_keys.get(idx)
+            if idx not in rows_with_missing_refs and key in lookup:
+                for col in missing_columns:
+                    complete_row[col] = lookup[key].get(col)
+                match_count += 1
+            else:
+                for col in missing_columns:
+                    complete_row[col] = None
+                no_match_count += 1
+            enriched_data.append(complete_row)
+    df_enriched = pd.DataFrame(enriched_data).rename(columns=plan["rename_dict"])
+    return df_enriched[plan["final_column_order"]], match_count, no_match_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--skip-legacy-above", type=int, default=None,
+                        help="Only time the new path for sizes above this many rows")
+    args = parser.parse_args()
+
+    data_merge.configure()
+    quiet_logging()
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in args.sizes:
+        distinct = max(rows // 4, 1)
+        enricher = InMemoryEnricher(make_table(distinct))
+        df = make_frame(rows, distinct)
+        plan = enricher._prepare_enrichment(list(df.columns), "PDF_Invoice_Details",
+                                            data_merge.POSSIBLE_REFERENCE_COMBINATIONS, data_merge.COLUMN_MAPPING)
+
+        start = time.perf_counter()
+        new_df, new_matches, new_no_matches = enricher._enrich_frame(df, plan, "PDF_Invoice_Details")
+        new_time = time.perf_counter() - start
+
+        if args.skip_legacy_above is not None and rows > args.skip_legacy_above:
+            print(f"{rows:>10} {'-':>12} {new_time:>15.2f} {'-':>8}")
+            continue
+
+        start = time.perf_counter()
+        old_df, old_matches, old_no_matches = legacy_enrich(enricher, df, plan, "PDF_Invoice_Details")
+        legacy_time = time.perf_counter() - start
+
+        assert (new_matches, new_no_matches) == (old_matches, old_no_matches), "match counts differ"
+        pd.testing.assert_frame_equal(new_df.astype(object).where(new_df.notna(), None),
+                                      old_df.astype(object).where(old_df.notna(), None))
+        print(f"{rows:>10} {legacy_time:>12.2f} {new_time:>15.2f} {legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
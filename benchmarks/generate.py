@@ -0,0 +1,108 @@
+"""
+Generate a synthetic supplier workbook with the real column_mapping headers,
+plus an optional SQLite stand-in for the lookup table it is enriched against.
+
+Usage:
+    python -m benchmarks.generate bench.xlsx --rows 5000 --sheets 3 --header-offset 2 \\
+        --duplicate-ratio 0.3 --match-rate 0.8 --db bench.sqlite
+"""
+import argparse
+import random
+from typing import Dict, List
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+
+import data_merge
+from benchmarks.common import REFERENCE_COLUMNS, make_key, make_table, seed_sqlite_table
+
+# Input headers for the reference columns, as suppliers spell them in column_mapping
+REFERENCE_HEADERS = {"PNR_Number": "Airline PNR", "Airline_Code": "Airline Code", "Travel_Sector": "Sector"}
+HEADERS = ["S.No"] + [REFERENCE_HEADERS[c] for c in REFERENCE_COLUMNS] + ["Fare", "Remarks"]
+
+
+def make_keys(rows: int, duplicate_ratio: float, match_rate: float, rng: random.Random):
+    """
+    Reference keys for `rows` input rows. About duplicate_ratio of the rows repeat a key
+    seen elsewhere in the workbook, and about match_rate of the distinct keys exist in
+    the table. Returns (keys in row order, number of table rows to seed).
+    """
+    distinct = max(1, round(rows * (1 - duplicate_ratio)))
+    matched = round(distinct * match_rate)
+    # Matching keys come from the start of the table, missing ones from past its end
+    ids = rng.sample(range(distinct * 2), matched) + [distinct * 2 + i for i in range(distinct - matched)]
+    keys = [make_key(i) for i in ids]
+    keys += [rng.choice(keys) for _ in range(rows - distinct)]
+    rng.shuffle(keys)
+    return keys, distinct * 2
+
+
+def build_workbook(path: str, rows: int, sheets: int = 1, header_offset: int = 2,
+                   duplicate_ratio: float = 0.3, match_rate: float = 0.8, seed: int = 42) -> Dict:
+    """
+    Write a workbook of `sheets` sheets with `rows` data rows each, under `header_offset`
+    title rows and a styled header row. Returns the generation parameters and the
+    stand-in table (reference key -> database row) the keys were drawn against.
+    """
+    column_mapping = data_merge.ensure_configured()["column_mapping"]
+    assert all(column_mapping.get(header) == db_col for db_col, header in REFERENCE_HEADERS.items()), \
+        "REFERENCE_HEADERS no longer match column_mapping in config.json"
+    rng = random.Random(seed)
+    keys, table_rows = make_keys(rows * sheets, duplicate_ratio, match_rate, rng)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor="1F4E78")
+    header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    wb = Workbook(write_only=True)
+    for sheet_idx in range(sheets):
+        ws = wb.create_sheet(f"Day {sheet_idx + 1}")
+        for col_letter, width in zip("ABCDEF", [8, 16, 12, 12, 12, 18]):
+            ws.column_dimensions[col_letter].width = width
+        for title_idx in range(header_offset):
+            ws.append([f"Supplier statement line {title_idx + 1}"])
+        header_cells: List[WriteOnlyCell] = []
+        for header in HEADERS:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font, cell.fill, cell.alignment = header_font, header_fill, header_alignment
+            header_cells.append(cell)
+        ws.append(header_cells)
+        for row_idx, key in enumerate(keys[sheet_idx * rows:(sheet_idx + 1) * rows]):
+            ws.append([row_idx + 1, *key, round(rng.uniform(1000, 20000), 2),
+                       rng.choice([None, None, "refund", "reissue"])])
+    wb.save(path)
+
+    return {
+        "parameters": {"rows": rows, "sheets": sheets, "header_offset": header_offset,
+                       "duplicate_ratio": duplicate_ratio, "match_rate": match_rate, "seed": seed},
+        "distinct_keys": len(set(keys)),
+        "table": make_table(table_rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Workbook to write (.xlsx)")
+    parser.add_argument("--rows", type=int, default=5000, help="Data rows per sheet")
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--header-offset", type=int, default=2, help="Title rows above the header row")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3,
+                        help="Share of rows repeating a reference key used elsewhere in the workbook")
+    parser.add_argument("--match-rate", type=float, default=0.8, help="Share of distinct keys found in the table")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Also seed a SQLite stand-in lookup table in this file")
+    parser.add_argument("--table", help="Lookup table name (default: table_name from config.json)")
+    args = parser.parse_args()
+    if args.table is None:
+        args.table = data_merge.ensure_configured()["table_name"]
+
+    generated = build_workbook(args.path, args.rows, args.sheets, args.header_offset,
+                               args.duplicate_ratio, args.match_rate, args.seed)
+    print(f"Wrote {args.path}: {args.sheets} sheets x {args.rows} rows, {generated['distinct_keys']} distinct keys")
+    if args.db:
+        seed_sqlite_table(args.db, args.table, generated["table"])
+        print(f"Seeded {len(generated['table'])} rows into `{args.table}` in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
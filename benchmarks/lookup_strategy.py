@@ -0,0 +1,85 @@
+"""
+Compare the row-constructor IN-list lookup with the temporary-table JOIN on a
+local MySQL server. A dedicated table is created and seeded, so point this at a
+scratch database, never at the production one.
+
+Usage:
+    python -m benchmarks.lookup_strategy --host 127.0.0.1 --user root --password secret \\
+        --database bench --rows 200000 --keys 1000 10000 50000
+"""
+import argparse
+import time
+
+import data_merge
+from data_merge import DataEnricher, TARGET_COLUMNS
+from benchmarks.common import REFERENCE_COLUMNS, make_key, make_table, quiet_logging
+
+
+def seed_table(enricher: DataEnricher, table_name: str, rows: int):
+    """Create and fill a stand-in PDF_Invoice_Details table with a composite key index."""
+    columns_sql = ", ".join(
+        [f"`{c}` VARCHAR(32) NOT NULL" for c in REFERENCE_COLUMNS]
+        + ["`Taxable_Amount` DECIMAL(12,2)", "`NonTaxable_Amount` DECIMAL(12,2)", "`Cgst_Total` DECIMAL(12,2)",
+           "`Sgst_Total` DECIMAL(12,2)", "`Igst_Total` DECIMAL(12,2)", "`Booking_Date` DATE",
+           "`GST_Name` VARCHAR(128)", "`GST_Number` VARCHAR(32)", "`Invoice_Number` VARCHAR(32)",
+           "`Invoice_Total_GST` DECIMAL(12,2)", "`Airline_Gst_Number` VARCHAR(32)", "`Airline_Gst_Name` VARCHAR(128)"]
+    )
+    ref_cols = ", ".join(f"`{c}`" for c in REFERENCE_COLUMNS)
+    cursor = enricher.connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS `{table_name}`")
+    cursor.execute(f"CREATE TABLE `{table_name}` (`id` INT AUTO_INCREMENT PRIMARY KEY, {columns_sql}, "
+                   f"INDEX `idx_reference` ({ref_cols}))")
+    all_columns = REFERENCE_COLUMNS + TARGET_COLUMNS
+    insert = (f"INSERT INTO `{table_name}` ({', '.join(f'`{c}`' for c in all_columns)}) "
+              f"VALUES ({', '.join(['%s'] * len(all_columns))})")
+    table = make_table(rows)
+    records = [tuple(row[c] for c in all_columns) for row in table.values()]
+    for start in range(0, len(records), 5000):
+        cursor.executemany(insert, records[start:start + 5000])
+    cursor.close()
+
+
+def time_strategy(enricher: DataEnricher, strategy: str, keys, plan, table_name: str):
+    data_merge.LOOKUP_STRATEGY = strategy
+    start = time.perf_counter()
+    rows = enricher._fetch_lookup_rows(keys, plan, table_name)
+    return time.perf_counter() - start, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--table", default="bench_invoice_details")
+    parser.add_argument("--rows", type=int, default=200000, help="Rows seeded into the stand-in table")
+    parser.add_argument("--keys", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    quiet_logging()
+    enricher = DataEnricher(host=args.host, database=args.database, user=args.user,
+                            password=args.password, port=args.port)
+    if not enricher.connect():
+        raise SystemExit("Could not connect to the benchmark database")
+    try:
+        seed_table(enricher, args.table, args.rows)
+        plan = {"reference_columns": REFERENCE_COLUMNS, "missing_columns": TARGET_COLUMNS}
+        print(f"{'keys':>8} {'IN list (s)':>12} {'temp table (s)':>15} {'rows':>8}")
+        for key_count in args.keys:
+            # Half the keys exist in the table, half do not
+            keys = [make_key(i if i % 2 == 0 else args.rows + i) for i in range(key_count)]
+            # A PNR longer than the VARCHAR(32) key column, which the temporary table cannot hold
+            keys.append(("PNR" + "9" * 40,) + keys[0][1:])
+            in_list_time, in_list_rows = time_strategy(enricher, "in_list", keys, plan, args.table)
+            temp_time, temp_rows = time_strategy(enricher, "temp_table", keys, plan, args.table)
+            assert in_list_rows == temp_rows, "strategies returned different row counts"
+            print(f"{key_count:>8} {in_list_time:>12.2f} {temp_time:>15.2f} {temp_rows:>8}")
+    finally:
+        enricher.connection.cursor().execute(f"DROP TABLE IF EXISTS `{args.table}`")
+        enricher.disconnect()
+
+
+if __name__ == "__main__":
+    main()
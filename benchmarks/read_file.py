@@ -0,0 +1,109 @@
+"""
+Benchmark DataEnricher.read_file_safely against the previous reader, which
+re-opened the workbook and re-parsed every sheet twice (preview + full read).
+
+Usage:
+    python -m benchmarks.read_file --sheets 40 --rows 2000 --repeat 3
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+from openpyxl import Workbook
+
+from data_merge import DataEnricher
+
+
+def build_workbook(path: str, sheets: int, rows: int, header_offset: int = 2):
+    """Write a supplier-style workbook: a few title rows, then a header row and data."""
+    rng = random.Random(42)
+    wb = Workbook()
+    wb.remove(wb.active)
+    headers = ["S.No", "Airline PNR", "Airline Code", "Sector", "Fare", "Remarks"]
+    for sheet_idx in range(sheets):
+        ws = wb.create_sheet(f"Day {sheet_idx + 1}")
+        for title_idx in range(header_offset):
+            ws.append([f"Supplier statement line {title_idx + 1}"])
+        ws.append(headers)
+        for row_idx in range(rows):
+            ws.append([
+                row_idx + 1,
+                f"PNR{rng.randint(0, 99999):05d}",
+                rng.choice(["6E", "AI", "UK", "SG"]),
+                rng.choice(["DEL-BOM", "BOM-BLR", "BLR-HYD", "HYD-DEL"]),
+                round(rng.uniform(1000, 20000), 2),
+                rng.choice(["", "refund", "reissue"]) or None,
+            ])
+    wb.save(path)
+
+
+def legacy_read(file_path: str):
+    """The reader as it was before the single-parse change (kept here for comparison)."""
+    excel_file = pd.ExcelFile(file_path)
+    sheets_dict = {}
+    for sheet_name in excel_file.sheet_names:
+        preview = pd.read_excel(file_path, sheet_name=sheet_name, nrows=10, header=None)
+        header_row = None
+        for i, row in preview.iterrows():
+            non_null = row.dropna()
+            if len(non_null) > 2 and all(isinstance(x, str) for x in non_null):
+                header_row = i
+                break
+        if header_row is not None:
+            df_sheet = pd.read_excel(file_path, sheet_name=sheet_name, header=header_row)
+        else:
+            df_sheet = pd.read_excel(file_path, sheet_name=sheet_name)
+        unnamed_cols = [col for col in df_sheet.columns if str(col).startswith('Unnamed:')]
+        if unnamed_cols:
+            df_sheet = df_sheet.drop(columns=unnamed_cols)
+        if len(df_sheet) > 0:
+            sheets_dict[sheet_name] = df_sheet
+    if len(sheets_dict) == 1:
+        return list(sheets_dict.values())[0]
+    return sheets_dict
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sheets", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    enricher = DataEnricher(host="", database="", user="", password="")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.xlsx")
+        build_workbook(path, args.sheets, args.rows)
+
+        expected = legacy_read(path)
+        actual = enricher.read_file_safely(path)
+        if isinstance(expected, dict):
+            assert list(expected) == list(actual), "sheet names differ"
+            for name in expected:
+                pd.testing.assert_frame_equal(expected[name], actual[name])
+        else:
+            pd.testing.assert_frame_equal(expected, actual)
+
+        legacy_time = best_of(lambda: legacy_read(path), args.repeat)
+        new_time = best_of(lambda: enricher.read_file_safely(path), args.repeat)
+
+    print(f"Workbook: {args.sheets} sheets x {args.rows} rows")
+    print(f"Legacy reader (open + 2 parses per sheet): {legacy_time:.2f}s")
+    print(f"Single-parse reader:                      {new_time:.2f}s")
+    print(f"Speedup: {legacy_time / new_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Startup benchmark: time `python -X importtime -c "import data_merge"` and a
+`python data_merge.py process` run with nothing to process, and fail if either
+goes over its budget or pulls in a module that should only load once there is
+work to do (pandas, openpyxl, paramiko, mysql.connector, smtplib, ...).
+
+Usage:
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --import-budget-ms 150 --no-files-budget-ms 800 --output startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules a bare import or an empty run must not load
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "openpyxl", "xlsxwriter", "paramiko", "mysql.connector",
+                 "smtplib", "schedule"]
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr: str):
+    """Cumulative microseconds per module from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def heavy_modules(modules) -> list:
+    return sorted({heavy for heavy in HEAVY_MODULES for name in modules
+                   if name == heavy or name.startswith(heavy + ".")})
+
+
+def run(command, cwd: str):
+    """Run a Python command with -X importtime; returns (wall seconds, modules imported, stdout)."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", *command], cwd=cwd, env=env,
+                               capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise SystemExit(f"{' '.join(command)} failed:\n{completed.stderr[-2000:]}")
+    return elapsed, parse_importtime(completed.stderr), completed.stdout
+
+
+def make_empty_run_dir(work_dir: str) -> str:
+    """A working directory whose config.json points at an empty input directory, with SFTP and email off."""
+    with open(os.path.join(REPO_DIR, "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+    config["input_directory"] = os.path.join(work_dir, "input")
+    config["output_directory"] = os.path.join(work_dir, "output")
+    config.setdefault("sftp", {})["enabled"] = False
+    config.setdefault("email", {})["enabled"] = False
+    os.makedirs(config["input_directory"])
+    with open(os.path.join(work_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return work_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=250,
+                        help="Fail if the best `import data_merge` takes longer")
+    parser.add_argument("--no-files-budget-ms", type=float, default=1000,
+                        help="Fail if the best no-files `process` run takes longer (interpreter startup included)")
+    parser.add_argument("--output", help="Where to save the JSON results")
+    args = parser.parse_args()
+
+    import_times, import_heavy = [], set()
+    for _ in range(args.repeat):
+        _, modules, _ = run(["-c", "import data_merge"], REPO_DIR)
+        import_times.append(modules["data_merge"] / 1000)
+        import_heavy.update(heavy_modules(modules))
+
+    work_dir = tempfile.mkdtemp(prefix="data_merge_startup_")
+    try:
+        make_empty_run_dir(work_dir)
+        script = os.path.join(REPO_DIR, "data_merge.py")
+        run_times, run_heavy = [], set()
+        for _ in range(args.repeat):
+            elapsed, modules, stdout = run([script, "process"], work_dir)
+            if "Files processed: 0" not in stdout:
+                raise SystemExit(f"Unexpected output from the no-files run:\n{stdout}")
+            run_times.append(elapsed * 1000)
+            run_heavy.update(heavy_modules(modules))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "python": sys.version.split()[0],
+        "import_ms": {"best": round(min(import_times), 1), "runs": [round(t, 1) for t in import_times]},
+        "no_files_run_ms": {"best": round(min(run_times), 1), "runs": [round(t, 1) for t in run_times]},
+        "heavy_modules_on_import": sorted(import_heavy),
+        "heavy_modules_on_no_files_run": sorted(run_heavy),
+    }
+    print(f"import data_merge:  best {results['import_ms']['best']:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    print(f"no-files run:       best {results['no_files_run_ms']['best']:.1f} ms "
+          f"(budget {args.no_files_budget_ms:.0f} ms)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    failures = []
+    if import_heavy:
+        failures.append(f"import data_merge loaded {', '.join(sorted(import_heavy))}")
+    if run_heavy:
+        failures.append(f"the no-files run loaded {', '.join(sorted(run_heavy))}")
+    if results["import_ms"]["best"] > args.import_budget_ms:
+        failures.append("import data_merge is over budget")
+    if results["no_files_run_ms"]["best"] > args.no_files_budget_ms:
+        failures.append("the no-files run is over budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+End-to-end benchmark: generate a synthetic workbook, seed a SQLite stand-in for
+the lookup table, then time each stage of the tool (read_file_safely,
+_enrich_single_dataframe, enrich_data, apply_header_formatting) and save the
+results as JSON. Pass a previous results file with --compare to see the change.
+
+Usage:
+    python -m benchmarks.suite --rows 20000 --sheets 3 --output results.json
+    python -m benchmarks.suite --rows 20000 --sheets 3 --output after.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import data_merge
+from data_merge import DataEnricher, SQLiteLookupBackend
+from benchmarks.common import quiet_logging, seed_sqlite_table
+from benchmarks.generate import build_workbook
+
+STAGES = ["read_file_safely", "_enrich_single_dataframe", "enrich_data", "apply_header_formatting"]
+
+
+def time_runs(func, repeat: int):
+    """Run func `repeat` times; returns (timings in seconds, last result)."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(data_merge.__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(work_dir: str, args) -> dict:
+    excel_path = os.path.join(work_dir, "bench.xlsx")
+    output_path = os.path.join(work_dir, "bench_enriched.xlsx")
+    db_path = os.path.join(work_dir, "lookup.sqlite")
+
+    generated = build_workbook(excel_path, args.rows, args.sheets, args.header_offset,
+                               args.duplicate_ratio, args.match_rate, args.seed)
+    table_name = data_merge.TABLE_NAME
+    seed_sqlite_table(db_path, table_name, generated["table"])
+
+    enricher = DataEnricher(host="", database="", user="", password="")
+    if enricher.lookup_cache is not None:
+        # Every run has to hit the table
+        enricher.lookup_cache.close()
+        enricher.lookup_cache = None
+    if not enricher.load_backend(SQLiteLookupBackend(db_path)):
+        raise SystemExit(f"Could not open the SQLite stand-in {db_path}")
+    try:
+        timings = {}
+        timings["read_file_safely"], data = time_runs(lambda: enricher.read_file_safely(excel_path), args.repeat)
+        sheets = data if isinstance(data, dict) else {"Sheet": data}
+
+        def enrich_sheets():
+            return {
+                name: enricher._enrich_single_dataframe(df, table_name, data_merge.POSSIBLE_REFERENCE_COMBINATIONS,
+                                                        data_merge.COLUMN_MAPPING)
+                for name, df in sheets.items()
+            }
+        timings["_enrich_single_dataframe"], enriched = time_runs(enrich_sheets, args.repeat)
+
+        queries_before = enricher.query_count
+        timings["enrich_data"], _ = time_runs(
+            lambda: enricher.enrich_data(excel_path, table_name, data_merge.POSSIBLE_REFERENCE_COMBINATIONS,
+                                         data_merge.COLUMN_MAPPING, output_path=output_path),
+            args.repeat
+        )
+        queries_per_run = (enricher.query_count - queries_before) // args.repeat
+        timings["apply_header_formatting"], _ = time_runs(
+            lambda: enricher.apply_header_formatting(excel_path, output_path), args.repeat
+        )
+        output_bytes = os.path.getsize(output_path)
+    finally:
+        enricher.disconnect()
+
+    matched_rows = sum(int(df["Invoice_Number"].notna().sum()) for df in enriched.values())
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "parameters": dict(generated["parameters"], repeat=args.repeat),
+        "settings": {
+            "batch_size": data_merge.BATCH_SIZE,
+            "adaptive_batching": data_merge.ADAPTIVE_BATCHING_ENABLED,
+            "prepared_statements": data_merge.PREPARED_STATEMENTS,
+            "single_pass_xlsx": data_merge.SINGLE_PASS_XLSX,
+            "dtype_policy": data_merge.DTYPE_POLICY_ENABLED,
+        },
+        "workload": {
+            "total_rows": args.rows * args.sheets,
+            "distinct_keys": generated["distinct_keys"],
+            "table_rows": len(generated["table"]),
+            "matched_rows": matched_rows,
+            "queries_per_enrich_data": queries_per_run,
+            "output_bytes": output_bytes,
+        },
+        "stages": {
+            stage: {"best_s": round(min(runs), 4), "median_s": round(statistics.median(runs), 4),
+                    "runs_s": [round(t, 4) for t in runs]}
+            for stage, runs in ((s, timings[s]) for s in STAGES)
+        },
+    }
+
+
+def print_report(results: dict, baseline: dict = None):
+    print(f"{results['workload']['total_rows']} rows in {results['parameters']['sheets']} sheet(s), "
+          f"{results['workload']['distinct_keys']} distinct keys, "
+          f"{results['workload']['matched_rows']} matched rows")
+    header = f"{'stage':<26} {'best (s)':>9} {'median (s)':>11}"
+    print(header + (f" {'baseline (s)':>13} {'change':>8}" if baseline else ""))
+    for stage in STAGES:
+        stats = results["stages"][stage]
+        line = f"{stage:<26} {stats['best_s']:>9.3f} {stats['median_s']:>11.3f}"
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous:
+            change = (stats["best_s"] - previous["best_s"]) / previous["best_s"] * 100 if previous["best_s"] else 0.0
+            line += f" {previous['best_s']:>13.3f} {change:>+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Data rows per sheet")
+    parser.add_argument("--sheets", type=int, default=3)
+    parser.add_argument("--header-offset", type=int, default=2)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3)
+    parser.add_argument("--match-rate", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to save the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    data_merge.configure()
+    quiet_logging()
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_suite(work_dir, args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != results["parameters"]:
+            print(f"Warning: {args.compare} was run with different parameters: {baseline.get('parameters')}")
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,70 @@
 #automation and new changes  added cost related columns only and changed to access from config file 
-import pandas as pd
-import mysql.connector
-from mysql.connector import Error
-from typing import List, Dict, Optional
+from __future__ import annotations
+
+from typing import List, Dict, Optional, TYPE_CHECKING
+import importlib.util
 import logging
 import os
+import sys
 import time
 from pathlib import Path
 import glob
-import schedule
+import fnmatch
+import stat
 import threading
-from datetime import datetime
+import queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, date
 import json
-import paramiko
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
-
-# Configure enhanced logging for automated execution
-log_file = f"data_merge_{datetime.now().strftime('%Y%m%d')}.log"
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+import hashlib
+import pickle
+import sqlite3
+import zipfile
+import colorsys
+import xml.etree.ElementTree as ET
+from copy import copy
+from decimal import Decimal
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+if TYPE_CHECKING:
+    import paramiko
+
+
+def _lazy_import(name: str):
+    """
+    Module that is only imported on first attribute access. pandas and mysql.connector
+    take most of a cold start, and a run with nothing to process never touches them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+pd = _lazy_import("pandas")
+mysql_connector = _lazy_import("mysql.connector")
+
 logger = logging.getLogger(__name__)
 
 # ====================================================================
 # CONFIGURATION LOADING
 # ====================================================================
 
+CONFIG = None  # Set by configure()
+CONFIG_PATH = None
+
+
 def load_config(config_path: str = "config.json") -> Dict:
     """Load configuration from JSON file."""
     try:
@@ -55,28 +82,141 @@ def load_config(config_path: str = "config.json") -> Dict:
         logger.error(f"Error loading configuration: {e}")
         raise
 
-# Load configuration
-CONFIG = load_config()
-
-# Extract configuration values
-INPUT_DIRECTORY = CONFIG["input_directory"]
-OUTPUT_DIRECTORY = CONFIG["output_directory"]
-SUPPORTED_EXTENSIONS = CONFIG["supported_extensions"]
-DB_CONFIG = CONFIG["database"]
-TABLE_NAME = CONFIG["table_name"]
-COLUMN_MAPPING = CONFIG["column_mapping"]
-POSSIBLE_REFERENCE_COMBINATIONS = CONFIG["possible_reference_combinations"]
-BATCH_SIZE = CONFIG["processing"]["batch_size"]
-MAX_RETRIES = CONFIG["processing"]["max_retries"]
-CONNECTION_TIMEOUT = CONFIG["processing"]["connection_timeout"]
-QUERY_TIMEOUT = CONFIG["processing"]["query_timeout"]
-DEBUG_MODE = CONFIG["debug"]["debug_mode"]
-DEBUG_ID = CONFIG["debug"]["debug_id"]
-SFTP_CONFIG = CONFIG.get("sftp", {})
-EMAIL_CONFIG = CONFIG.get("email", {})
-
-# Create output directory if it doesn't exist
-os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+
+def setup_logging():
+    """Log to a dated data_merge_YYYYMMDD.log in the working directory and to the console."""
+    log_file = f"data_merge_{datetime.now().strftime('%Y%m%d')}.log"
+    logging.basicConfig(
+        level=logging.INFO, 
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+
+
+def configure(config_path: str = "config.json") -> Dict:
+    """
+    Load the configuration file and set the module-level settings from it. Nothing
+    is read at import time: the command line calls this first, pool workers call it
+    in their initializer, and DataEnricher calls it if nobody has yet.
+    """
+    global CONFIG, CONFIG_PATH, INPUT_DIRECTORY, OUTPUT_DIRECTORY, SUPPORTED_EXTENSIONS, DB_CONFIG, TABLE_NAME
+    global COLUMN_MAPPING, POSSIBLE_REFERENCE_COMBINATIONS, BATCH_SIZE, MAX_RETRIES, CONNECTION_TIMEOUT
+    global QUERY_TIMEOUT, RUN_KEY_DEDUP, PARALLEL_FILES, FILE_WORKERS, PIPELINE_ENABLED, PIPELINE_QUEUE_SIZE
+    global PREFETCH_KEEP_BYTES
+    global LOOKUP_STRATEGY, TEMP_TABLE_THRESHOLD, PREPARED_STATEMENTS, SINGLE_PASS_XLSX, OUTPUT_CONFIG
+    global COLUMNAR_FORMAT, COLUMNAR_ONLY, COLUMNAR_LAYOUT, CONCURRENCY_CONFIG, POOLED_CONNECTIONS
+    global QUERY_WORKERS, SHEET_WORKERS, LOOKUP_CACHE_CONFIG, SNAPSHOT_CONFIG, SNAPSHOT_ENABLED
+    global LOOKUP_BACKEND_CONFIG, LOOKUP_BACKEND, MANIFEST_CONFIG, MANIFEST_ENABLED, QUERY_PROFILING_CONFIG
+    global QUERY_PROFILING_ENABLED, SLOW_QUERY_MS, METRICS_CONFIG, METRICS_ENABLED, DTYPE_POLICY_CONFIG
+    global DTYPE_POLICY_ENABLED, ARROW_STRINGS, CATEGORICAL_COLUMNS, DOWNCAST_NUMERICS
+    global ADAPTIVE_BATCHING_CONFIG, ADAPTIVE_BATCHING_ENABLED, MIN_BATCH_SIZE, MAX_BATCH_SIZE
+    global TARGET_QUERY_LATENCY_MS, DEBUG_MODE, DEBUG_ID, STREAMING_CONFIG, CSV_STREAMING_ENABLED
+    global CSV_CHUNK_SIZE, XLSX_STREAMING_ENABLED, SFTP_CONFIG, EMAIL_CONFIG, DAEMON_CONFIG
+    CONFIG = load_config(config_path)
+    CONFIG_PATH = config_path
+    
+    INPUT_DIRECTORY = CONFIG["input_directory"]
+    OUTPUT_DIRECTORY = CONFIG["output_directory"]
+    SUPPORTED_EXTENSIONS = CONFIG["supported_extensions"]
+    DB_CONFIG = CONFIG["database"]
+    TABLE_NAME = CONFIG["table_name"]
+    COLUMN_MAPPING = CONFIG["column_mapping"]
+    POSSIBLE_REFERENCE_COMBINATIONS = CONFIG["possible_reference_combinations"]
+    BATCH_SIZE = CONFIG["processing"]["batch_size"]
+    MAX_RETRIES = CONFIG["processing"]["max_retries"]
+    CONNECTION_TIMEOUT = CONFIG["processing"]["connection_timeout"]
+    QUERY_TIMEOUT = CONFIG["processing"]["query_timeout"]
+    RUN_KEY_DEDUP = CONFIG["processing"].get("run_key_dedup", False)
+    # Parsed files kept from the key prefetch for enrichment, up to this much memory; the rest are re-read
+    PREFETCH_KEEP_BYTES = CONFIG["processing"].get("prefetch_keep_mb", 256) * 1024 * 1024
+    PARALLEL_FILES = CONFIG["processing"].get("parallel_files", False)
+    FILE_WORKERS = CONFIG["processing"].get("file_workers") or os.cpu_count() or 1
+    PIPELINE_ENABLED = CONFIG["processing"].get("pipeline", False)
+    PIPELINE_QUEUE_SIZE = max(1, CONFIG["processing"].get("pipeline_queue_size", 2))
+    LOOKUP_STRATEGY = CONFIG["processing"].get("lookup_strategy", "in_list")  # in_list, temp_table or auto
+    TEMP_TABLE_THRESHOLD = CONFIG["processing"].get("temp_table_threshold", 5000)
+    PREPARED_STATEMENTS = CONFIG["processing"].get("prepared_statements", False)
+    SINGLE_PASS_XLSX = CONFIG["processing"].get("single_pass_xlsx", False)
+    OUTPUT_CONFIG = CONFIG.get("output", {})
+    COLUMNAR_FORMAT = OUTPUT_CONFIG.get("columnar_format")  # None, "parquet" or "arrow"
+    COLUMNAR_ONLY = OUTPUT_CONFIG.get("columnar_only", False)  # write it instead of XLSX/CSV
+    COLUMNAR_LAYOUT = OUTPUT_CONFIG.get("columnar_layout", "sheet_column")  # sheet_column or per_sheet
+    CONCURRENCY_CONFIG = CONFIG.get("concurrency", {})
+    POOLED_CONNECTIONS = CONCURRENCY_CONFIG.get("pooled", False)
+    QUERY_WORKERS = max(1, CONCURRENCY_CONFIG.get("query_workers", 4))
+    SHEET_WORKERS = max(1, CONCURRENCY_CONFIG.get("sheet_workers", 1))
+    LOOKUP_CACHE_CONFIG = CONFIG.get("lookup_cache", {})
+    SNAPSHOT_CONFIG = CONFIG.get("snapshot", {})
+    SNAPSHOT_ENABLED = SNAPSHOT_CONFIG.get("enabled", False)
+    LOOKUP_BACKEND_CONFIG = CONFIG.get("lookup_backend", {})
+    LOOKUP_BACKEND = LOOKUP_BACKEND_CONFIG.get("type", "mysql")  # mysql, sqlite, memory or parquet
+    MANIFEST_CONFIG = CONFIG.get("manifest", {})
+    MANIFEST_ENABLED = MANIFEST_CONFIG.get("enabled", False)
+    QUERY_PROFILING_CONFIG = CONFIG.get("query_profiling", {})
+    QUERY_PROFILING_ENABLED = QUERY_PROFILING_CONFIG.get("enabled", False)
+    SLOW_QUERY_MS = QUERY_PROFILING_CONFIG.get("slow_query_ms", 1000)
+    METRICS_CONFIG = CONFIG.get("metrics", {})
+    METRICS_ENABLED = METRICS_CONFIG.get("enabled", False)
+    DTYPE_POLICY_CONFIG = CONFIG.get("dtype_policy", {})
+    DTYPE_POLICY_ENABLED = DTYPE_POLICY_CONFIG.get("enabled", False)
+    ARROW_STRINGS = DTYPE_POLICY_CONFIG.get("arrow_strings", True)  # needs pyarrow, else strings stay objects
+    CATEGORICAL_COLUMNS = DTYPE_POLICY_CONFIG.get("categorical_columns", [])  # database or input column names
+    DOWNCAST_NUMERICS = DTYPE_POLICY_CONFIG.get("downcast_numerics", True)
+    ADAPTIVE_BATCHING_CONFIG = CONFIG.get("adaptive_batching", {})
+    ADAPTIVE_BATCHING_ENABLED = ADAPTIVE_BATCHING_CONFIG.get("enabled", False)
+    MIN_BATCH_SIZE = ADAPTIVE_BATCHING_CONFIG.get("min_batch_size", BATCH_SIZE)
+    MAX_BATCH_SIZE = ADAPTIVE_BATCHING_CONFIG.get("max_batch_size", BATCH_SIZE)
+    TARGET_QUERY_LATENCY_MS = ADAPTIVE_BATCHING_CONFIG.get("target_latency_ms", 500)
+    DEBUG_MODE = CONFIG["debug"]["debug_mode"]
+    DEBUG_ID = CONFIG["debug"]["debug_id"]
+    STREAMING_CONFIG = CONFIG.get("streaming", {})
+    CSV_STREAMING_ENABLED = STREAMING_CONFIG.get("csv_enabled", False)
+    CSV_CHUNK_SIZE = STREAMING_CONFIG.get("csv_chunk_size", 50000)
+    XLSX_STREAMING_ENABLED = STREAMING_CONFIG.get("xlsx_enabled", False)
+    SFTP_CONFIG = CONFIG.get("sftp", {})
+    EMAIL_CONFIG = CONFIG.get("email", {})
+    DAEMON_CONFIG = CONFIG.get("daemon", {})
+    return CONFIG
+
+
+def ensure_configured() -> Dict:
+    """Load config.json unless configure() has already run."""
+    return CONFIG if CONFIG is not None else configure()
+
+
+# Fixed settings (not read from config.json)
+TEMP_TABLE_INSERT_CHUNK = 5000  # Keys per executemany round-trip when filling the temporary table
+COLUMNAR_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+SHEET_COLUMN = "sheet_name"  # Column naming the source sheet in combined columnar output
+PREPARED_STATEMENT_CACHE_SIZE = 32  # Prepared lookup statements kept per connection
+MAX_PREPARED_PARAMS = 65535  # MySQL limit on placeholders in one prepared statement
+DEFAULT_MAX_ALLOWED_PACKET = 4 * 1024 * 1024  # MySQL 5.7 default, used until the server reports its own
+QUERY_OVERHEAD_BYTES = 1024  # SELECT list, table name and WHERE clause around the key list
+HEADER_SCAN_ROWS = 10  # Rows inspected when auto-detecting the header row
+
+# Columns fetched from the database when they are missing from the input
+TARGET_COLUMNS = [
+    'Taxable_Amount', 'NonTaxable_Amount', 'Cgst_Total', 'Sgst_Total', 'Igst_Total',
+    'Booking_Date', 'GST_Name', 'GST_Number', 'Invoice_Number', 'Invoice_Total_GST',
+    'Airline_Gst_Number', 'Airline_Gst_Name'
+]
+
+# Column rename mapping: database column name -> display name
+COLUMN_RENAME_MAP = {
+    'Booking_Date': 'Booking Date',
+    'GST_Name': 'GST Name',
+    'GST_Number': 'GST Number',
+    'Invoice_Total_GST': 'TOTAL GST',
+    'Cgst_Total': 'CGST',
+    'Sgst_Total': 'SGST',
+    'Igst_Total': 'IGST',
+    'Airline_Gst_Number': 'Airline GST Number',
+    'Airline_Gst_Name': 'Airline GST Name'
+}
+SFTP_CHUNK_SIZE = 32768  # Bytes per read when copying a remote file
 
 # ====================================================================
 
@@ -104,8 +244,11 @@ class FileProcessor:
             logger.error(f"Error discovering files: {e}")
             return []
     
-    def get_output_path(self, input_file: str) -> str:
-        """Generate output path for processed file with unique filename."""
+    def get_output_path(self, input_file: str, extension: Optional[str] = None) -> str:
+        """
+        Generate output path for processed file with unique filename. `extension`
+        (e.g. '.parquet') overrides the default of .csv for CSV input, else .xlsx.
+        """
         filename = os.path.basename(input_file)
         name, ext = os.path.splitext(filename)
         
@@ -114,7 +257,9 @@ class FileProcessor:
         timestamp = now.strftime("%Y%m%d%H%M%S%f")  # Format: YYYYMMDDHHMMSSFFFFFF (includes microseconds)
         
         # Determine output extension
-        if ext.lower() == '.csv':
+        if extension:
+            output_ext = extension
+        elif ext.lower() == '.csv':
             output_ext = '.csv'
         else:
             output_ext = '.xlsx'
@@ -146,14 +291,889 @@ class FileProcessor:
             return False
 
 
+class ProcessingManifest:
+    """
+    Persistent record of processed inputs: size, mtime and sha256 of each input file
+    plus the output it produced. A file whose size and mtime match its entry is
+    unchanged without reading it; a touched file is re-hashed (streaming) and only
+    reprocessed when its content differs.
+    """
+    
+    HASH_CHUNK = 1024 * 1024  # Bytes per read while hashing
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable processing manifest {path}: {e}")
+    
+    @classmethod
+    def file_hash(cls, file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.HASH_CHUNK), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def check(self, file_path: str):
+        """
+        Returns:
+            (unchanged, fingerprint) - fingerprint is what record() stores for the file
+        """
+        info = os.stat(file_path)
+        entry = self.entries.get(os.path.abspath(file_path))
+        fingerprint = {"size": info.st_size, "mtime_ns": info.st_mtime_ns}
+        output_present = bool(entry) and os.path.exists(entry.get("output", ""))
+        
+        if output_present and entry["size"] == info.st_size and entry["mtime_ns"] == info.st_mtime_ns:
+            fingerprint["sha256"] = entry["sha256"]
+            return True, fingerprint
+        
+        fingerprint["sha256"] = self.file_hash(file_path)
+        if output_present and entry["sha256"] == fingerprint["sha256"]:
+            entry["mtime_ns"] = info.st_mtime_ns  # touched but identical; take the fast path next time
+            return True, fingerprint
+        return False, fingerprint
+    
+    def output_for(self, file_path: str) -> Optional[str]:
+        entry = self.entries.get(os.path.abspath(file_path))
+        return entry.get("output") if entry else None
+    
+    def record(self, file_path: str, fingerprint: Dict, output_path: str):
+        self.entries[os.path.abspath(file_path)] = dict(
+            fingerprint, output=output_path, processed_at=datetime.now().isoformat(timespec='seconds')
+        )
+    
+    def save(self):
+        try:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save processing manifest {self.path}: {e}")
+
+
+class RunMetrics:
+    """
+    Wall time, CPU time and counts per stage for one processing run, broken down per
+    file and sheet. Stages record into the file/sheet scope of the calling thread;
+    write_reports() saves a JSON run report and a Prometheus textfile-collector file.
+    """
+    
+    STAGES = ("sftp_fetch", "discovery", "read", "key_build", "db_query", "assemble",
+              "write", "header_format", "email")
+    
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.records = []  # (stage, file, sheet, wall seconds, cpu seconds, counts)
+        self.queries = None  # database queries sent, set when the run finishes
+        self.query_profile = None  # QueryProfiler summary, set when the run finishes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def current_scope(self):
+        return getattr(self._local, "scope", (None, None))
+    
+    @contextmanager
+    def scope(self, file: Optional[str] = None, sheet: Optional[str] = None):
+        """Attribute stages recorded on this thread to `file` (kept from the outer scope if None) and `sheet`."""
+        previous = self.current_scope()
+        self._local.scope = (file if file is not None else previous[0], sheet)
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+    
+    @contextmanager
+    def stage(self, name: str, **counts):
+        """Time the block as stage `name`; yields the counts dict for the block to fill in."""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield counts
+        finally:
+            file, sheet = self.current_scope()
+            self.add(name, file, sheet, time.perf_counter() - wall_start, time.thread_time() - cpu_start, counts)
+    
+    def add(self, stage: str, file: Optional[str], sheet: Optional[str], wall: float, cpu: float, counts: Dict):
+        with self._lock:
+            self.records.append((stage, file, sheet, wall, cpu, dict(counts)))
+    
+    def merge(self, records: List[tuple]):
+        """Add records collected in a worker process."""
+        with self._lock:
+            self.records.extend(records)
+    
+    @staticmethod
+    def _totals(records) -> Dict[str, Dict]:
+        stages = {}
+        for stage, _, _, wall, cpu, counts in records:
+            totals = stages.setdefault(stage, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+            totals["wall_seconds"] += wall
+            totals["cpu_seconds"] += cpu
+            totals["calls"] += 1
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+        ordered = {stage: stages[stage] for stage in RunMetrics.STAGES if stage in stages}
+        for totals in ordered.values():
+            totals["wall_seconds"] = round(totals["wall_seconds"], 4)
+            totals["cpu_seconds"] = round(totals["cpu_seconds"], 4)
+        return ordered
+    
+    @staticmethod
+    def _rates(entry: Dict, rows: int, matched: Optional[int], seconds: float):
+        entry["rows"] = rows
+        entry["rows_per_second"] = round(rows / seconds, 1) if seconds > 0 else None
+        entry["match_rate"] = round(matched / rows, 4) if matched is not None and rows else None
+    
+    def report(self, result: Dict) -> Dict:
+        """The run report: run totals, stage totals, and per-file and per-sheet stage breakdowns."""
+        wall = time.perf_counter() - self._wall_start
+        with self._lock:
+            records = list(self.records)
+        entries = {res["file"]: res for res in result.get("results", [])}
+        
+        files = {}
+        for file in dict.fromkeys(r[1] for r in records if r[1] is not None):
+            file_records = [r for r in records if r[1] == file]
+            stages = self._totals(file_records)
+            busy = sum(totals["wall_seconds"] for totals in stages.values())
+            assembled = stages.get("assemble", {})
+            entry = entries.get(file, {})
+            file_report = {"status": entry.get("status"), "output": entry.get("output"),
+                           "busy_seconds": round(busy, 4)}
+            self._rates(file_report, entry.get("rows", assembled.get("rows", 0)), assembled.get("matched"), busy)
+            file_report["stages"] = stages
+            sheets = {}
+            for sheet in dict.fromkeys(r[2] for r in file_records if r[2] is not None):
+                sheet_stages = self._totals([r for r in file_records if r[2] == sheet])
+                sheet_assembled = sheet_stages.get("assemble", {})
+                sheet_busy = sum(totals["wall_seconds"] for totals in sheet_stages.values())
+                sheets[sheet] = {"busy_seconds": round(sheet_busy, 4)}
+                self._rates(sheets[sheet], sheet_assembled.get("rows", 0), sheet_assembled.get("matched"), sheet_busy)
+                sheets[sheet]["stages"] = sheet_stages
+            if sheets:
+                file_report["sheets"] = sheets
+            files[file] = file_report
+        
+        stages = self._totals(records)
+        run = {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(time.process_time() - self._cpu_start, 4),
+            "status": result.get("status"),
+            "processed": result.get("processed", 0),
+            "errors": result.get("errors", 0),
+            "skipped": result.get("skipped", 0),
+            "queries": self.queries,
+        }
+        if self.query_profile is not None:
+            run["query_profile"] = self.query_profile
+        self._rates(run, sum(f["rows"] or 0 for f in files.values()), stages.get("assemble", {}).get("matched"), wall)
+        return {"run": run, "stages": stages, "files": files}
+    
+    @staticmethod
+    def _label(value: str) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    
+    def prometheus_text(self, report: Dict) -> str:
+        """Render the report in the Prometheus text exposition format."""
+        lines = []
+        
+        def metric(name: str, help_text: str, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f"# HELP data_merge_{name} {help_text}")
+            lines.append(f"# TYPE data_merge_{name} gauge")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{self._label(v)}"' for k, v in labels.items())
+                lines.append(f"data_merge_{name}{{{label_str}}} {value}" if label_str else f"data_merge_{name} {value}")
+        
+        run = report["run"]
+        statuses = {}
+        for file_report in report["files"].values():
+            statuses[file_report["status"]] = statuses.get(file_report["status"], 0) + 1
+        finished = datetime.fromisoformat(run["finished_at"]).timestamp()
+        metric("last_run_timestamp_seconds", "Unix time the last run finished.", [({}, finished)])
+        metric("run_duration_seconds", "Wall time of the last run.", [({}, run["wall_seconds"])])
+        metric("run_cpu_seconds", "CPU time of the last run.", [({}, run["cpu_seconds"])])
+        metric("run_rows", "Rows enriched in the last run.", [({}, run["rows"])])
+        metric("run_rows_per_second", "Rows enriched per second of wall time in the last run.",
+               [({}, run["rows_per_second"])])
+        metric("run_match_rate", "Share of enriched rows that matched a database row in the last run.",
+               [({}, run["match_rate"])])
+        metric("run_files", "Files in the last run by status.",
+               [({"status": "processed"}, run["processed"]), ({"status": "error"}, run["errors"]),
+                ({"status": "skipped"}, run["skipped"])])
+        metric("stage_duration_seconds", "Wall time spent in each stage in the last run.",
+               [({"stage": stage}, totals["wall_seconds"]) for stage, totals in report["stages"].items()])
+        metric("stage_cpu_seconds", "CPU time spent in each stage in the last run.",
+               [({"stage": stage}, totals["cpu_seconds"]) for stage, totals in report["stages"].items()])
+        metric("stage_calls", "Times each stage ran in the last run.",
+               [({"stage": stage}, totals["calls"]) for stage, totals in report["stages"].items()])
+        file_labels = [({"file": os.path.basename(file)}, file_report) for file, file_report in report["files"].items()]
+        metric("file_duration_seconds", "Busy time spent on each file in the last run.",
+               [(labels, f["busy_seconds"]) for labels, f in file_labels])
+        metric("file_rows", "Rows enriched per file in the last run.", [(labels, f["rows"]) for labels, f in file_labels])
+        metric("file_rows_per_second", "Rows enriched per second of busy time, per file.",
+               [(labels, f["rows_per_second"]) for labels, f in file_labels])
+        metric("file_match_rate", "Share of rows that matched a database row, per file.",
+               [(labels, f["match_rate"]) for labels, f in file_labels])
+        profile = run.get("query_profile")
+        if profile:
+            latency = profile["latency_ms"] or {}
+            metric("query_latency_seconds", "Lookup query latency percentiles in the last run.",
+                   [({"quantile": q}, latency[key] / 1000 if key in latency else None)
+                    for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))])
+            metric("query_events", "Lookup queries, failures, retries, reconnects and slow queries in the last run.",
+                   [({"event": event}, profile[event])
+                    for event in ("queries", "failed", "retries", "reconnects", "slow_queries")])
+        return "\n".join(lines) + "\n"
+    
+    def write_reports(self, result: Dict, report_dir: str, prometheus_file: Optional[str]):
+        """Write run_report_<timestamp>.json and the Prometheus textfile into report_dir."""
+        report = self.report(result)
+        try:
+            os.makedirs(report_dir, exist_ok=True)
+            report_path = os.path.join(report_dir, f"run_report_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+            with open(report_path, 'w') as f:
+                json.dump(report, f, indent=2, default=str)
+            logger.info(f"Run report written to {report_path}")
+            if prometheus_file:
+                # The textfile collector may read at any time, so replace the file atomically
+                prom_path = os.path.join(report_dir, prometheus_file)
+                with open(f"{prom_path}.tmp", 'w') as f:
+                    f.write(self.prometheus_text(report))
+                os.replace(f"{prom_path}.tmp", prom_path)
+        except OSError as e:
+            logger.error(f"Could not write run report to {report_dir}: {e}")
+        return report
+
+
+def stage_timer(metrics: Optional[RunMetrics], stage: str, **counts):
+    """metrics.stage(stage), or a no-op yielding the counts dict when metrics are off."""
+    return metrics.stage(stage, **counts) if metrics is not None else nullcontext(counts)
+
+
+def metrics_scope(metrics: Optional[RunMetrics], file: Optional[str] = None, sheet: Optional[str] = None):
+    return metrics.scope(file, sheet) if metrics is not None else nullcontext()
+
+
+class QueryProfiler:
+    """
+    Latency, parameter count, rows returned, retries and reconnects of every lookup
+    query. Queries slower than slow_query_ms are appended to a JSON-lines slow-query
+    file together with their EXPLAIN output (at most max_explains per run).
+    """
+    
+    def __init__(self, slow_query_ms: float = 1000, slow_query_log: Optional[str] = None, max_explains: int = 20):
+        self.slow_query_seconds = slow_query_ms / 1000.0
+        self.slow_query_log = slow_query_log
+        self.max_explains = max_explains
+        self.samples = []  # (seconds, params, rows, retries, reconnects, succeeded)
+        self.slow_queries = 0
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float, params: int, rows: int, retries: int, reconnects: int,
+               succeeded: bool = True) -> bool:
+        """Record one query; returns True if it should be logged as slow (with EXPLAIN)."""
+        with self._lock:
+            self.samples.append((seconds, params, rows, retries, reconnects, succeeded))
+            if not succeeded or seconds < self.slow_query_seconds:
+                return False
+            self.slow_queries += 1
+            return self.slow_query_log is not None and self.slow_queries <= self.max_explains
+    
+    def merge(self, samples: List[tuple]):
+        """Add samples recorded in a worker process."""
+        with self._lock:
+            self.samples.extend(samples)
+            self.slow_queries += sum(1 for sample in samples if sample[5] and sample[0] >= self.slow_query_seconds)
+    
+    def log_slow_query(self, query: str, params: List, seconds: float, rows: int, explain):
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "latency_ms": round(seconds * 1000, 1),
+            "params": len(params or []),
+            "rows": rows,
+            # IN lists run to thousands of placeholders; the head shows the statement shape
+            "query": query if len(query) <= 2000 else query[:2000] + f"... ({len(query)} chars)",
+            "explain": explain,
+        }
+        logger.warning(f"Slow query: {entry['latency_ms']} ms, {entry['params']} params, {rows} rows "
+                       f"(details in {self.slow_query_log})")
+        try:
+            with self._lock, open(self.slow_query_log, 'a') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write slow query log {self.slow_query_log}: {e}")
+    
+    @staticmethod
+    def _percentile(ordered: List[float], percent: float) -> float:
+        """Nearest-rank percentile of an ascending list."""
+        rank = max(1, -(-len(ordered) * percent // 100))
+        return ordered[int(rank) - 1]
+    
+    def summary(self) -> Dict:
+        with self._lock:
+            samples = list(self.samples)
+            slow_queries = self.slow_queries
+        latencies = sorted(sample[0] * 1000 for sample in samples if sample[5])
+        summary = {
+            "queries": len(samples),
+            "failed": sum(1 for sample in samples if not sample[5]),
+            "retries": sum(sample[3] for sample in samples),
+            "reconnects": sum(sample[4] for sample in samples),
+            "params": sum(sample[1] for sample in samples),
+            "rows": sum(sample[2] for sample in samples),
+            "slow_queries": slow_queries,
+            "latency_ms": None,
+        }
+        if latencies:
+            summary["latency_ms"] = {
+                "p50": round(self._percentile(latencies, 50), 1),
+                "p95": round(self._percentile(latencies, 95), 1),
+                "p99": round(self._percentile(latencies, 99), 1),
+                "max": round(latencies[-1], 1),
+                "mean": round(sum(latencies) / len(latencies), 1),
+            }
+        return summary
+    
+    def log_summary(self):
+        summary = self.summary()
+        if not summary["queries"]:
+            return
+        latency = summary["latency_ms"] or {}
+        logger.info(f"Query latency over {summary['queries']} queries: p50 {latency.get('p50')} ms, "
+                    f"p95 {latency.get('p95')} ms, p99 {latency.get('p99')} ms, max {latency.get('max')} ms; "
+                    f"{summary['failed']} failed, {summary['retries']} retries, {summary['reconnects']} reconnects, "
+                    f"{summary['slow_queries']} slow (>= {self.slow_query_seconds * 1000:.0f} ms)")
+
+
+class LookupCache:
+    """
+    Persistent SQLite cache of enrichment rows keyed by reference-key tuple.
+    Entries expire after ttl_hours and are purged when the cache is opened (and by
+    purge_expired() at the start of each daemon run); least recently used entries
+    are evicted once the cache holds more than max_entries rows or max_bytes of row
+    data. Entry count and bytes are tracked as rows are written, not re-aggregated.
+    A read_only cache (used by worker processes) only reads: it neither stores rows
+    nor refreshes recency, so many processes can share the file with one writer.
+    """
+    
+    QUERY_CHUNK = 500  # Keys per SELECT, well under SQLite's bound-variable limit
+    BUSY_TIMEOUT = 30  # Seconds a statement waits for another process's write lock
+    
+    def __init__(self, path: str, ttl_hours: float = 168, max_entries: int = 1000000,
+                 max_bytes: int = 512 * 1024 * 1024, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if read_only:
+            self.connection = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True,
+                                              timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+            logger.info(f"Lookup cache opened read-only: {path}")
+            return
+        self.connection = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS lookup_cache ("
+            "cache_key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_lookup_cache_access ON lookup_cache (last_access)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_lookup_cache_created ON lookup_cache (created_at)")
+        self.connection.commit()
+        self.entries, self.total_bytes = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lookup_cache"
+        ).fetchone()
+        self.purge_expired()
+        logger.info(f"Lookup cache opened: {path} ({self.entries} entries, {self.total_bytes} bytes)")
+    
+    def purge_expired(self):
+        """Delete entries older than the TTL (an index range scan on created_at)."""
+        if self.read_only:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        with self.lock:
+            expired, expired_bytes = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lookup_cache WHERE created_at < ?", (cutoff,)
+            ).fetchone()
+            if not expired:
+                return
+            self.connection.execute("DELETE FROM lookup_cache WHERE created_at < ?", (cutoff,))
+            self.connection.commit()
+            self.entries -= expired
+            self.total_bytes -= expired_bytes
+        logger.info(f"Lookup cache purged {expired} expired entries ({expired_bytes} bytes)")
+    
+    @staticmethod
+    def _cache_key(reference_columns: List[str], key: tuple) -> str:
+        return repr((tuple(reference_columns), key))
+    
+    def get_many(self, reference_columns: List[str], keys: List[tuple]) -> Dict[tuple, Dict]:
+        """Return cached rows for the keys that are present and not expired."""
+        found = {}
+        now = time.time()
+        cache_keys = {self._cache_key(reference_columns, key): key for key in keys}
+        names = list(cache_keys)
+        with self.lock:
+            for i in range(0, len(names), self.QUERY_CHUNK):
+                chunk = names[i:i + self.QUERY_CHUNK]
+                placeholders = ', '.join(['?'] * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT cache_key, value, created_at FROM lookup_cache WHERE cache_key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for cache_key, value, created_at in rows:
+                    if now - created_at <= self.ttl_seconds:
+                        found[cache_keys[cache_key]] = pickle.loads(value)
+            
+            # Refresh recency of hits; expired rows are skipped here and purged by purge_expired()
+            hit_names = [] if self.read_only else [self._cache_key(reference_columns, key) for key in found]
+            for i in range(0, len(hit_names), self.QUERY_CHUNK):
+                chunk = hit_names[i:i + self.QUERY_CHUNK]
+                placeholders = ', '.join(['?'] * len(chunk))
+                self.connection.execute(
+                    f"UPDATE lookup_cache SET last_access = ? WHERE cache_key IN ({placeholders})", [now] + chunk
+                )
+            self.connection.commit()
+        
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+    
+    def put_many(self, reference_columns: List[str], rows: Dict[tuple, Dict]):
+        """Store rows for their keys, then evict least recently used entries over the limits."""
+        if self.read_only:
+            return
+        now = time.time()
+        records = []
+        for key, row in rows.items():
+            value = pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL)
+            records.append((self._cache_key(reference_columns, key), value, len(value), now, now))
+        with self.lock:
+            # Rows being replaced no longer count towards the totals
+            for i in range(0, len(records), self.QUERY_CHUNK):
+                chunk = [record[0] for record in records[i:i + self.QUERY_CHUNK]]
+                placeholders = ', '.join(['?'] * len(chunk))
+                replaced, replaced_bytes = self.connection.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lookup_cache WHERE cache_key IN ({placeholders})",
+                    chunk
+                ).fetchone()
+                self.entries -= replaced
+                self.total_bytes -= replaced_bytes
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lookup_cache (cache_key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)", records
+            )
+            self.entries += len(records)
+            self.total_bytes += sum(record[2] for record in records)
+            self._evict()
+            self.connection.commit()
+    
+    def _evict(self):
+        excess_entries = max(0, self.entries - self.max_entries)
+        excess_bytes = max(0, self.total_bytes - self.max_bytes)
+        if not excess_entries and not excess_bytes:
+            return
+        
+        evict = []
+        freed = 0
+        for cache_key, size in self.connection.execute(
+                "SELECT cache_key, size FROM lookup_cache ORDER BY last_access"):
+            if len(evict) >= excess_entries and freed >= excess_bytes:
+                break
+            evict.append((cache_key,))
+            freed += size
+        self.connection.executemany("DELETE FROM lookup_cache WHERE cache_key = ?", evict)
+        self.entries -= len(evict)
+        self.total_bytes -= freed
+        logger.info(f"Lookup cache evicted {len(evict)} entries ({freed} bytes)")
+    
+    def log_stats(self):
+        """Log the hit/miss totals since the last call (or since the cache was opened) and reset them."""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        logger.info(f"Lookup cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)")
+        self.hits = 0
+        self.misses = 0
+    
+    def close(self):
+        self.log_stats()
+        with self.lock:
+            self.connection.close()
+
+
+class LookupBackend:
+    """
+    Source of lookup rows. DataEnricher keeps the key building, deduplication and
+    caching and asks the backend only for the table's columns and the rows matching
+    a list of distinct reference keys. MySQLLookupBackend is the default; the others
+    are local sources loaded with DataEnricher.load_backend().
+    """
+    
+    name = "lookup backend"
+    batched = False  # True: keys are sent in _next_key_batch batches, as for MySQL
+    temp_tables = False  # True: large lookups may use the temporary-table JOIN (lookup_strategy)
+    concurrent = True  # True: concurrent sheet threads can share it
+    
+    def load(self) -> bool:
+        """Open the backend; returns False (after logging) if it cannot be used."""
+        return True
+    
+    def close(self):
+        pass
+    
+    def get_columns(self, table_name: str) -> List[str]:
+        raise NotImplementedError
+    
+    def lookup(self, unique_keys: List[tuple], reference_columns: List[str],
+               columns: List[str], table_name: str) -> List[Dict]:
+        """Return rows (reference + requested columns) for the given distinct keys."""
+        raise NotImplementedError
+
+
+class FrameLookupBackend(LookupBackend):
+    """
+    Lookup rows held in memory: a DataFrame, a list of row dicts, or a dict of
+    reference key -> row. With a path, the rows are read from a CSV, JSON
+    (records) or Excel file on load().
+    """
+    
+    name = "in-memory"
+    
+    def __init__(self, rows=None, path: Optional[str] = None):
+        self.path = path
+        self.frame = None
+        if isinstance(rows, pd.DataFrame):
+            self.frame = rows
+        elif isinstance(rows, dict):
+            self.frame = pd.DataFrame(list(rows.values()))
+        elif rows is not None:
+            self.frame = pd.DataFrame(rows)
+    
+    def load(self) -> bool:
+        if self.frame is not None:
+            return True
+        try:
+            extension = os.path.splitext(self.path or "")[1].lower()
+            # Reference keys stay text, so numeric-looking PNRs keep their leading zeros
+            key_dtypes = {col: object for combination in POSSIBLE_REFERENCE_COMBINATIONS for col in combination}
+            if extension == '.csv':
+                self.frame = pd.read_csv(self.path, dtype=key_dtypes)
+            elif extension == '.json':
+                self.frame = pd.read_json(self.path, orient='records', dtype=False)
+            elif extension in ('.xlsx', '.xls'):
+                self.frame = pd.read_excel(self.path, dtype=key_dtypes)
+            else:
+                logger.error(f"Unsupported in-memory lookup source: {self.path!r} (use .csv, .json or .xlsx)")
+                return False
+            logger.info(f"Loaded {len(self.frame)} lookup rows from {self.path}")
+            return True
+        except Exception as e:
+            logger.error(f"Could not load lookup rows from {self.path}: {e}")
+            return False
+    
+    def close(self):
+        if self.path:
+            self.frame = None  # re-read from the file on the next load()
+    
+    def get_columns(self, table_name: str) -> List[str]:
+        return list(self.frame.columns) if self.frame is not None else []
+    
+    def lookup(self, unique_keys: List[tuple], reference_columns: List[str],
+               columns: List[str], table_name: str) -> List[Dict]:
+        keys = pd.DataFrame(unique_keys, columns=reference_columns).astype(object)
+        available = [c for c in columns if c in self.frame.columns]
+        table = self.frame[reference_columns + available].astype({c: object for c in reference_columns})
+        matched = keys.merge(table, on=reference_columns, how='inner', sort=False)
+        return matched.to_dict('records')
+
+
+class ParquetLookupBackend(FrameLookupBackend):
+    """Lookup rows from a Parquet file, memory-mapped and joined in-process."""
+    
+    name = "Parquet"
+    
+    def __init__(self, path: str):
+        super().__init__(path=path)
+    
+    @staticmethod
+    def _require_pyarrow():
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet lookups need pyarrow: pip install pyarrow")
+    
+    def load(self) -> bool:
+        """Memory-map the Parquet file for in-process joins."""
+        try:
+            self._require_pyarrow()
+            self.frame = pd.read_parquet(self.path, memory_map=True)
+            logger.info(f"Loaded lookup rows from {self.path} ({len(self.frame)} rows)")
+            return True
+        except Exception as e:
+            logger.error(f"Could not load Parquet lookup file {self.path}: {e}")
+            return False
+
+
+class SQLiteLookupBackend(LookupBackend):
+    """
+    Lookup table in a local SQLite file, queried with the same row-constructor
+    IN (...) lookups MySQL gets, in batches. DECIMAL, DATE and DATETIME columns
+    come back as Decimal, date and datetime like mysql.connector returns them.
+    """
+    
+    name = "SQLite"
+    batched = True
+    MAX_VARIABLES = 32766  # SQLite's default bound-parameter limit since 3.32
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+    
+    def load(self) -> bool:
+        if not os.path.isfile(self.path):
+            logger.error(f"SQLite lookup database not found: {self.path}")
+            return False
+        sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()))
+        sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+        sqlite3.register_converter("DATETIME", lambda value: datetime.fromisoformat(value.decode()))
+        self.connection = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                                          check_same_thread=False)
+        logger.info(f"Opened SQLite lookup database {self.path}")
+        return True
+    
+    def close(self):
+        if self.connection is not None:
+            with self.lock:
+                self.connection.close()
+            self.connection = None
+    
+    def get_columns(self, table_name: str) -> List[str]:
+        with self.lock:
+            return [row[1] for row in self.connection.execute(f"PRAGMA table_info(`{table_name}`)")]
+    
+    def lookup(self, unique_keys: List[tuple], reference_columns: List[str],
+               columns: List[str], table_name: str) -> List[Dict]:
+        ref_cols_str = ', '.join(f"`{c}`" for c in reference_columns)
+        select_str = ', '.join(f"`{c}`" for c in reference_columns + columns)
+        row = "(" + ", ".join(["?"] * len(reference_columns)) + ")"
+        chunk = max(1, self.MAX_VARIABLES // len(reference_columns))
+        results = []
+        with self.lock:
+            for start in range(0, len(unique_keys), chunk):
+                keys = unique_keys[start:start + chunk]
+                cursor = self.connection.execute(
+                    f"SELECT {select_str} FROM `{table_name}` WHERE ({ref_cols_str}) IN ({', '.join([row] * len(keys))})",
+                    [v for key in keys for v in key]
+                )
+                names = [d[0] for d in cursor.description]
+                results.extend(dict(zip(names, values)) for values in cursor.fetchall())
+        return results
+
+
+class MySQLLookupBackend(LookupBackend):
+    """
+    The lookup table in MySQL, queried through the DataEnricher that owns the
+    connection (or pool), prepared statements and schema cache.
+    """
+    
+    name = "MySQL"
+    batched = True
+    temp_tables = True
+    
+    def __init__(self, enricher: "DataEnricher"):
+        self.enricher = enricher
+    
+    @property
+    def concurrent(self) -> bool:
+        # Each sheet thread needs a connection of its own
+        return self.enricher.pool is not None
+    
+    def get_columns(self, table_name: str) -> List[str]:
+        return self.enricher._mysql_columns(table_name)
+    
+    def lookup(self, unique_keys: List[tuple], reference_columns: List[str],
+               columns: List[str], table_name: str) -> List[Dict]:
+        plan = {"reference_columns": reference_columns, "missing_columns": columns}
+        return self.enricher._query_lookup(unique_keys, plan, table_name)
+
+
+class LookupSnapshot(ParquetLookupBackend):
+    """
+    Local Parquet replica of the lookup table's reference and target columns.
+    sync() pulls only rows at or past the stored watermark and appends them as a
+    part file next to the snapshot; load() reads the snapshot and its parts and
+    keeps the newest version of each record. lookup() joins keys against the
+    replica in-process, with no database connection.
+    """
+    
+    name = "local snapshot"
+    COMPACT_AFTER_PARTS = 16  # Part files tolerated before a sync folds them into the snapshot
+    
+    def __init__(self, path: str, watermark_column: Optional[str] = None,
+                 primary_key: Optional[str] = None, fetch_size: int = 50000):
+        super().__init__(path)
+        self.state_path = f"{path}.state.json"
+        self.parts_dir = f"{path}.parts"
+        self.watermark_column = watermark_column
+        self.primary_key = primary_key
+        self.fetch_size = fetch_size
+    
+    def _load_state(self) -> Dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        return {}
+    
+    def _part_paths(self) -> List[str]:
+        if not os.path.isdir(self.parts_dir):
+            return []
+        return sorted(os.path.join(self.parts_dir, name) for name in os.listdir(self.parts_dir)
+                      if name.endswith('.parquet'))
+    
+    @staticmethod
+    def _watermark_value(value):
+        """A watermark as a JSON value that compares with the column like the original (not its repr)."""
+        if isinstance(value, (datetime, date)):  # includes pandas Timestamps
+            return value.isoformat()
+        if hasattr(value, 'item'):  # numpy scalars
+            return value.item()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+    
+    def _read_snapshot(self, dedupe_on: List[str]) -> pd.DataFrame:
+        """The snapshot and its parts, oldest first, keeping the newest row per record."""
+        frame = pd.read_parquet(self.path, memory_map=True)
+        parts = self._part_paths()
+        if not parts:
+            return frame
+        frame = pd.concat([frame] + [pd.read_parquet(part) for part in parts], ignore_index=True)
+        return frame.drop_duplicates(subset=dedupe_on, keep='last').reset_index(drop=True)
+    
+    def _write_snapshot(self, frame: pd.DataFrame):
+        """Replace the snapshot with `frame` and drop the parts it supersedes."""
+        temp_path = f"{self.path}.tmp"
+        frame.to_parquet(temp_path, index=False)
+        os.replace(temp_path, self.path)
+        for part in self._part_paths():
+            os.remove(part)
+    
+    def load(self) -> bool:
+        """Read the snapshot with the parts appended by incremental syncs."""
+        try:
+            self._require_pyarrow()
+            dedupe_on = self._load_state().get("dedupe_on")
+            if dedupe_on is None and self._part_paths():
+                raise ValueError(f"{self.state_path} does not say how to merge {self.parts_dir}")
+            self.frame = self._read_snapshot(dedupe_on)
+            logger.info(f"Loaded lookup rows from {self.path} ({len(self.frame)} rows)")
+            return True
+        except Exception as e:
+            logger.error(f"Could not load lookup snapshot {self.path}: {e}")
+            return False
+    
+    def sync(self, connection, table_name: str, reference_columns: List[str],
+             db_columns: List[str]) -> int:
+        """
+        Fetch new or changed rows into the snapshot and return how many were fetched.
+        Without a watermark column (or snapshot) every sync is a full refresh.
+        """
+        self._require_pyarrow()
+        columns = list(dict.fromkeys(
+            reference_columns + [c for c in TARGET_COLUMNS if c in db_columns]
+            + [c for c in (self.primary_key, self.watermark_column) if c]
+        ))
+        state = self._load_state()
+        watermark = state.get("watermark") if self.watermark_column else None
+        incremental = watermark is not None and os.path.exists(self.path)
+        
+        columns_str = ', '.join(f"`{c}`" for c in columns)
+        query = f"SELECT {columns_str} FROM `{table_name}`"
+        params = []
+        if incremental:
+            # >= so rows sharing the last watermark value are never missed; duplicates are dropped on load
+            query += f" WHERE `{self.watermark_column}` >= %s"
+            params.append(watermark)
+        
+        logger.info(f"Snapshot sync: fetching {'rows since ' + str(watermark) if incremental else 'all rows'}")
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(query, params)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(self.fetch_size)
+            if not rows:
+                break
+            chunks.append(pd.DataFrame(rows, columns=columns))
+            logger.info(f"Snapshot sync: {sum(len(c) for c in chunks)} rows fetched")
+        cursor.close()
+        
+        # Newer rows replace older versions of the same record
+        dedupe_on = [self.primary_key] if self.primary_key else reference_columns
+        fetched = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+        fetched = fetched.drop_duplicates(subset=dedupe_on, keep='last').reset_index(drop=True)
+        
+        os.makedirs(self.parts_dir, exist_ok=True)
+        parts = self._part_paths()
+        if not incremental:
+            self._write_snapshot(fetched)
+        elif len(fetched) and len(parts) >= self.COMPACT_AFTER_PARTS:
+            logger.info(f"Snapshot sync: folding {len(parts)} part files into {self.path}")
+            merged = self._read_snapshot(dedupe_on)
+            merged = pd.concat([merged, fetched], ignore_index=True)
+            self._write_snapshot(merged.drop_duplicates(subset=dedupe_on, keep='last'))
+        elif len(fetched):
+            # Only the fetched rows are written; the snapshot itself is not read or rewritten
+            number = int(os.path.basename(parts[-1]).split('.')[0]) + 1 if parts else 1
+            part_path = os.path.join(self.parts_dir, f"{number:05d}.parquet")
+            fetched.to_parquet(f"{part_path}.tmp", index=False)
+            os.replace(f"{part_path}.tmp", part_path)
+        
+        if self.watermark_column and len(fetched):
+            # Every fetched row is at or past the old watermark, so their maximum is the new one
+            state["watermark"] = self._watermark_value(fetched[self.watermark_column].max())
+        state["dedupe_on"] = dedupe_on
+        state["parts"] = len(self._part_paths())
+        state["synced_at"] = datetime.now().isoformat()
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f, indent=2, default=str)
+        
+        logger.info(f"Snapshot sync complete: {len(fetched)} rows fetched into {self.path} "
+                    f"({state['parts']} part files)")
+        return len(fetched)
+
+
 class DataEnricher:
     """
     Enhanced data enricher with improved error handling, retry logic, and performance optimizations.
     """
     
     def __init__(self, host: str, database: str, user: str, password: str, 
-                 port: int = 3306, debug_mode: bool = False, debug_id: Optional[int] = None):
-        """Initialize database connection parameters."""
+                 port: int = 3306, debug_mode: bool = False, debug_id: Optional[int] = None,
+                 read_only_cache: bool = False):
+        """
+        Initialize database connection parameters. With read_only_cache the persistent
+        lookup cache is only read (worker processes leave writing it to the parent).
+        """
+        ensure_configured()
         self.host = host
         self.database = database
         self.user = user
@@ -163,25 +1183,123 @@ class DataEnricher:
         self.debug_mode = debug_mode
         self.debug_id = debug_id
         self.connection_attempts = 0
+        self.max_allowed_packet = DEFAULT_MAX_ALLOWED_PACKET
+        self.lookup_batch_size = BATCH_SIZE
+        if ADAPTIVE_BATCHING_ENABLED:
+            self.lookup_batch_size = max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, BATCH_SIZE))
+        self.query_count = 0
+        # Run-wide lookup cache: reference columns -> {key: database row or None}
+        self.run_lookup_cache = None
+        self.pool = None
+        self._thread_state = threading.local()  # pooled connection borrowed by a sheet thread
+        self._stats_lock = threading.Lock()
+        self._run_cache_lock = threading.Lock()  # guards run_lookup_cache across sheet threads
+        self._keys_in_flight = {}  # (reference columns, key) -> Event set once the key is in the run cache
+        self.schema_cache = {}  # table name -> columns, for the current connection
+        self.column_lengths = {}  # table name -> {column: character limit}, for temporary-table lookups
+        self.schema_refreshed_at = time.monotonic()
+        self.plan_cache = {}  # (table, input columns, combinations, mapping) -> enrichment plan
+        self.run_cache_started = None  # monotonic time the run lookup cache was started
+        self._lookup_sql = {}  # statement shape -> SQL text (same object each time, as the cursor requires)
+        self._statements = {}  # connection id -> OrderedDict(SQL -> prepared cursor)
+        self.statement_cache_hits = 0
+        self.backend = None  # LookupBackend serving lookups instead of MySQL
+        self.mysql = MySQLLookupBackend(self)
+        self.backend_mtime = None  # modification time of the backend's source file when loaded
+        self.metrics = None  # RunMetrics of the current run, if it is being measured
+        self.query_profiler = self._new_query_profiler()
+        self.lookup_cache = None
+        cache_path = LOOKUP_CACHE_CONFIG.get("path", "lookup_cache.sqlite")
+        if read_only_cache and LOOKUP_CACHE_CONFIG.get("enabled", False) and not os.path.exists(cache_path):
+            # Nothing to read yet (first run): go without the cache rather than fail to open it
+            logger.info(f"Lookup cache {cache_path} does not exist yet, running without it")
+        elif LOOKUP_CACHE_CONFIG.get("enabled", False):
+            self.lookup_cache = LookupCache(
+                path=cache_path,
+                ttl_hours=LOOKUP_CACHE_CONFIG.get("ttl_hours", 168),
+                max_entries=LOOKUP_CACHE_CONFIG.get("max_entries", 1000000),
+                max_bytes=LOOKUP_CACHE_CONFIG.get("max_bytes", 512 * 1024 * 1024),
+                read_only=read_only_cache
+            )
+    
+    @staticmethod
+    def _new_query_profiler() -> Optional[QueryProfiler]:
+        if not QUERY_PROFILING_ENABLED:
+            return None
+        return QueryProfiler(
+            slow_query_ms=SLOW_QUERY_MS,
+            slow_query_log=QUERY_PROFILING_CONFIG.get("slow_query_log", "slow_queries.jsonl") or None,
+            max_explains=QUERY_PROFILING_CONFIG.get("max_explains", 20)
+        )
+    
+    def reset_run_state(self):
+        """
+        Zero the per-run counters of an enricher that is reused across runs (daemon mode),
+        and do what disconnect() would have done at the end of the previous run: log the
+        lookup cache totals and drop prepared statements of pooled connections, whose
+        sessions may not outlive the pool checkout.
+        """
+        self.query_count = 0
+        self.statement_cache_hits = 0
+        self.query_profiler = self._new_query_profiler()
+        self.metrics = None
+        if self.lookup_cache is not None:
+            if self.lookup_cache.hits or self.lookup_cache.misses:
+                self.lookup_cache.log_stats()
+            self.lookup_cache.purge_expired()
+        own_id = self.connection.connection_id if self.connection is not None else None
+        for connection_id in [cid for cid in self._statements if cid != own_id]:
+            for cursor in self._statements.pop(connection_id).values():
+                try:
+                    cursor.close()
+                except mysql_connector.Error:
+                    pass
+    
+    def _connection_args(self) -> Dict:
+        return dict(
+            host=self.host,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+            port=self.port,
+            connection_timeout=CONNECTION_TIMEOUT,
+            autocommit=True
+        )
     
     def connect(self) -> bool:
-        """Establish connection to MySQL database with retry logic."""
+        """
+        Establish connection to MySQL database with retry logic. In pooled mode the
+        connection is borrowed from a pool that also serves concurrent batch queries.
+        """
         for attempt in range(MAX_RETRIES):
             try:
-                self.connection = mysql.connector.connect(
-                    host=self.host,
-                    database=self.database,
-                    user=self.user,
-                    password=self.password,
-                    port=self.port,
-                    connection_timeout=CONNECTION_TIMEOUT,
-                    autocommit=True
-                )
+                if POOLED_CONNECTIONS:
+                    if self.pool is None:
+                        # One connection for schema/temp-table work plus one per query or sheet worker
+                        self.pool = mysql_connector.pooling.MySQLConnectionPool(
+                            pool_name=f"data_merge_{id(self)}",
+                            pool_size=min(max(QUERY_WORKERS, SHEET_WORKERS) + 1,
+                                          mysql_connector.pooling.CNX_POOL_MAXSIZE),
+                            # Keep prepared statements alive when connections go back to the pool
+                            pool_reset_session=False,
+                            **self._connection_args()
+                        )
+                        logger.info(f"Created connection pool of {self.pool.pool_size} connections")
+                    if self.connection is not None:
+                        try:
+                            self.connection.close()  # hand the broken connection back to the pool
+                        except mysql_connector.Error:
+                            pass
+                    self.connection = self.pool.get_connection()
+                else:
+                    self.connection = mysql_connector.connect(**self._connection_args())
                 if self.connection.is_connected():
                     logger.info("Connected to MySQL database")
                     self.connection_attempts = 0
+                    self.schema_cache.clear()
+                    self._fetch_max_allowed_packet()
                     return True
-            except Error as e:
+            except mysql_connector.Error as e:
                 self.connection_attempts += 1
                 logger.warning(f"Connection attempt {attempt + 1} failed: {e}")
                 if attempt < MAX_RETRIES - 1:
@@ -191,11 +1309,133 @@ class DataEnricher:
                     return False
         return False
     
+    def open_lookup(self) -> bool:
+        """Open the configured lookup source: the local snapshot, a lookup_backend, or MySQL."""
+        if SNAPSHOT_ENABLED:
+            return self.load_snapshot()
+        if LOOKUP_BACKEND != "mysql":
+            return self.load_backend()
+        return self.connect()
+    
+    def load_backend(self, backend: Optional[LookupBackend] = None) -> bool:
+        """Serve lookups from `backend` (by default the one configured in lookup_backend) instead of MySQL."""
+        if backend is None:
+            path = LOOKUP_BACKEND_CONFIG.get("path", "")
+            if LOOKUP_BACKEND == "sqlite":
+                backend = SQLiteLookupBackend(path)
+            elif LOOKUP_BACKEND == "memory":
+                backend = FrameLookupBackend(path=path)
+            elif LOOKUP_BACKEND == "parquet":
+                backend = ParquetLookupBackend(path)
+            else:
+                logger.error(f"Unknown lookup_backend type: {LOOKUP_BACKEND!r} (use mysql, sqlite, memory or parquet)")
+                return False
+        if not backend.load():
+            return False
+        self.backend = backend
+        self.backend_mtime = self._source_mtime(backend)
+        self.schema_cache.clear()
+        logger.info(f"Serving lookups from the {backend.name} backend")
+        return True
+    
+    def load_snapshot(self) -> bool:
+        """Serve lookups from the local snapshot instead of connecting to MySQL."""
+        return self.load_backend(LookupSnapshot(
+            path=SNAPSHOT_CONFIG.get("path", "lookup_snapshot.parquet"),
+            watermark_column=SNAPSHOT_CONFIG.get("watermark_column"),
+            primary_key=SNAPSHOT_CONFIG.get("primary_key")
+        ))
+    
+    def sync_snapshot(self, table_name: str, possible_reference_combinations: List[List[str]]) -> bool:
+        """Pull new or changed rows of the lookup table into the local snapshot."""
+        snapshot = LookupSnapshot(
+            path=SNAPSHOT_CONFIG.get("path", "lookup_snapshot.parquet"),
+            watermark_column=SNAPSHOT_CONFIG.get("watermark_column"),
+            primary_key=SNAPSHOT_CONFIG.get("primary_key"),
+            fetch_size=SNAPSHOT_CONFIG.get("fetch_size", 50000)
+        )
+        reference_columns = list(dict.fromkeys(
+            col for combination in possible_reference_combinations for col in combination
+        ))
+        try:
+            snapshot.sync(self.connection, table_name, reference_columns, self.mysql.get_columns(table_name))
+            return True
+        except Exception as e:
+            logger.error(f"Snapshot sync failed: {e}")
+            return False
+    
+    @staticmethod
+    def _source_mtime(backend: LookupBackend) -> Optional[float]:
+        # A snapshot also changes when a sync adds a part file to its parts directory
+        paths = [getattr(backend, "path", None), getattr(backend, "parts_dir", None)]
+        mtimes = [os.path.getmtime(path) for path in paths if path and os.path.exists(path)]
+        return max(mtimes) if mtimes else None
+    
+    def check_health(self, cache_ttl: Optional[float] = None, schema_ttl: Optional[float] = None) -> bool:
+        """
+        Between runs of a long-lived enricher: expire carried-over lookups older than
+        cache_ttl seconds and schema metadata older than schema_ttl, then ping MySQL
+        (reconnecting if the session is gone) or reload a file backend whose source
+        changed since it was loaded. Returns False if there is no usable lookup source.
+        """
+        now = time.monotonic()
+        if cache_ttl is not None and self.run_cache_started is not None and now - self.run_cache_started > cache_ttl:
+            logger.info("Carried-over lookup cache expired")
+            self.end_run_cache()
+        if schema_ttl is not None and now - self.schema_refreshed_at > schema_ttl:
+            logger.info("Refreshing cached schema and enrichment plans")
+            self.schema_cache.clear()
+            self.column_lengths.clear()
+            self.plan_cache.clear()
+            self.schema_refreshed_at = now
+        
+        if self.backend is None and self.connection is None:
+            return self.open_lookup()
+        if self.backend is not None:
+            if self._source_mtime(self.backend) == self.backend_mtime:
+                return True
+            logger.info(f"{self.backend.name} lookup source changed since it was loaded, reloading")
+            backend = self.backend
+            backend.close()
+            self.backend = None
+            self.end_run_cache()  # rows may have changed with the source
+            return self.load_backend(backend)
+        try:
+            self.connection.ping(reconnect=False)
+            return True
+        except mysql_connector.Error as e:
+            logger.warning(f"Database connection lost between runs ({e}), reconnecting")
+            self._invalidate_connection_cache(self.connection)
+            return self.connect()
+    
+    def _fetch_max_allowed_packet(self):
+        """Read the server's max_allowed_packet so lookup queries can be sized to fit."""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT @@max_allowed_packet")
+            row = cursor.fetchone()
+            cursor.close()
+            if row and row[0]:
+                self.max_allowed_packet = int(row[0])
+                logger.info(f"Server max_allowed_packet: {self.max_allowed_packet} bytes")
+        except mysql_connector.Error as e:
+            logger.warning(f"Could not read max_allowed_packet, assuming {self.max_allowed_packet} bytes: {e}")
+    
     def disconnect(self):
         """Close database connection safely."""
         if self.connection and self.connection.is_connected():
             self.connection.close()
             logger.info("Database connection closed")
+        self.connection = None
+        self.pool = None
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+        self.schema_cache.clear()
+        self._statements.clear()
+        if self.lookup_cache is not None:
+            self.lookup_cache.close()
+            self.lookup_cache = None
     
     def validate_file(self, file_path: str) -> bool:
         """Validate file exists and is readable."""
@@ -221,30 +1461,32 @@ class DataEnricher:
         - pd.DataFrame for single sheet/CSV files
         - Dict[str, pd.DataFrame] for multi-sheet Excel files
         """
+        with metrics_scope(self.metrics, file_path), stage_timer(self.metrics, "read") as counts:
+            data = self._read_file(file_path)
+            frames = list(data.values()) if isinstance(data, dict) else [data] if data is not None else []
+            counts["rows"] = sum(len(df) for df in frames)
+            counts["sheets"] = len(frames)
+        return data
+    
+    def _read_file(self, file_path: str):
+        """read_file_safely without the metrics."""
         try:
             file_extension = os.path.splitext(file_path)[1].lower()
             if file_extension in ['.xlsx', '.xls']:
-                # Read all sheets from Excel file
-                excel_file = pd.ExcelFile(file_path)
-                sheet_names = excel_file.sheet_names
-                logger.info(f"Found {len(sheet_names)} sheet(s): {sheet_names}")
+                # Open the workbook once and parse every sheet exactly once
+                with pd.ExcelFile(file_path) as excel_file:
+                    sheet_names = excel_file.sheet_names
+                    logger.info(f"Found {len(sheet_names)} sheet(s): {sheet_names}")
+                    raw_sheets = {
+                        sheet_name: excel_file.parse(sheet_name=sheet_name, header=None)
+                        for sheet_name in sheet_names
+                    }
                 
                 sheets_dict = {}
-                for sheet_name in sheet_names:
+                for sheet_name, raw_sheet in raw_sheets.items():
                     # Detect the correct header row automatically for each sheet
-                    preview = pd.read_excel(file_path, sheet_name=sheet_name, nrows=10, header=None)
-                    header_row = None
-                    for i, row in preview.iterrows():
-                        # Heuristic: a row is header if most cells are strings and not NaN
-                        non_null = row.dropna()
-                        if len(non_null) > 2 and all(isinstance(x, str) for x in non_null):
-                            header_row = i
-                            break
-
-                    if header_row is not None:
-                        df_sheet = pd.read_excel(file_path, sheet_name=sheet_name, header=header_row)
-                    else:
-                        df_sheet = pd.read_excel(file_path, sheet_name=sheet_name)
+                    header_row = self.detect_header_row(raw_sheet.head(HEADER_SCAN_ROWS))
+                    df_sheet = self.frame_from_raw_sheet(raw_sheet, header_row if header_row is not None else 0)
                     
                     # Remove unnamed columns (columns that start with "Unnamed:")
                     unnamed_cols = [col for col in df_sheet.columns if str(col).startswith('Unnamed:')]
@@ -252,7 +1494,7 @@ class DataEnricher:
                         df_sheet = df_sheet.drop(columns=unnamed_cols)
                     
                     if len(df_sheet) > 0:
-                        sheets_dict[sheet_name] = df_sheet
+                        sheets_dict[sheet_name] = self.apply_dtype_policy(df_sheet, f"sheet '{sheet_name}' (read)")
                         logger.info(f"Loaded sheet '{sheet_name}' with {len(df_sheet)} rows")
                 
                 # Return dict if multiple sheets, single DataFrame if one sheet
@@ -273,21 +1515,137 @@ class DataEnricher:
                     df = df.drop(columns=unnamed_cols)
                     logger.info(f"Removed {len(unnamed_cols)} unnamed columns: {unnamed_cols}")
                 logger.info(f"File loaded with columns: {list(df.columns)}")
-                return df
+                return self.apply_dtype_policy(df, f"{os.path.basename(file_path)} (read)")
         except Exception as e:
             logger.error(f"Error reading file: {e}")
             return None
-
+
+    def detect_header_row(self, preview: pd.DataFrame) -> Optional[int]:
+        """Return the index of the first row that looks like a header, or None."""
+        for i, row in preview.iterrows():
+            # Heuristic: a row is header if most cells are strings and not NaN
+            non_null = row.dropna()
+            if len(non_null) > 2 and all(isinstance(x, str) for x in non_null):
+                return i
+        return None
+    
+    def frame_from_raw_sheet(self, raw_sheet: pd.DataFrame, header_row: int) -> pd.DataFrame:
+        """
+        Build the DataFrame pd.read_excel(header=header_row) would return from a
+        sheet that was already parsed with header=None, without re-reading the file.
+        Column naming (Unnamed: N, duplicate mangling) and dtype inference go
+        through the same TextParser pandas uses for Excel sheets.
+        """
+        if raw_sheet.empty:
+            return pd.DataFrame()
+        # Blank cells go back to "" exactly as pandas' sheet reader hands them to TextParser
+        rows = raw_sheet.astype(object).where(raw_sheet.notna(), "").values.tolist()
+        try:
+            parser = pd.io.parsers.TextParser(rows, header=header_row, skip_blank_lines=False)
+            return parser.read()
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame()
+    
+    def _categorical_names(self) -> set:
+        """Lower-cased column names to store as categoricals: the configured names plus their input and display aliases."""
+        configured = {name.strip().lower() for name in CATEGORICAL_COLUMNS}
+        names = set(configured)
+        names.update(excel.strip().lower() for excel, db in COLUMN_MAPPING.items() if db.strip().lower() in configured)
+        names.update(display.strip().lower() for db, display in COLUMN_RENAME_MAP.items() if db.strip().lower() in configured)
+        return names
+    
+    def apply_dtype_policy(self, df: pd.DataFrame, label: str) -> pd.DataFrame:
+        """
+        Store a frame compactly under the dtype_policy config: configured low-cardinality
+        columns as categoricals, other text columns as pyarrow-backed strings, and
+        numerics (including database decimals) in the smallest dtype that holds every
+        value exactly. Logs the frame's memory before and after.
+        """
+        if not DTYPE_POLICY_ENABLED or df.empty:
+            return df
+        
+        string_dtype = None
+        if ARROW_STRINGS:
+            try:
+                import pyarrow  # noqa: F401
+                string_dtype = pd.StringDtype("pyarrow")
+            except ImportError:
+                logger.warning("dtype_policy.arrow_strings needs pyarrow; text columns stay as objects")
+        categorical_names = self._categorical_names()
+        
+        before = df.memory_usage(deep=True).sum()
+        compact = df.copy(deep=False)
+        for col_idx in range(compact.shape[1]):
+            series = compact.iloc[:, col_idx]
+            try:
+                if str(compact.columns[col_idx]).strip().lower() in categorical_names:
+                    compacted = None if isinstance(series.dtype, pd.CategoricalDtype) else series.astype("category")
+                else:
+                    compacted = self._compact_series(series, string_dtype)
+            except (TypeError, ValueError, ArithmeticError) as e:
+                logger.debug(f"dtype_policy left column '{compact.columns[col_idx]}' as {series.dtype}: {e}")
+                continue
+            if compacted is not None:
+                compact.isetitem(col_idx, compacted)
+        
+        after = compact.memory_usage(deep=True).sum()
+        logger.info(f"Memory for {label}: {before / 1048576:.2f} MB -> {after / 1048576:.2f} MB")
+        return compact
+    
+    def _compact_series(self, series: pd.Series, string_dtype) -> Optional[pd.Series]:
+        """Compact replacement for one non-categorical column, or None to keep it as it is."""
+        kind = pd.api.types.infer_dtype(series, skipna=True) if series.dtype == object else None
+        if kind == "string":
+            return series.astype(string_dtype) if string_dtype is not None else None
+        if not DOWNCAST_NUMERICS:
+            return None
+        
+        if kind == "integer" and series.notna().all():
+            return pd.to_numeric(series, downcast="integer")
+        if kind == "decimal":
+            # Decimals become floats only when each one reads back as the same number
+            present = series.dropna()
+            if not all(Decimal(repr(float(value))) == value for value in present):
+                return None
+            series = pd.to_numeric(series)
+        
+        if pd.api.types.is_extension_array_dtype(series.dtype):
+            return None
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return pd.to_numeric(series, downcast="integer")
+        if pd.api.types.is_float_dtype(series.dtype):
+            if series.dtype.itemsize > 4:
+                downcast = series.astype("float32")
+                # Only when float32 holds every value exactly, so written output is unchanged
+                if (downcast.astype(series.dtype) == series)[series.notna()].all():
+                    return downcast
+            return series if kind == "decimal" else None
+        return None
+    
+    @property
+    def source(self) -> LookupBackend:
+        """Where lookups go: the loaded backend, else MySQL."""
+        return self.backend if self.backend is not None else self.mysql
+    
     def get_all_columns(self, table_name: str) -> List[str]:
-        """Get all column names from the database table with retry logic."""
+        """Get all column names of the lookup table."""
+        return self.source.get_columns(table_name)
+    
+    def _mysql_columns(self, table_name: str) -> List[str]:
+        """Column names of a MySQL table with retry logic, cached per connection."""
+        columns = self.schema_cache.get(table_name)
+        if columns is not None:
+            logger.info(f"Schema cache hit for {table_name} ({len(columns)} columns)")
+            return columns
         for attempt in range(MAX_RETRIES):
             try:
-                cursor = self.connection.cursor()
+                cursor = (self._sheet_connection() or self.connection).cursor()
                 cursor.execute(f"SHOW COLUMNS FROM `{table_name}`")
                 columns = [column[0] for column in cursor.fetchall()]
                 cursor.close()
+                self.schema_cache[table_name] = columns
                 return columns
-            except Error as e:
+            except mysql_connector.Error as e:
                 logger.warning(f"Error fetching columns (attempt {attempt + 1}): {e}")
                 if attempt < MAX_RETRIES - 1:
                     time.sleep(1)
@@ -295,27 +1653,78 @@ class DataEnricher:
                     logger.error("Failed to fetch columns after all retries")
                     return []
     
-    def execute_query_with_retry(self, query: str, params: List = None) -> List[Dict]:
-        """Execute query with retry logic and timeout."""
+    def execute_query_with_retry(self, query: str, params: List = None, connection=None,
+                                 prepared: bool = False) -> List[Dict]:
+        """
+        Execute query with retry logic and timeout. `connection` selects a pooled
+        connection; by default the current sheet thread's connection, else the
+        enricher's own connection is used. With `prepared`, the query runs as a
+        server-side prepared statement cached per connection. With query profiling
+        on, latency, parameter and row counts, retries and reconnects are recorded.
+        """
+        if connection is None:
+            connection = self._sheet_connection()
+        retries = 0
+        reconnects = 0
         for attempt in range(MAX_RETRIES):
+            conn = connection if connection is not None else self.connection
+            start = time.perf_counter()
             try:
-                cursor = self.connection.cursor(dictionary=True)
-                cursor.execute(query, params or [])
-                results = cursor.fetchall()
-                cursor.close()
+                if prepared:
+                    cursor = self._prepared_cursor(conn, query)
+                    cursor.execute(query, params or [])
+                    columns = cursor.column_names
+                    results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                else:
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute(query, params or [])
+                    results = cursor.fetchall()
+                    cursor.close()
+                self._profile_query(conn, query, params, results, time.perf_counter() - start, retries, reconnects)
                 return results
-            except Error as e:
+            except mysql_connector.Error as e:
                 logger.warning(f"Query failed (attempt {attempt + 1}): {e}")
+                self._invalidate_connection_cache(conn)
                 if attempt < MAX_RETRIES - 1:
+                    retries += 1
                     time.sleep(1)
                     # Try to reconnect if connection is lost
-                    if not self.connection.is_connected():
+                    if not conn.is_connected():
                         logger.info("Reconnecting to database...")
-                        self.connect()
+                        reconnects += 1
+                        if connection is None:
+                            self.connect()
+                        else:
+                            try:
+                                connection.reconnect(attempts=MAX_RETRIES, delay=1)
+                            except mysql_connector.Error as reconnect_error:
+                                logger.warning(f"Pooled connection reconnect failed: {reconnect_error}")
                 else:
                     logger.error(f"Query failed after all retries: {query}")
+                    self._profile_query(conn, query, params, None, time.perf_counter() - start, retries, reconnects)
                     return []
     
+    def _profile_query(self, conn, query: str, params: Optional[List], results: Optional[List[Dict]],
+                       seconds: float, retries: int, reconnects: int):
+        """Record a query with the profiler; slow ones are logged with their EXPLAIN output."""
+        if self.query_profiler is None:
+            return
+        rows = len(results) if results is not None else 0
+        if self.query_profiler.record(seconds, len(params or []), rows, retries, reconnects,
+                                      succeeded=results is not None):
+            self.query_profiler.log_slow_query(query, params, seconds, rows, self._explain(conn, query, params))
+    
+    def _explain(self, conn, query: str, params: Optional[List]):
+        """EXPLAIN output for a query as a list of rows, or the error text if it could not be explained."""
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"EXPLAIN {query}", params or [])
+            plan = cursor.fetchall()
+            cursor.close()
+            return plan
+        except mysql_connector.Error as e:
+            return f"EXPLAIN failed: {e}"
+    
     def is_empty_value(self, value) -> bool:
         """Check if a value is empty/null."""
         return pd.isna(value) or value is None or (isinstance(value, str) and value.strip() == '')
@@ -374,6 +1783,7 @@ class DataEnricher:
         Returns:
             bool: True if successful, False otherwise
         """
+        from openpyxl import load_workbook
         try:
             # Load original file to get header formatting
             original_wb = load_workbook(original_excel_path, read_only=False, data_only=False)
@@ -413,6 +1823,8 @@ class DataEnricher:
     
     def _apply_sheet_formatting(self, original_ws, output_ws, header_row_index: int):
         """Helper method to apply formatting to a single sheet."""
+        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+        from openpyxl.utils import get_column_letter
         # Find header row in original file (search first few rows)
         original_header_row = None
         for row_idx in range(1, min(11, original_ws.max_row + 1)):
@@ -579,19 +1991,290 @@ class DataEnricher:
                     except Exception:
                         pass
     
-    def _enrich_single_dataframe(self, df_excel: pd.DataFrame, table_name: str,
-                                 possible_reference_combinations: List[List[str]],
-                                 column_mapping: Dict[str, str]) -> Optional[pd.DataFrame]:
-        """Helper method to enrich a single DataFrame."""
-        logger.info(f"Processing {len(df_excel)} rows...")
-        logger.info(f"Available columns: {list(df_excel.columns)}")
+    @staticmethod
+    def _sheet_dimensions(excel_path: str) -> Dict[str, Dict]:
+        """
+        Column widths and header-area row heights per sheet, read straight from the
+        sheet XML (the <cols> block and the first HEADER_SCAN_ROWS <row> tags) instead
+        of loading the workbook. Widths are keyed by the first column of each <col>
+        range, as openpyxl's column_dimensions are.
+        """
+        main_ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+        rel_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+        dimensions = {}
+        with zipfile.ZipFile(excel_path) as archive:
+            workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+            rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+            for sheet in workbook.iter(f"{main_ns}sheet"):
+                target = targets.get(sheet.get(f"{rel_ns}id"), "")
+                part = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+                widths, heights = {}, {}
+                with archive.open(part) as sheet_xml:
+                    for event, elem in ET.iterparse(sheet_xml, events=("start", "end")):
+                        if elem.tag == f"{main_ns}col" and event == "end":
+                            widths[int(elem.get("min"))] = float(elem.get("width", 13))  # openpyxl's default
+                        elif elem.tag == f"{main_ns}row" and event == "start":
+                            row_number = int(elem.get("r", 0))
+                            if row_number > HEADER_SCAN_ROWS:
+                                break
+                            if elem.get("ht"):
+                                heights[row_number] = float(elem.get("ht"))
+                        if event == "end":
+                            elem.clear()
+                dimensions[sheet.get("name")] = {"widths": widths, "heights": heights}
+        return dimensions
+    
+    def extract_header_template(self, excel_path: str) -> Optional[Dict[str, Dict]]:
+        """
+        Read the header style of every sheet of the source workbook once: header row,
+        sample header cell styles, column widths by header name and position, and
+        header row height. Same rules as _apply_sheet_formatting.
+        
+        Returns:
+            Dict of sheet name -> template, with the active sheet's template also under
+            None as the fallback for sheets the source does not have; or None
+        """
+        from openpyxl import load_workbook
+        workbook = None
+        try:
+            dimensions = self._sheet_dimensions(excel_path)
+            workbook = load_workbook(excel_path, read_only=True, data_only=False)
+            theme_colors = self._theme_colors(workbook.loaded_theme)
+            templates = {}
+            for ws in workbook.worksheets:
+                rows = [tuple(row) for row in ws.iter_rows(max_row=HEADER_SCAN_ROWS)]
+                header_index = 0
+                for row_index, row in enumerate(rows):
+                    text_count = sum(1 for cell in row if getattr(cell, 'value', None) and isinstance(cell.value, str))
+                    if text_count >= len(row) * 0.5:  # At least 50% text
+                        header_index = row_index
+                        break
+                header_cells = rows[header_index] if rows else ()
+                header_names = {}
+                for col_idx, cell in enumerate(header_cells, start=1):
+                    if getattr(cell, 'value', None):
+                        header_names[str(cell.value).strip()] = col_idx
+                sample_cell = next((cell for cell in header_cells if getattr(cell, 'value', None)),
+                                   header_cells[0] if header_cells else None)
+                
+                sheet_dimensions = dimensions.get(ws.title, {"widths": {}, "heights": {}})
+                widths = {col: width for col, width in sheet_dimensions["widths"].items() if width > 0}
+                templates[ws.title] = {
+                    "sample_cell": sample_cell if getattr(sample_cell, 'has_style', False) else None,
+                    "widths_by_pos": widths,
+                    "widths_by_name": {name: widths.get(col) for name, col in header_names.items()},
+                    "max_column": len(header_cells),
+                    "default_width": sum(widths.values()) / len(widths) if widths else 12.0,
+                    "header_height": sheet_dimensions["heights"].get(header_index + 1),
+                    "theme_colors": theme_colors,
+                }
+            if templates:
+                templates[None] = templates.get(workbook.active.title, next(iter(templates.values())))
+            return templates or None
+        except Exception as e:
+            logger.warning(f"Could not read header template from {excel_path}: {e}")
+            return None
+        finally:
+            if workbook is not None:
+                workbook.close()
+    
+    @staticmethod
+    def _theme_colors(theme_xml) -> List[str]:
+        """RGB hex of the theme palette in the order style indices use (lt1, dk1, lt2, dk2, accents, links)."""
+        if not theme_xml:
+            return []
+        drawing_ns = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+        scheme = ET.fromstring(theme_xml).find(f".//{drawing_ns}clrScheme")
+        if scheme is None:
+            return []
+        colors = []
+        for entry in scheme:
+            value = next(iter(entry), None)
+            if value is None:
+                colors.append("000000")
+            else:
+                colors.append(value.get("lastClr") or value.get("val") or "000000")
+        if len(colors) >= 4:
+            colors[0], colors[1], colors[2], colors[3] = colors[1], colors[0], colors[3], colors[2]
+        return colors
+    
+    @staticmethod
+    def _xlsxwriter_color(color, theme_colors: List[str]) -> Optional[str]:
+        """'#RRGGBB' for an openpyxl color (rgb, indexed or theme + tint), or None."""
+        from openpyxl.styles.colors import COLOR_INDEX
+        if color is None:
+            return None
+        if color.type == 'rgb' and isinstance(color.rgb, str) and len(color.rgb) == 8:
+            return f"#{color.rgb[2:]}"
+        if color.type == 'indexed' and color.indexed is not None and color.indexed < len(COLOR_INDEX):
+            return f"#{COLOR_INDEX[color.indexed][2:]}"
+        if color.type == 'theme' and color.theme is not None and color.theme < len(theme_colors):
+            red, green, blue = (int(theme_colors[color.theme][i:i + 2], 16) / 255 for i in (0, 2, 4))
+            hue, lightness, saturation = colorsys.rgb_to_hls(red, green, blue)
+            tint = color.tint or 0
+            lightness = lightness * (1 + tint) if tint < 0 else lightness * (1 - tint) + tint
+            rgb = colorsys.hls_to_rgb(hue, lightness, saturation)
+            return "#" + "".join(f"{round(channel * 255):02X}" for channel in rgb)
+        return None
+    
+    def _xlsxwriter_header_format(self, sample_cell, theme_colors: List[str]) -> Dict:
+        """Translate the template's openpyxl header cell style into xlsxwriter format properties."""
+        if sample_cell is None:
+            # pandas' default header style, which the legacy path leaves in place
+            return {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+        
+        border_styles = {'thin': 1, 'medium': 2, 'dashed': 3, 'dotted': 4, 'thick': 5, 'double': 6,
+                         'hair': 7, 'mediumDashed': 8, 'dashDot': 9, 'mediumDashDot': 10,
+                         'dashDotDot': 11, 'mediumDashDotDot': 12, 'slantDashDot': 13}
+        vertical = {'top': 'top', 'center': 'vcenter', 'bottom': 'bottom',
+                    'justify': 'vjustify', 'distributed': 'vdistributed'}
+        horizontal = {'left': 'left', 'center': 'center', 'right': 'right', 'fill': 'fill',
+                      'justify': 'justify', 'centerContinuous': 'center_across', 'distributed': 'distributed'}
+        properties = {}
+        
+        font = sample_cell.font
+        properties['font_name'] = font.name or 'Calibri'
+        properties['font_size'] = font.size or 11
+        if font.bold:
+            properties['bold'] = True
+        if font.italic:
+            properties['italic'] = True
+        if font.underline:
+            properties['underline'] = {'single': 1, 'double': 2, 'singleAccounting': 33,
+                                       'doubleAccounting': 34}.get(font.underline, 1)
+        if font.strike:
+            properties['font_strikeout'] = True
+        font_color = self._xlsxwriter_color(font.color, theme_colors)
+        if font_color:
+            properties['font_color'] = font_color
+        
+        fill = sample_cell.fill
+        fill_color = self._xlsxwriter_color(getattr(fill, 'start_color', None), theme_colors)
+        if getattr(fill, 'fill_type', None) == 'solid' and fill_color:
+            properties['pattern'] = 1
+            properties['bg_color'] = fill_color
+        
+        alignment = sample_cell.alignment
+        if alignment.horizontal in horizontal:
+            properties['align'] = horizontal[alignment.horizontal]
+        properties['valign'] = vertical.get(alignment.vertical or 'bottom', 'bottom')
+        if alignment.wrap_text:
+            properties['text_wrap'] = True
+        if alignment.shrink_to_fit:
+            properties['shrink'] = True
+        if alignment.indent:
+            properties['indent'] = int(alignment.indent)
+        
+        for side in ('left', 'right', 'top', 'bottom'):
+            edge = getattr(sample_cell.border, side)
+            if edge is not None and edge.style in border_styles:
+                properties[side] = border_styles[edge.style]
+                edge_color = self._xlsxwriter_color(edge.color, theme_colors)
+                if edge_color:
+                    properties[f'{side}_color'] = edge_color
+        return properties
+    
+    def write_xlsx_single_pass(self, excel_path: str, output_path: str,
+                               sheets: Dict[str, pd.DataFrame]) -> bool:
+        """
+        Write enriched sheets with xlsxwriter in constant_memory mode, applying the
+        source header template (styles, widths, header height) while writing, so the
+        output is written once and never reopened. Returns False if xlsxwriter is
+        not installed.
+        """
+        try:
+            import xlsxwriter
+        except ImportError:
+            logger.warning("xlsxwriter is not installed; falling back to write-then-format")
+            return False
+        
+        templates = self.extract_header_template(excel_path) if excel_path.lower().endswith(('.xlsx', '.xlsm')) else None
+        workbook = xlsxwriter.Workbook(output_path, {
+            'constant_memory': True,
+            'strings_to_formulas': False,
+            'strings_to_urls': False,
+            'nan_inf_to_errors': True,
+        })
+        try:
+            date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+            datetime_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+            header_formats = {}
+            
+            for sheet_name, df in sheets.items():
+                template = None
+                if templates:
+                    template = templates.get(sheet_name) or templates[None]
+                worksheet = workbook.add_worksheet(sheet_name)
+                
+                template_key = id(template)
+                if template_key not in header_formats:
+                    sample_cell = template["sample_cell"] if template else None
+                    theme_colors = template["theme_colors"] if template else []
+                    header_formats[template_key] = workbook.add_format(
+                        self._xlsxwriter_header_format(sample_cell, theme_colors)
+                    )
+                
+                # Column widths: by header name, then by position, then the average width
+                if template:
+                    for col_idx, name in enumerate(df.columns, start=1):
+                        width = template["widths_by_name"].get(str(name).strip())
+                        if not width and col_idx <= template["max_column"]:
+                            width = template["widths_by_pos"].get(col_idx)
+                        if not width:
+                            width = template["default_width"]
+                        # openpyxl reports the stored width, which includes the 5-pixel cell padding
+                        # that set_column adds to the character width it is given
+                        worksheet.set_column(col_idx - 1, col_idx - 1, max(width - 5 / 7, 0))
+                    if template["header_height"]:
+                        worksheet.set_row(0, template["header_height"])
+                
+                worksheet.write_row(0, 0, [str(name) for name in df.columns], header_formats[template_key])
+                for row_idx, values in enumerate(df.itertuples(index=False, name=None), start=1):
+                    for col_idx, value in enumerate(values):
+                        value = self._to_cell_value(value)
+                        if value is None or value == "":
+                            continue
+                        if isinstance(value, datetime):
+                            worksheet.write_datetime(row_idx, col_idx, value, datetime_format)
+                        elif isinstance(value, date):
+                            worksheet.write_datetime(row_idx, col_idx, value, date_format)
+                        elif isinstance(value, Decimal) and value == value.to_integral_value():
+                            worksheet.write_number(row_idx, col_idx, int(value))  # as openpyxl writes it
+                        else:
+                            worksheet.write(row_idx, col_idx, value)
+        finally:
+            workbook.close()
+        
+        logger.info(f"Data saved to {output_path} with {len(sheets)} sheets (single pass)")
+        return True
+    
+    def _prepare_enrichment(self, excel_columns: List[str], table_name: str,
+                            possible_reference_combinations: List[List[str]],
+                            column_mapping: Dict[str, str]) -> Optional[Dict]:
+        """
+        Work out, once per sheet, how rows with the given columns will be enriched.
+        
+        Returns:
+            Dict describing the plan (mapping, reference and missing columns, final column
+            order), or None if the sheet cannot be enriched. Plans are cached by input
+            columns, so sheets (and daemon runs) with the same layout reuse them.
+        """
+        cache_key = (table_name, tuple(excel_columns), tuple(map(tuple, possible_reference_combinations)),
+                     tuple(column_mapping.items()) if column_mapping else ())
+        plan = self.plan_cache.get(cache_key)
+        if plan is not None:
+            logger.info(f"Reusing enrichment plan (reference columns {plan['reference_columns']})")
+            return plan
+        
+        logger.info(f"Available columns: {list(excel_columns)}")
         
         # Create column mapping for database operations (without renaming Excel columns)
         excel_to_db_mapping = {}
         if column_mapping:
-            excel_columns_list = list(df_excel.columns)
+            excel_columns_list = list(excel_columns)
             for mapping_key, db_col in column_mapping.items():
-                if mapping_key in df_excel.columns:
+                if mapping_key in excel_columns_list:
                     excel_to_db_mapping[mapping_key] = db_col
                 else:
                     matched_col = self.find_column_case_insensitive(mapping_key, excel_columns_list)
@@ -600,12 +2283,11 @@ class DataEnricher:
                         logger.info(f"Matched '{mapping_key}' (from config) to '{matched_col}' (in Excel) - case-insensitive match")
             logger.info(f"Created mapping for {len(excel_to_db_mapping)} columns")
         
-        # Create a temporary DataFrame with mapped column names for reference detection
-        df_temp = df_excel.copy()
+        # Detect reference columns on the mapped column names (no data needs to be copied)
+        df_temp = pd.DataFrame(columns=list(excel_columns))
         if excel_to_db_mapping:
             df_temp = df_temp.rename(columns=excel_to_db_mapping)
         
-        # Dynamically detect reference columns using mapped names
         reference_columns = self.detect_reference_columns(df_temp, possible_reference_combinations)
         
         if not reference_columns:
@@ -614,143 +2296,909 @@ class DataEnricher:
         
         logger.info(f"Using reference columns: {reference_columns}")
         
+        # Resolve the Excel column holding each reference column once, not per row
+        reference_excel_columns = []
+        for ref_col in reference_columns:
+            excel_col = None
+            for excel_name, db_name in excel_to_db_mapping.items():
+                if db_name == ref_col:
+                    excel_col = excel_name
+                    break
+            reference_excel_columns.append(excel_col if excel_col is not None else ref_col)
+        
         # Get database columns
         all_db_columns = self.get_all_columns(table_name)
         if not all_db_columns:
             logger.error("Failed to get database columns")
             return None
         
-        # Define specific columns to fetch from database
-        target_columns = [
-            'Taxable_Amount', 'NonTaxable_Amount', 'Cgst_Total', 'Sgst_Total', 'Igst_Total',
-            'Booking_Date', 'GST_Name', 'GST_Number', 'Invoice_Number', 'Invoice_Total_GST',
-            'Airline_Gst_Number', 'Airline_Gst_Name'
-        ]
+        # Find which target columns are missing from Excel data
+        missing_columns = [col for col in TARGET_COLUMNS if col not in excel_columns]
+        
+        # Apply column rename mapping to every output column it covers
+        output_columns = list(excel_columns) + missing_columns
+        rename_dict = {db_col: display_name for db_col, display_name in COLUMN_RENAME_MAP.items()
+                       if db_col in output_columns}
+        missing_columns_display = [rename_dict.get(col, col) for col in missing_columns]
         
-        # Column rename mapping: database column name -> display name
-        column_rename_map = {
-            'Booking_Date': 'Booking Date',
-            'GST_Name': 'GST Name',
-            'GST_Number': 'GST Number',
-            'Invoice_Total_GST': 'TOTAL GST',
-            'Cgst_Total': 'CGST',
-            'Sgst_Total': 'SGST',
-            'Igst_Total': 'IGST',
-            'Airline_Gst_Number': 'Airline GST Number',
-            'Airline_Gst_Name': 'Airline GST Name'
+        plan = {
+            "excel_to_db_mapping": excel_to_db_mapping,
+            "reference_columns": reference_columns,
+            "reference_excel_columns": reference_excel_columns,
+            "missing_columns": missing_columns,
+            "rename_dict": rename_dict,
+            "final_column_order": list(excel_columns) + missing_columns_display
         }
+        self.plan_cache[cache_key] = plan
+        return plan
+    
+    def _prepared_cursor(self, conn, query: str):
+        """Prepared cursor for `query` on `conn`, reused while the connection's session lives."""
+        statements = self._statements.setdefault(conn.connection_id, OrderedDict())
+        cursor = statements.get(query)
+        if cursor is not None:
+            statements.move_to_end(query)
+            with self._stats_lock:
+                self.statement_cache_hits += 1
+            return cursor
+        cursor = conn.cursor(prepared=True)
+        statements[query] = cursor
+        if len(statements) > PREPARED_STATEMENT_CACHE_SIZE:
+            _, evicted = statements.popitem(last=False)
+            evicted.close()
+        self.debug_log(f"Prepared new lookup statement on connection {conn.connection_id}")
+        return cursor
+    
+    def _invalidate_connection_cache(self, conn):
+        """Forget cached columns and prepared statements after a failure on `conn`."""
+        self.schema_cache.clear()
+        try:
+            self._statements.pop(conn.connection_id, None)
+        except mysql_connector.Error:
+            pass
+    
+    def _lookup_query(self, plan: Dict, table_name: str, key_count: int) -> str:
+        """SQL for looking up `key_count` keys, built once per statement shape."""
+        reference_columns = plan["reference_columns"]
+        shape = (table_name, tuple(reference_columns), tuple(plan["missing_columns"]), key_count)
+        query = self._lookup_sql.get(shape)
+        if query is None:
+            ref_cols_str = ', '.join([f"`{c}`" for c in reference_columns])
+            missing_columns_str = ', '.join([f"`{col}`" for col in plan["missing_columns"]])
+            row = "(" + ", ".join(["%s"] * len(reference_columns)) + ")"
+            query = (
+                f"SELECT {ref_cols_str}, {missing_columns_str} "
+                f"FROM `{table_name}` "
+                f"WHERE ({ref_cols_str}) IN ({', '.join([row] * key_count)})"
+            )
+            self._lookup_sql[shape] = query
+        return query
+    
+    def _query_lookup(self, unique_keys: List[tuple], plan: Dict, table_name: str,
+                      connection=None) -> List[Dict]:
+        """Fetch the missing columns for a list of distinct reference keys in one query."""
+        if PREPARED_STATEMENTS:
+            # Pad to a power-of-two key count so a few statement shapes cover every batch;
+            # repeating the last key in the IN list does not change the result
+            key_slots = 1 << (len(unique_keys) - 1).bit_length()
+            if key_slots * len(plan["reference_columns"]) <= MAX_PREPARED_PARAMS:
+                padded = list(unique_keys) + [unique_keys[-1]] * (key_slots - len(unique_keys))
+                params = [v for key in padded for v in key]
+                return self.execute_query_with_retry(self._lookup_query(plan, table_name, key_slots),
+                                                     params, connection, prepared=True)
+        params = [v for key in unique_keys for v in key]
+        return self.execute_query_with_retry(self._lookup_query(plan, table_name, len(unique_keys)),
+                                             params, connection)
+    
+    def _next_key_batch(self, unique_keys: List[tuple], start: int) -> List[tuple]:
+        """
+        Take up to lookup_batch_size keys from start, stopping early if the query
+        would no longer fit comfortably inside the server's max_allowed_packet.
+        """
+        budget = self.max_allowed_packet // 2
+        batch = []
+        estimated_bytes = QUERY_OVERHEAD_BYTES
+        for key in unique_keys[start:start + self.lookup_batch_size]:
+            # Quoted, escaped value plus the "(..., ...), " row constructor around it
+            key_bytes = sum(len(str(v)) + 4 for v in key) + 4
+            if batch and estimated_bytes + key_bytes > budget:
+                break
+            batch.append(key)
+            estimated_bytes += key_bytes
+        return batch
+    
+    def _adapt_batch_size(self, keys_sent: int, elapsed: float):
+        """Grow or shrink lookup_batch_size towards the configured query latency target."""
+        if not ADAPTIVE_BATCHING_ENABLED or elapsed <= 0:
+            return
+        with self._stats_lock:
+            current = self.lookup_batch_size
+            target = TARGET_QUERY_LATENCY_MS / 1000.0
+            if elapsed > target:
+                # Too slow: shrink in proportion, but never by more than half per step
+                new_size = max(int(current * target / elapsed), current // 2)
+            elif keys_sent >= current:
+                # A full batch came back under target: grow, at most doubling per step
+                new_size = int(current * min(target / elapsed, 2.0))
+            else:
+                return
+            new_size = max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, new_size))
+            if new_size != current:
+                self.debug_log(f"Batch size {current} -> {new_size} ({keys_sent} keys took {elapsed * 1000:.0f} ms)")
+                self.lookup_batch_size = new_size
+    
+    def use_temp_table(self, key_count: int) -> bool:
+        """Decide between the row-constructor IN list and the temporary-table JOIN."""
+        if LOOKUP_STRATEGY == "temp_table":
+            return True
+        if LOOKUP_STRATEGY == "auto":
+            return key_count >= TEMP_TABLE_THRESHOLD
+        return False
+    
+    def _reference_column_lengths(self, cursor, table_name: str, reference_columns: List[str]) -> List[Optional[int]]:
+        """Character limit of each reference column (None for non-text columns), cached per table."""
+        lengths = self.column_lengths.get(table_name)
+        if lengths is None:
+            cursor.execute("SELECT COLUMN_NAME, CHARACTER_MAXIMUM_LENGTH FROM information_schema.COLUMNS "
+                           "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table_name,))
+            lengths = {row["COLUMN_NAME"]: row["CHARACTER_MAXIMUM_LENGTH"] for row in cursor.fetchall()}
+            self.column_lengths[table_name] = lengths
+        return [lengths.get(col) for col in reference_columns]
+    
+    def _fetch_via_temp_table(self, unique_keys: List[tuple], plan: Dict, table_name: str) -> Optional[List[Dict]]:
+        """
+        Bulk-insert the keys into a session TEMPORARY TABLE and fetch the enrichment
+        with a single indexed JOIN, instead of a long row-constructor IN list that
+        MySQL tends to plan as a range or full scan.
         
-        # Find which target columns are missing from Excel data
-        missing_columns = [col for col in target_columns if col not in df_excel.columns]
+        Keys longer than their column cannot match and are not inserted. Only a lost
+        connection is retried; any other error (type mismatch, server refusing the
+        temporary table) returns None so the caller falls back to IN-list batches.
+        The JOIN is recorded with the query profiler like any other lookup query.
+        """
+        reference_columns = plan["reference_columns"]
+        temp_table = "tmp_lookup_keys"
+        ref_cols_str = ', '.join(f"`{c}`" for c in reference_columns)
+        select_str = ', '.join(f"t.`{c}`" for c in reference_columns + plan["missing_columns"])
+        join_str = ' AND '.join(f"t.`{c}` = k.`{c}`" for c in reference_columns)
+        insert = (f"INSERT INTO `{temp_table}` ({ref_cols_str}) "
+                  f"VALUES ({', '.join(['%s'] * len(reference_columns))})")
+        join_query = f"SELECT {select_str} FROM `{temp_table}` k JOIN `{table_name}` t ON {join_str}"
+        
+        connection = self._sheet_connection()
+        retries = 0
+        reconnects = 0
+        for attempt in range(MAX_RETRIES):
+            conn = connection if connection is not None else self.connection
+            start = time.perf_counter()
+            try:
+                cursor = conn.cursor(dictionary=True)
+                lengths = self._reference_column_lengths(cursor, table_name, reference_columns)
+                keys = [key for key in unique_keys
+                        if all(limit is None or len(str(value)) <= limit for value, limit in zip(key, lengths))]
+                if len(keys) < len(unique_keys):
+                    logger.info(f"{len(unique_keys) - len(keys)} keys are longer than their column "
+                                f"and cannot match; not sent")
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{temp_table}`")
+                # Copy the column definitions (types, collations) of the reference columns
+                cursor.execute(f"CREATE TEMPORARY TABLE `{temp_table}` AS "
+                               f"SELECT {ref_cols_str} FROM `{table_name}` LIMIT 0")
+                cursor.execute(f"ALTER TABLE `{temp_table}` ADD INDEX `idx_lookup_keys` ({ref_cols_str})")
+                for offset in range(0, len(keys), TEMP_TABLE_INSERT_CHUNK):
+                    cursor.executemany(insert, keys[offset:offset + TEMP_TABLE_INSERT_CHUNK])
+                start = time.perf_counter()
+                cursor.execute(join_query)
+                results = cursor.fetchall()
+                # Profiled before the DROP so a slow JOIN can still be explained
+                self._profile_query(conn, join_query, None, results, time.perf_counter() - start,
+                                    retries, reconnects)
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{temp_table}`")
+                cursor.close()
+                return results
+            except mysql_connector.Error as e:
+                if conn.is_connected():
+                    # Retrying the same statements would fail the same way
+                    logger.warning(f"Temporary-table lookup failed: {e}")
+                    self._profile_query(conn, join_query, None, None, time.perf_counter() - start,
+                                        retries, reconnects)
+                    return None
+                logger.warning(f"Temporary-table lookup lost its connection (attempt {attempt + 1}): {e}")
+                if attempt < MAX_RETRIES - 1:
+                    retries += 1
+                    reconnects += 1
+                    time.sleep(1)
+                    # The temporary table is rebuilt from scratch on the next attempt
+                    logger.info("Reconnecting to database...")
+                    if connection is None:
+                        self.connect()
+                    else:
+                        try:
+                            connection.reconnect(attempts=MAX_RETRIES, delay=1)
+                        except mysql_connector.Error as reconnect_error:
+                            logger.warning(f"Pooled connection reconnect failed: {reconnect_error}")
+                else:
+                    logger.error("Temporary-table lookup failed after all retries")
+                    self._profile_query(conn, join_query, None, None, time.perf_counter() - start,
+                                        retries, reconnects)
+                    return None
+    
+    def _fetch_lookup_rows(self, unique_keys: List[tuple], plan: Dict, table_name: str) -> List[Dict]:
+        """
+        Look up distinct keys in batches sized by _next_key_batch, adapting after each query.
+        A lookup backend that is not batched gets every key in one call.
+        """
+        source = self.source
+        if not source.batched:
+            results = source.lookup(unique_keys, plan["reference_columns"], plan["missing_columns"], table_name)
+            logger.info(f"Looked up {len(unique_keys)} distinct keys in the {source.name} backend")
+            return results
+        
+        if source.temp_tables and self.use_temp_table(len(unique_keys)):
+            start = time.perf_counter()
+            results = self._fetch_via_temp_table(unique_keys, plan, table_name)
+            self._count_query()
+            if results is not None:
+                logger.info(f"Looked up {len(unique_keys)} distinct keys with a temporary-table JOIN "
+                            f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+                return results
+            logger.warning(f"Falling back to IN-list batches for {len(unique_keys)} keys")
+        
+        # Sheet threads already hold one pooled connection each and query on it serially
+        if self.pool is not None and QUERY_WORKERS > 1 and self._sheet_connection() is None:
+            return self._fetch_lookup_rows_concurrently(unique_keys, plan, table_name)
+        
+        results = []
+        position = 0
+        query_count = 0
+        while position < len(unique_keys):
+            batch_keys = self._next_key_batch(unique_keys, position)
+            start = time.perf_counter()
+            results.extend(source.lookup(batch_keys, plan["reference_columns"], plan["missing_columns"], table_name))
+            elapsed = time.perf_counter() - start
+            query_count += 1
+            self._count_query()
+            logger.info(f"Queried keys {position + 1}-{position + len(batch_keys)} of {len(unique_keys)} "
+                        f"in {elapsed * 1000:.0f} ms")
+            self._adapt_batch_size(len(batch_keys), elapsed)
+            position += len(batch_keys)
+        logger.info(f"Looked up {len(unique_keys)} distinct keys in {query_count} queries "
+                    f"(batch size now {self.lookup_batch_size}{self._statement_cache_note()})")
+        return results
+    
+    def _statement_cache_note(self) -> str:
+        if not PREPARED_STATEMENTS or self.source is not self.mysql:
+            return ""
+        return f", {self.statement_cache_hits} prepared statement cache hits so far"
+    
+    def _sheet_connection(self):
+        """Pooled connection borrowed by the current sheet thread, if any."""
+        return getattr(self._thread_state, "connection", None)
+    
+    def _count_query(self):
+        with self._stats_lock:
+            self.query_count += 1
+    
+    def _query_lookup_pooled(self, batch_keys: List[tuple], plan: Dict, table_name: str):
+        """Run one batch query on a connection borrowed from the pool; returns (rows, seconds)."""
+        connection = self.pool.get_connection()
+        try:
+            start = time.perf_counter()
+            rows = self._query_lookup(batch_keys, plan, table_name, connection)
+            return rows, time.perf_counter() - start
+        finally:
+            connection.close()  # returns it to the pool
+    
+    def _fetch_lookup_rows_concurrently(self, unique_keys: List[tuple], plan: Dict, table_name: str) -> List[Dict]:
+        """
+        Keep up to QUERY_WORKERS batch queries in flight on pooled connections. Batches
+        are cut as workers free up, so adaptive sizing still applies; results are merged
+        back in batch order.
+        """
+        results_by_batch = {}
+        in_flight = {}
+        position = 0
+        batch_index = 0
+        with ThreadPoolExecutor(max_workers=QUERY_WORKERS) as executor:
+            while position < len(unique_keys) or in_flight:
+                while position < len(unique_keys) and len(in_flight) < QUERY_WORKERS:
+                    batch_keys = self._next_key_batch(unique_keys, position)
+                    future = executor.submit(self._query_lookup_pooled, batch_keys, plan, table_name)
+                    in_flight[future] = (batch_index, position, len(batch_keys))
+                    batch_index += 1
+                    position += len(batch_keys)
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, start, key_count = in_flight.pop(future)
+                    rows, elapsed = future.result()
+                    results_by_batch[index] = rows
+                    self._count_query()
+                    logger.info(f"Queried keys {start + 1}-{start + key_count} of {len(unique_keys)} "
+                                f"in {elapsed * 1000:.0f} ms")
+                    self._adapt_batch_size(key_count, elapsed)
+        
+        logger.info(f"Looked up {len(unique_keys)} distinct keys in {batch_index} queries "
+                    f"across {QUERY_WORKERS} pooled connections (batch size now {self.lookup_batch_size}"
+                    f"{self._statement_cache_note()})")
+        return [row for index in sorted(results_by_batch) for row in results_by_batch[index]]
+    
+    def begin_run_cache(self):
+        """
+        Start resolving each distinct reference key at most once until end_run_cache().
+        A cache carried over from the previous run by retain_run_cache() is kept.
+        """
+        if self.run_lookup_cache is None:
+            self.run_lookup_cache = {}
+            self.run_cache_started = time.monotonic()
+    
+    def end_run_cache(self):
+        """Drop the run-wide lookup cache."""
+        self.run_lookup_cache = None
+        self.run_cache_started = None
+    
+    def retain_run_cache(self, max_keys: int):
+        """
+        Keep the run cache's database rows for the next run (daemon mode). Keys that
+        matched no row are dropped, since the row may exist by the next run; beyond
+        max_keys, the earliest fetched keys go first.
+        """
+        if self.run_lookup_cache is None:
+            return
+        total = 0
+        for known in self.run_lookup_cache.values():
+            for key in [key for key, row in known.items() if row is None]:
+                del known[key]
+            total += len(known)
+        excess = total - max_keys
+        for known in self.run_lookup_cache.values():
+            while excess > 0 and known:
+                del known[next(iter(known))]
+                excess -= 1
+    
+    def _resolve_keys(self, unique_keys: List[tuple], plan: Dict, table_name: str) -> List[Dict]:
+        """
+        Return database rows (reference + missing columns) for the given distinct keys.
+        Keys already in the run cache or the persistent lookup cache are not queried;
+        when caching, all available target columns are fetched so any later sheet can
+        be served from the cache.
+        """
+        if self.run_lookup_cache is None and self.lookup_cache is None:
+            return self._fetch_lookup_rows(unique_keys, plan, table_name)
+        
+        reference_columns = plan["reference_columns"]
+        waiting = []
+        with self._run_cache_lock:
+            shared = self.run_lookup_cache is not None
+            if shared:
+                known = self.run_lookup_cache.setdefault(tuple(reference_columns), {})
+            else:
+                known = {}
+            # Keys another sheet thread is already fetching are waited on, not fetched twice
+            pending = []
+            for key in unique_keys:
+                if key in known:
+                    continue
+                in_flight = self._keys_in_flight.get((tuple(reference_columns), key)) if shared else None
+                if in_flight is not None:
+                    waiting.append(in_flight)
+                else:
+                    pending.append(key)
+            claim, claimed = threading.Event(), list(pending)
+            if shared:
+                for key in claimed:
+                    self._keys_in_flight[(tuple(reference_columns), key)] = claim
+        
+        try:
+            if pending and self.lookup_cache is not None:
+                cached_rows = self.lookup_cache.get_many(reference_columns, pending)
+                with self._run_cache_lock:
+                    known.update(cached_rows)
+                pending = [key for key in pending if key not in cached_rows]
+                logger.info(f"Lookup cache: {len(cached_rows)} hits, {len(pending)} misses")
+            
+            if pending:
+                fetch_plan = dict(plan, missing_columns=self._cacheable_columns(table_name))
+                pending_set = set(pending)
+                fetched = {}
+                for row in self._fetch_lookup_rows(pending, fetch_plan, table_name):
+                    key = tuple(row[c] for c in reference_columns)
+                    if key in pending_set and key not in fetched:
+                        fetched[key] = row
+                # Keys are published only once the fetch is complete; None means no match
+                with self._run_cache_lock:
+                    for key in pending:
+                        known[key] = fetched.get(key)
+                if self.lookup_cache is not None and fetched:
+                    self.lookup_cache.put_many(reference_columns, fetched)
+        finally:
+            if shared:
+                with self._run_cache_lock:
+                    for key in claimed:
+                        self._keys_in_flight.pop((tuple(reference_columns), key), None)
+            claim.set()
+        
+        for in_flight in set(waiting):
+            in_flight.wait()
+        with self._run_cache_lock:
+            unresolved = [key for key in unique_keys if key not in known]
+        if unresolved:
+            # The thread that claimed these keys failed; look them up here instead
+            self._resolve_keys(unresolved, plan, table_name)
+        
+        results = []
+        for key in unique_keys:
+            row = known.get(key)
+            if row is not None:
+                result = dict(zip(reference_columns, key))
+                result.update({col: row.get(col) for col in plan["missing_columns"]})
+                results.append(result)
+        return results
+    
+    def _cacheable_columns(self, table_name: str) -> List[str]:
+        """Target columns that exist in the table (what cached rows carry)."""
+        db_columns = set(self.get_all_columns(table_name))
+        return [col for col in TARGET_COLUMNS if col in db_columns]
+    
+    def collect_reference_keys(self, df_excel: pd.DataFrame, table_name: str,
+                               possible_reference_combinations: List[List[str]],
+                               column_mapping: Dict[str, str]):
+        """
+        Return (reference columns, distinct keys) for a sheet without querying anything,
+        or None if the sheet has nothing to look up.
+        """
+        plan = self._prepare_enrichment(list(df_excel.columns), table_name,
+                                        possible_reference_combinations, column_mapping)
+        if plan is None or not plan["missing_columns"]:
+            return None
+        keys, valid = self._build_key_frame(df_excel.reset_index(drop=True), plan)
+        valid_keys = keys[valid]
+        unique_keys = list(dict.fromkeys(zip(*(valid_keys[c].tolist() for c in plan["reference_columns"]))))
+        return plan["reference_columns"], unique_keys
+    
+    def planned_query_count(self, unique_keys: List[tuple]) -> int:
+        """
+        Lookup queries _fetch_lookup_rows would send for these keys with no cache, at the
+        current batch size (what query_count counts; an unbatched backend sends none).
+        """
+        source = self.source
+        if not unique_keys or not source.batched:
+            return 0
+        if source.temp_tables and self.use_temp_table(len(unique_keys)):
+            return 1
+        queries = 0
+        position = 0
+        while position < len(unique_keys):
+            position += len(self._next_key_batch(unique_keys, position))
+            queries += 1
+        return queries
+    
+    def prefetch_keys(self, reference_columns: List[str], unique_keys: List[tuple], table_name: str):
+        """Resolve a run's distinct keys into the run cache ahead of enrichment."""
+        plan = {"reference_columns": reference_columns, "missing_columns": []}
+        self._resolve_keys(unique_keys, plan, table_name)
+    
+    def _build_key_frame(self, df_excel: pd.DataFrame, plan: Dict):
+        """
+        Return (keys, valid): the reference key columns under their database names as
+        object dtype, and a mask of rows whose key has no empty component.
+        """
+        keys = pd.DataFrame({
+            ref_col: df_excel[excel_col].astype(object).values
+            for ref_col, excel_col in zip(plan["reference_columns"], plan["reference_excel_columns"])
+        })
+        valid = pd.Series(True, index=keys.index)
+        for ref_col in plan["reference_columns"]:
+            column = keys[ref_col]
+            empty = column.isna()
+            is_text = column.map(lambda v: isinstance(v, str))
+            if is_text.any():
+                empty |= is_text & (column.where(is_text, 'x').str.strip() == '')
+            valid &= ~empty
+        return keys, valid
+    
+    def _enrich_frame(self, df_excel: pd.DataFrame, plan: Dict, table_name: str):
+        """
+        Enrich a DataFrame column-wise: build keys vectorized, query the distinct keys,
+        collect the results into one lookup DataFrame and attach the missing columns with
+        a single left merge that keeps the original row order.
+        
+        Returns:
+            (enriched DataFrame, match count, no-match count)
+        """
+        reference_columns = plan["reference_columns"]
+        missing_columns = plan["missing_columns"]
+        df_excel = df_excel.reset_index(drop=True)
+        
+        with stage_timer(self.metrics, "key_build", rows=len(df_excel)) as counts:
+            keys, valid = self._build_key_frame(df_excel, plan)
+            valid_keys = keys[valid]
+            
+            # Every distinct key in the frame is looked up once, in adaptively sized batches
+            key_tuples = zip(*(valid_keys[c].tolist() for c in reference_columns))
+            unique_keys = list(dict.fromkeys(key_tuples))
+            counts["keys"] = len(unique_keys)
+        
+        with stage_timer(self.metrics, "db_query", keys=len(unique_keys)) as counts:
+            results = self._resolve_keys(unique_keys, plan, table_name) if unique_keys else []
+            counts["rows_returned"] = len(results)
+        
+        with stage_timer(self.metrics, "assemble", rows=len(df_excel)) as counts:
+            # First database row wins for each key
+            lookup = pd.DataFrame(results, columns=reference_columns + missing_columns).astype(object)
+            lookup = lookup.drop_duplicates(subset=reference_columns, keep='first')
+            
+            merged = valid_keys.merge(lookup, on=reference_columns, how='left', indicator=True, sort=False)
+            merged.index = valid_keys.index
+            matched = merged['_merge'] == 'both'
+            
+            df_enriched = df_excel.copy()
+            enrichment = merged[missing_columns].reindex(df_excel.index)
+            for col in missing_columns:
+                df_enriched[col] = enrichment[col].values
+            
+            match_count = int(matched.sum())
+            no_match_count = len(df_excel) - match_count
+            counts["matched"] = match_count
+            
+            if plan["rename_dict"]:
+                df_enriched = df_enriched.rename(columns=plan["rename_dict"])
+            return df_enriched[plan["final_column_order"]], match_count, no_match_count
+    
+    def _enrich_single_dataframe(self, df_excel: pd.DataFrame, table_name: str,
+                                 possible_reference_combinations: List[List[str]],
+                                 column_mapping: Dict[str, str], label: str = None) -> Optional[pd.DataFrame]:
+        """
+        Helper method to enrich a single DataFrame. With a `label` (a whole sheet or
+        file, not a streamed chunk) the result goes through the dtype policy.
+        """
+        logger.info(f"Processing {len(df_excel)} rows...")
+        
+        plan = self._prepare_enrichment(list(df_excel.columns), table_name,
+                                        possible_reference_combinations, column_mapping)
+        if plan is None:
+            return None
+        
+        missing_columns = plan["missing_columns"]
         if not missing_columns:
             logger.info("All target columns already present in Excel data")
             return df_excel
         
         logger.info(f"Will fetch {len(missing_columns)} target columns from database: {missing_columns}")
         
-        # Process data in batches
-        enriched_data = []
-        match_count = 0
-        no_match_count = 0
+        df_enriched, match_count, no_match_count = self._enrich_frame(df_excel, plan, table_name)
+        if label is not None:
+            df_enriched = self.apply_dtype_policy(df_enriched, f"{label} (enriched)")
         
-        for batch_start in range(0, len(df_excel), BATCH_SIZE):
-            batch_end = min(batch_start + BATCH_SIZE, len(df_excel))
-            batch_df = df_excel.iloc[batch_start:batch_end]
-            
-            logger.info(f"Processing batch {batch_start//BATCH_SIZE + 1}: rows {batch_start + 1}-{batch_end}")
+        logger.info(f"Sheet processing complete: {len(df_enriched)} rows, {match_count} matches, {no_match_count} no matches")
+        
+        return df_enriched
+
+    def _enrich_sheet(self, sheet_name: str, df_sheet: pd.DataFrame, table_name: str,
+                      possible_reference_combinations: List[List[str]],
+                      column_mapping: Dict[str, str], file_path: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """
+        Enrich one sheet, on its own pooled connection when a pool is available.
+        `file_path` attributes the sheet's metrics when it runs on a worker thread.
+        """
+        logger.info(f"Processing sheet: {sheet_name}")
+        label = f"sheet '{sheet_name}'"
+        with metrics_scope(self.metrics, file_path, sheet_name):
+            if self.pool is None:
+                return self._enrich_single_dataframe(df_sheet, table_name, possible_reference_combinations,
+                                                     column_mapping, label)
             
-            # Build composite keys per row
-            row_keys = {}
-            rows_with_missing_refs = set()
-            for idx, row in batch_df.iterrows():
-                key_values = []
-                valid = True
-                for ref_col in reference_columns:
-                    excel_col = None
-                    for excel_name, db_name in excel_to_db_mapping.items():
-                        if db_name == ref_col:
-                            excel_col = excel_name
-                            break
-                    if excel_col is None:
-                        excel_col = ref_col
-                    value = row[excel_col]
-                    if self.is_empty_value(value):
-                        valid = False
-                        break
-                    key_values.append(value)
-                if valid:
-                    row_keys[idx] = tuple(key_values)
+            self._thread_state.connection = self.pool.get_connection()
+            try:
+                return self._enrich_single_dataframe(df_sheet, table_name, possible_reference_combinations,
+                                                     column_mapping, label)
+            finally:
+                self._thread_state.connection.close()  # returns it to the pool
+                self._thread_state.connection = None
+    
+    def _enrich_sheets(self, data: Dict[str, pd.DataFrame], table_name: str,
+                       possible_reference_combinations: List[List[str]],
+                       column_mapping: Dict[str, str]) -> Dict[str, pd.DataFrame]:
+        """
+        Enrich every sheet of a workbook, up to SHEET_WORKERS at a time. Concurrent sheets
+        need a connection each, so this requires pooled connections or a lookup backend.
+        The returned dict keeps the workbook's sheet order.
+        """
+        workers = min(SHEET_WORKERS, len(data))
+        if workers > 1 and not self.source.concurrent:
+            logger.warning("Parallel sheet enrichment needs pooled connections (concurrency.pooled); "
+                           "enriching sheets one at a time")
+            workers = 1
+        
+        if workers <= 1:
+            enriched_sheets = {}
+            for sheet_name, df_sheet in data.items():
+                logger.info(f"Processing sheet: {sheet_name}")
+                with metrics_scope(self.metrics, sheet=sheet_name):
+                    df_enriched = self._enrich_single_dataframe(
+                        df_sheet, table_name, possible_reference_combinations, column_mapping, f"sheet '{sheet_name}'"
+                    )
+                if df_enriched is not None:
+                    enriched_sheets[sheet_name] = df_enriched
+            return enriched_sheets
+        
+        logger.info(f"Enriching {len(data)} sheets with {workers} threads")
+        file_path = self.metrics.current_scope()[0] if self.metrics is not None else None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                sheet_name: executor.submit(self._enrich_sheet, sheet_name, df_sheet, table_name,
+                                            possible_reference_combinations, column_mapping, file_path)
+                for sheet_name, df_sheet in data.items()
+            }
+            # Collect in submission order so sheets are written in the workbook's order
+            enriched = {sheet_name: future.result() for sheet_name, future in futures.items()}
+        return {sheet_name: df for sheet_name, df in enriched.items() if df is not None}
+    
+    def infer_csv_dtypes(self, csv_path: str, chunk_size: int) -> Dict[str, str]:
+        """
+        Scan a CSV chunk by chunk and return the numeric dtype a whole-file read would
+        settle on for every column that is numeric in all chunks. Pinning these keeps
+        chunked output identical to the in-memory path (e.g. an int column with a blank
+        cell in only one chunk is float everywhere, as it is when read in one go).
+        """
+        chunk_dtypes = {}
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            for col, dtype in chunk.dtypes.items():
+                chunk_dtypes.setdefault(col, set()).add(dtype)
+        
+        pinned = {}
+        for col, dtypes in chunk_dtypes.items():
+            if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+                if any(pd.api.types.is_float_dtype(d) for d in dtypes):
+                    pinned[col] = 'float64'
                 else:
-                    rows_with_missing_refs.add(idx)
-
-            unique_keys = list(dict.fromkeys(row_keys.values()))
-
-            if unique_keys:
-                ref_cols_str = ', '.join([f"`{c}`" for c in reference_columns])
-                missing_columns_str = ', '.join([f"`{col}`" for col in missing_columns])
-                placeholders = ', '.join(["(" + ", ".join(["%s"] * len(reference_columns)) + ")" for _ in unique_keys])
-                query = (
-                    f"SELECT {ref_cols_str}, {missing_columns_str} "
-                    f"FROM `{table_name}` "
-                    f"WHERE ({ref_cols_str}) IN ({placeholders})"
+                    pinned[col] = 'int64'
+        return pinned
+    
+    def enrich_csv_streaming(self, csv_path: str, table_name: str,
+                             possible_reference_combinations: List[List[str]],
+                             column_mapping: Dict[str, str], output_path: str,
+                             chunk_size: int = None) -> Optional[int]:
+        """
+        Enrich a CSV in fixed-size chunks, appending each enriched chunk to the output CSV.
+        Peak memory is bounded by the chunk size rather than the file size.
+        
+        Returns:
+            int: Number of rows written, or None if enrichment failed
+        """
+        if chunk_size is None:
+            chunk_size = CSV_CHUNK_SIZE
+        
+        logger.info(f"Streaming CSV {csv_path} in chunks of {chunk_size} rows")
+        try:
+            pinned_dtypes = self.infer_csv_dtypes(csv_path, chunk_size)
+            
+            total_rows = 0
+            chunk_count = 0
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=pinned_dtypes):
+                # Remove unnamed columns (columns that start with "Unnamed:")
+                unnamed_cols = [col for col in chunk.columns if str(col).startswith('Unnamed:')]
+                if unnamed_cols:
+                    chunk = chunk.drop(columns=unnamed_cols)
+                    if chunk_count == 0:
+                        logger.info(f"Removed {len(unnamed_cols)} unnamed columns: {unnamed_cols}")
+                
+                chunk_count += 1
+                logger.info(f"Processing CSV chunk {chunk_count}: rows {total_rows + 1}-{total_rows + len(chunk)}")
+                df_enriched = self._enrich_single_dataframe(
+                    chunk.reset_index(drop=True), table_name, possible_reference_combinations, column_mapping
                 )
-                params = [v for key in unique_keys for v in key]
-                results = self.execute_query_with_retry(query, params)
-                lookup = {}
-                for r in results:
-                    key = tuple(r[c] for c in reference_columns)
-                    if key not in lookup:
-                        lookup[key] = {col: r.get(col) for col in missing_columns}
-            else:
-                lookup = {}
-
-            # Emit rows in original order
-            for idx, row in batch_df.iterrows():
-                complete_row = row.to_dict()
-                if idx in rows_with_missing_refs:
-                    for col in missing_columns:
-                        complete_row[col] = None
-                    enriched_data.append(complete_row)
-                    no_match_count += 1
-                    continue
+                if df_enriched is None:
+                    logger.error(f"Enrichment failed on chunk {chunk_count}; discarding partial output")
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                    return None
+                
+                df_enriched.to_csv(output_path, index=False,
+                                   mode='w' if chunk_count == 1 else 'a',
+                                   header=chunk_count == 1)
+                total_rows += len(df_enriched)
+            
+            if chunk_count == 0:
+                logger.warning(f"No rows found in {csv_path}")
+                return None
+            
+            logger.info(f"Data saved to: {output_path} ({total_rows} rows in {chunk_count} chunks)")
+            return total_rows
+        except Exception as e:
+            logger.error(f"Error streaming CSV {csv_path}: {e}")
+            return None
 
-                key = row_keys.get(idx)
-                if key is not None and key in lookup:
-                    for col in missing_columns:
-                        complete_row[col] = lookup[key].get(col)
-                    enriched_data.append(complete_row)
-                    match_count += 1
-                else:
-                    for col in missing_columns:
-                        complete_row[col] = None
-                    enriched_data.append(complete_row)
-                    no_match_count += 1
+    def _header_names(self, header_values) -> List[str]:
+        """Name header cells the way pandas does: blanks become 'Unnamed: N', duplicates get '.1', '.2'."""
+        names = []
+        seen = {}
+        for col_idx, value in enumerate(header_values):
+            name = f"Unnamed: {col_idx}" if self.is_empty_value(value) else value
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            names.append(name)
+        return names
+    
+    def _to_cell_value(self, value):
+        """Convert a pandas/numpy value into something openpyxl can write."""
+        if isinstance(value, pd.Timestamp):
+            return value.to_pydatetime()
+        if value is None or (not isinstance(value, str) and pd.api.types.is_scalar(value) and pd.isna(value)):
+            return None
+        if hasattr(value, 'item'):
+            return value.item()
+        return value
+    
+    def _stream_sheet(self, source_ws, output_wb, sheet_name: str, table_name: str,
+                      possible_reference_combinations: List[List[str]],
+                      column_mapping: Dict[str, str]) -> Optional[int]:
+        """
+        Stream one read-only worksheet into a write-only workbook, enriching rows in
+        batches of BATCH_SIZE. Returns the number of data rows written, or None if
+        the sheet was skipped.
+        """
+        # Detect the header row from the first rows, keeping the cells for their styles
+        preview_cells = [tuple(row) for row in source_ws.iter_rows(max_row=HEADER_SCAN_ROWS)]
+        if not preview_cells:
+            return None
+        preview_values = [[getattr(cell, 'value', None) for cell in row] for row in preview_cells]
+        header_row = self.detect_header_row(pd.DataFrame(preview_values))
+        if header_row is None:
+            header_row = 0
+        if header_row >= len(preview_cells):
+            return None
         
-        # Create final DataFrame
-        df_enriched = pd.DataFrame(enriched_data)
+        header_cells = preview_cells[header_row]
+        names = self._header_names([cell.value for cell in header_cells])
         
-        # Apply column rename mapping
-        rename_dict = {db_col: display_name for db_col, display_name in column_rename_map.items() 
-                      if db_col in df_enriched.columns}
-        if rename_dict:
-            df_enriched = df_enriched.rename(columns=rename_dict)
+        # Keep only named columns (unnamed columns are dropped as in read_file_safely)
+        kept_indices = [i for i, name in enumerate(names) if not str(name).startswith('Unnamed:')]
+        kept_names = [names[i] for i in kept_indices]
         
-        # Build final column order
-        missing_columns_display = [rename_dict.get(col, col) for col in missing_columns]
-        final_column_order = list(df_excel.columns) + missing_columns_display
-        df_enriched = df_enriched[final_column_order]
+        plan = self._prepare_enrichment(kept_names, table_name, possible_reference_combinations, column_mapping)
+        if plan is None:
+            logger.error(f"Skipping sheet '{sheet_name}': cannot be enriched")
+            return None
+        if plan["missing_columns"]:
+            logger.info(f"Will fetch {len(plan['missing_columns'])} target columns from database: {plan['missing_columns']}")
+        else:
+            logger.info("All target columns already present in Excel data")
         
-        logger.info(f"Sheet processing complete: {len(df_enriched)} rows, {match_count} matches, {no_match_count} no matches")
+        output_ws = None
+        rows_written = 0
+        match_count = 0
+        no_match_count = 0
+        batch = []
+        pending_blank_rows = []
         
-        return df_enriched
+        def flush_batch():
+            nonlocal output_ws, rows_written, match_count, no_match_count
+            if not batch:
+                return
+            batch_df = pd.DataFrame(batch, columns=kept_names)
+            if plan["missing_columns"]:
+                batch_df, batch_matches, batch_no_matches = self._enrich_frame(batch_df, plan, table_name)
+                match_count += batch_matches
+                no_match_count += batch_no_matches
+            
+            if output_ws is None:
+                output_ws = output_wb.create_sheet(title=sheet_name)
+                output_ws.append(self._styled_header(output_ws, header_cells, kept_indices,
+                                                     plan["final_column_order"]))
+            for values in batch_df.itertuples(index=False, name=None):
+                output_ws.append([self._to_cell_value(v) for v in values])
+            rows_written += len(batch_df)
+            logger.info(f"Sheet '{sheet_name}': {rows_written} rows written")
+            batch.clear()
+        
+        for values in source_ws.iter_rows(min_row=header_row + 2, values_only=True):
+            values = [
+                int(v) if isinstance(v, float) and v.is_integer() else v
+                for v in values
+            ]
+            if all(self.is_empty_value(v) for v in values):
+                # Blank rows are kept unless they trail the data, as pandas does
+                pending_blank_rows.append([None] * len(kept_indices))
+                continue
+            batch.extend(pending_blank_rows)
+            pending_blank_rows.clear()
+            batch.append([values[i] if i < len(values) else None for i in kept_indices])
+            if len(batch) >= BATCH_SIZE:
+                flush_batch()
+        flush_batch()
+        
+        if rows_written == 0:
+            return None
+        logger.info(f"Sheet processing complete: {rows_written} rows, {match_count} matches, {no_match_count} no matches")
+        return rows_written
+    
+    def _styled_header(self, output_ws, header_cells, kept_indices: List[int], column_names: List[str]) -> List:
+        """Header cells for a write-only sheet, carrying over the source header cell styles."""
+        from openpyxl.cell import WriteOnlyCell
+        source_cells = [header_cells[i] for i in kept_indices]
+        sample_cell = next((cell for cell in source_cells if cell.value), None)
+        
+        styled = []
+        for col_idx, name in enumerate(column_names):
+            source_cell = source_cells[col_idx] if col_idx < len(source_cells) else sample_cell
+            cell = WriteOnlyCell(output_ws, value=name)
+            if source_cell is not None and getattr(source_cell, 'has_style', False):
+                cell.font = copy(source_cell.font)
+                cell.fill = copy(source_cell.fill)
+                cell.border = copy(source_cell.border)
+                cell.alignment = copy(source_cell.alignment)
+            styled.append(cell)
+        return styled
+    
+    def enrich_xlsx_streaming(self, excel_path: str, table_name: str,
+                              possible_reference_combinations: List[List[str]],
+                              column_mapping: Dict[str, str], output_path: str):
+        """
+        Enrich an XLSX workbook with constant memory: rows are iterated with openpyxl
+        read_only mode, enriched in batches and streamed into a write_only workbook.
+        
+        Returns:
+            int rows written for a single sheet, Dict[str, int] per sheet for several
+            sheets, or None if nothing could be enriched
+        """
+        from openpyxl import Workbook, load_workbook
+        logger.info(f"Streaming XLSX {excel_path} with openpyxl read_only/write_only")
+        source_wb = None
+        try:
+            source_wb = load_workbook(excel_path, read_only=True, data_only=True)
+            output_wb = Workbook(write_only=True)
+            
+            sheet_rows = {}
+            for source_ws in source_wb.worksheets:
+                logger.info(f"Processing sheet: {source_ws.title}")
+                with metrics_scope(self.metrics, sheet=source_ws.title):
+                    rows = self._stream_sheet(source_ws, output_wb, source_ws.title, table_name,
+                                              possible_reference_combinations, column_mapping)
+                if rows is not None:
+                    sheet_rows[source_ws.title] = rows
+            
+            if not sheet_rows:
+                logger.error(f"No sheets could be enriched in {excel_path}")
+                return None
+            
+            output_wb.save(output_path)
+            logger.info(f"Data saved to {output_path} with {len(sheet_rows)} sheets")
+            
+            if len(sheet_rows) == 1:
+                return list(sheet_rows.values())[0]
+            return sheet_rows
+        except Exception as e:
+            logger.error(f"Error streaming XLSX {excel_path}: {e}")
+            return None
+        finally:
+            if source_wb is not None:
+                source_wb.close()
 
+    def streaming_engine(self, input_path: str, output_path: Optional[str]) -> Optional[str]:
+        """Return 'csv' or 'xlsx' if this input/output pair is handled by a streaming engine, else None."""
+        if not output_path:
+            return None
+        input_ext = os.path.splitext(input_path)[1].lower()
+        output_ext = os.path.splitext(output_path)[1].lower()
+        if CSV_STREAMING_ENABLED and input_ext == '.csv' and output_ext == '.csv':
+            return 'csv'
+        # openpyxl cannot read legacy .xls, so only .xlsx is streamed
+        if XLSX_STREAMING_ENABLED and input_ext == '.xlsx' and output_ext == '.xlsx':
+            return 'xlsx'
+        return None
+    
     def enrich_data(self, excel_path: str, table_name: str, 
                    possible_reference_combinations: List[List[str]] = None,
                    column_mapping: Dict[str, str] = None,
-                   output_path: Optional[str] = None):
+                   output_path: Optional[str] = None, data=None):
         """
         Enhanced data enrichment with dynamic column detection and batch processing.
+        `data` may carry the result of an earlier read_file_safely call to avoid re-parsing.
         Returns either pd.DataFrame (single sheet) or Dict[str, pd.DataFrame] (multiple sheets).
+        When CSV or XLSX streaming is enabled, streamed files return the number of rows
+        written (int), or a Dict[str, int] per sheet for multi-sheet workbooks.
         """
         if column_mapping is None:
             column_mapping = {}
@@ -761,74 +3209,165 @@ class DataEnricher:
         if not self.validate_file(excel_path):
             return None
         
-        # Read file
-        data = self.read_file_safely(excel_path)
+        # Stream large files instead of loading them whole
+        engine = self.streaming_engine(excel_path, output_path)
+        if engine and COLUMNAR_FORMAT:
+            logger.warning(f"{os.path.basename(excel_path)} is streamed, so no {COLUMNAR_FORMAT} copy is written "
+                           f"(turn off streaming.{engine}_enabled to get one)")
+        if engine == 'csv':
+            return self.enrich_csv_streaming(
+                excel_path, table_name, possible_reference_combinations, column_mapping, output_path
+            )
+        if engine == 'xlsx':
+            return self.enrich_xlsx_streaming(
+                excel_path, table_name, possible_reference_combinations, column_mapping, output_path
+            )
+        
+        # Read file (unless the caller already parsed it)
+        if data is None:
+            data = self.read_file_safely(excel_path)
         if data is None:
             return None
         
+        enriched = self.enrich_loaded(data, table_name, possible_reference_combinations, column_mapping)
+        if output_path and enriched is not None and not self.write_output(excel_path, output_path, enriched):
+            return None
+        return enriched
+    
+    def enrich_loaded(self, data, table_name: str, possible_reference_combinations: List[List[str]],
+                      column_mapping: Dict[str, str]):
+        """Enrich data returned by read_file_safely (a DataFrame or a dict of sheets)."""
         # Handle multiple sheets
         if isinstance(data, dict):
             logger.info(f"Processing {len(data)} separate sheets")
-            enriched_sheets = {}
-            for sheet_name, df_sheet in data.items():
-                logger.info(f"Processing sheet: {sheet_name}")
-                df_enriched = self._enrich_single_dataframe(
-                    df_sheet, table_name, possible_reference_combinations, column_mapping
-                )
-                if df_enriched is not None:
-                    enriched_sheets[sheet_name] = df_enriched
-            
-            # Save output with separate sheets
-            if output_path and enriched_sheets:
-                try:
-                    output_extension = os.path.splitext(output_path)[1].lower()
-                    if output_extension == '.csv':
-                        # For CSV, combine all sheets
-                        df_combined = pd.concat(list(enriched_sheets.values()), ignore_index=True)
-                        df_combined.to_csv(output_path, index=False)
-                        logger.info(f"Data saved to: {output_path}")
-                    else:
-                        # Save each sheet separately in Excel
-                        with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                            for sheet_name, df_enriched in enriched_sheets.items():
-                                df_enriched.to_excel(writer, sheet_name=sheet_name, index=False)
-                        logger.info(f"Data saved to {output_path} with {len(enriched_sheets)} sheets")
-                        
-                        # Apply header formatting
-                        try:
-                            self.apply_header_formatting(excel_path, output_path)
-                        except Exception as format_error:
-                            logger.warning(f"Could not apply header formatting: {format_error}")
-                except Exception as e:
-                    logger.error(f"Error saving file: {e}")
-            
+            enriched_sheets = self._enrich_sheets(data, table_name, possible_reference_combinations, column_mapping)
             return enriched_sheets if enriched_sheets else None
         
         # Handle single sheet/DataFrame
-        else:
-            df_enriched = self._enrich_single_dataframe(
-                data, table_name, possible_reference_combinations, column_mapping
-            )
-            
-            # Save output
-            if output_path and df_enriched is not None:
-                try:
-                    output_extension = os.path.splitext(output_path)[1].lower()
+        return self._enrich_single_dataframe(
+            data, table_name, possible_reference_combinations, column_mapping, "sheet"
+        )
+    
+    def write_output(self, excel_path: str, output_path: str, enriched) -> bool:
+        """
+        Save enrich_loaded output. XLSX/CSV outputs get the source header formatting and,
+        when output.columnar_format is set, a Parquet/Arrow copy next to them; a .parquet
+        or .arrow output path is written in that format only. Returns False if any of the
+        files could not be written.
+        """
+        output_extension = os.path.splitext(output_path)[1].lower()
+        with metrics_scope(self.metrics, excel_path):
+            if output_extension in COLUMNAR_EXTENSIONS.values():
+                with stage_timer(self.metrics, "write"):
+                    return self.write_columnar(output_path, enriched)
+            if not self._write_native(excel_path, output_path, enriched):
+                return False
+            if COLUMNAR_FORMAT:
+                with stage_timer(self.metrics, "write"):
+                    return self.write_columnar(
+                        os.path.splitext(output_path)[0] + COLUMNAR_EXTENSIONS[COLUMNAR_FORMAT], enriched
+                    )
+            return True
+    
+    def _write_native(self, excel_path: str, output_path: str, enriched) -> bool:
+        """Save enrich_loaded output as CSV or XLSX and copy the source header formatting onto it."""
+        try:
+            output_extension = os.path.splitext(output_path)[1].lower()
+            frames = list(enriched.values()) if isinstance(enriched, dict) else [enriched]
+            with stage_timer(self.metrics, "write", rows=sum(len(df) for df in frames)):
+                if isinstance(enriched, dict):
                     if output_extension == '.csv':
-                        df_enriched.to_csv(output_path, index=False)
+                        # For CSV, combine all sheets
+                        df_combined = pd.concat(list(enriched.values()), ignore_index=True)
+                        df_combined.to_csv(output_path, index=False)
                         logger.info(f"Data saved to: {output_path}")
-                    else:
-                        df_enriched.to_excel(output_path, index=False, engine='openpyxl')
+                        return True
+                    if SINGLE_PASS_XLSX and self.write_xlsx_single_pass(excel_path, output_path, enriched):
+                        return True
+                    # Save each sheet separately in Excel
+                    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+                        for sheet_name, df_enriched in enriched.items():
+                            df_enriched.to_excel(writer, sheet_name=sheet_name, index=False)
+                    logger.info(f"Data saved to {output_path} with {len(enriched)} sheets")
+                else:
+                    if output_extension == '.csv':
+                        enriched.to_csv(output_path, index=False)
                         logger.info(f"Data saved to: {output_path}")
-                        
-                        try:
-                            self.apply_header_formatting(excel_path, output_path)
-                        except Exception as format_error:
-                            logger.warning(f"Could not apply header formatting: {format_error}")
-                except Exception as e:
-                    logger.error(f"Error saving file: {e}")
+                        return True
+                    if SINGLE_PASS_XLSX and self.write_xlsx_single_pass(excel_path, output_path, {"Sheet1": enriched}):
+                        return True
+                    enriched.to_excel(output_path, index=False, engine='openpyxl')
+                    logger.info(f"Data saved to: {output_path}")
             
-            return df_enriched
+            # Apply header formatting
+            with stage_timer(self.metrics, "header_format", sheets=len(frames)):
+                try:
+                    self.apply_header_formatting(excel_path, output_path)
+                except Exception as format_error:
+                    logger.warning(f"Could not apply header formatting: {format_error}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving file: {e}")
+            return False
+    
+    @staticmethod
+    def _arrow_table(df: pd.DataFrame):
+        """Typed Arrow table for a frame; object columns pyarrow cannot type as one kind become strings."""
+        import pyarrow as pa
+        arrays = []
+        for col_idx in range(df.shape[1]):
+            series = df.iloc[:, col_idx]
+            try:
+                arrays.append(pa.array(series, from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                arrays.append(pa.array(
+                    [None if pd.isna(v) else str(v) for v in series], type=pa.string()
+                ))
+        return pa.Table.from_arrays(arrays, names=[str(name) for name in df.columns])
+    
+    def write_columnar(self, output_path: str, enriched) -> bool:
+        """
+        Write enriched data as Parquet or Arrow IPC (by the extension of output_path).
+        Multiple sheets go into one file with a sheet_name column, or with
+        output.columnar_layout 'per_sheet' into a directory named output_path holding
+        one file per sheet.
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logger.error("Parquet/Arrow output needs pyarrow: pip install pyarrow")
+            return False
+        
+        extension = os.path.splitext(output_path)[1].lower()
+        
+        def write_table(frame: pd.DataFrame, path: str):
+            table = self._arrow_table(frame)
+            if extension == '.parquet':
+                pq.write_table(table, path)
+            else:
+                with pa.ipc.new_file(path, table.schema) as writer:
+                    writer.write_table(table)
+        
+        try:
+            if not isinstance(enriched, dict):
+                write_table(enriched, output_path)
+            elif COLUMNAR_LAYOUT == "per_sheet":
+                os.makedirs(output_path, exist_ok=True)
+                for sheet_name, df_sheet in enriched.items():
+                    safe_name = "".join(c if c.isalnum() or c in " -_." else "_" for c in sheet_name)
+                    write_table(df_sheet, os.path.join(output_path, f"{safe_name}{extension}"))
+            else:
+                combined = pd.concat(
+                    [df_sheet.assign(**{SHEET_COLUMN: sheet_name}) for sheet_name, df_sheet in enriched.items()],
+                    ignore_index=True
+                )
+                write_table(combined[[SHEET_COLUMN] + [c for c in combined.columns if c != SHEET_COLUMN]], output_path)
+            logger.info(f"Data saved to: {output_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving {extension} output {output_path}: {e}")
+            return False
 
 
 class SFTPDownloader:
@@ -843,6 +3382,7 @@ class SFTPDownloader:
         self.sftp_client = None
     
     def connect(self) -> bool:
+        import paramiko
         try:
             self.ssh_client = paramiko.SSHClient()
             self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
@@ -882,7 +3422,123 @@ class SFTPDownloader:
         except Exception as e:
             logger.error(f"Failed to download file: {e}")
             return None
-
+    
+    def list_remote_files(self, remote_dir: str, pattern: str = "*") -> List[paramiko.SFTPAttributes]:
+        """Regular files in `remote_dir` whose names match the glob `pattern`."""
+        return sorted(
+            (attr for attr in self.sftp_client.listdir_attr(remote_dir)
+             if stat.S_ISREG(attr.st_mode or 0) and fnmatch.fnmatch(attr.filename, pattern)),
+            key=lambda attr: attr.filename
+        )
+    
+    @staticmethod
+    def is_unchanged(attr: paramiko.SFTPAttributes, local_path: str) -> bool:
+        """True when the local copy has the remote file's size and mtime."""
+        try:
+            local = os.stat(local_path)
+        except FileNotFoundError:
+            return False
+        return local.st_size == attr.st_size and int(local.st_mtime) == attr.st_mtime
+    
+    def _fetch(self, sftp_client: paramiko.SFTPClient, remote_path: str,
+               attr: paramiko.SFTPAttributes, local_path: str) -> str:
+        """
+        Copy one remote file into `local_path` via `local_path.part`. Before any byte is
+        transferred, a `local_path.part.json` marker records the remote size and mtime,
+        so a partial file left by an interrupted or killed transfer of the same remote
+        version is resumed from its current size; anything else is downloaded from the
+        start. The finished file gets the remote mtime so the next sync can skip it.
+        """
+        part_path = local_path + ".part"
+        marker_path = part_path + ".json"
+        version = {"size": attr.st_size, "mtime": attr.st_mtime}
+        offset = 0
+        if os.path.exists(part_path):
+            try:
+                with open(marker_path, encoding="utf-8") as f:
+                    marker = json.load(f)
+            except (OSError, ValueError):
+                marker = None
+            part_size = os.path.getsize(part_path)
+            if marker == version and part_size <= attr.st_size:
+                offset = part_size
+                logger.info(f"Resuming {remote_path} at byte {offset} of {attr.st_size}")
+        if not offset:
+            with open(marker_path, "w", encoding="utf-8") as f:
+                json.dump(version, f)
+        
+        with sftp_client.open(remote_path, 'rb') as remote_file, \
+                open(part_path, 'ab' if offset else 'wb') as local_file:
+            remote_file.seek(offset)
+            remote_file.prefetch(attr.st_size)
+            while True:
+                chunk = remote_file.read(SFTP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                local_file.write(chunk)
+        
+        size = os.path.getsize(part_path)
+        if size != attr.st_size:
+            raise IOError(f"Incomplete transfer of {remote_path}: {size} of {attr.st_size} bytes")
+        os.utime(part_path, (attr.st_atime or attr.st_mtime, attr.st_mtime))
+        os.replace(part_path, local_path)
+        os.remove(marker_path)
+        return local_path
+    
+    def sync_directory(self, remote_dir: str, local_dir: str, pattern: str = "*",
+                       max_channels: int = 4) -> List[str]:
+        """
+        Download new or changed files matching `pattern` from `remote_dir` into `local_dir`,
+        using up to `max_channels` SFTP channels on the existing SSH connection. Files whose
+        local copy has the same size and mtime are skipped.
+        
+        Returns:
+            Local paths of the files downloaded in this call
+        """
+        try:
+            os.makedirs(local_dir, exist_ok=True)
+            remote_files = self.list_remote_files(remote_dir, pattern)
+        except Exception as e:
+            logger.error(f"Failed to list remote directory {remote_dir}: {e}")
+            return []
+        
+        pending = [attr for attr in remote_files
+                   if not self.is_unchanged(attr, os.path.join(local_dir, attr.filename))]
+        logger.info(f"SFTP sync: {len(remote_files)} remote files match '{pattern}', "
+                    f"{len(remote_files) - len(pending)} unchanged, {len(pending)} to download")
+        if not pending:
+            return []
+        
+        # Each worker thread takes a channel from the pool for the duration of one file
+        channels = queue.Queue()
+        for _ in range(max(1, min(max_channels, len(pending)))):
+            channels.put(self.ssh_client.open_sftp())
+        
+        def download(attr: paramiko.SFTPAttributes) -> Optional[str]:
+            remote_path = f"{remote_dir.rstrip('/')}/{attr.filename}"
+            local_path = os.path.join(local_dir, attr.filename)
+            channel = channels.get()
+            try:
+                start = time.perf_counter()
+                self._fetch(channel, remote_path, attr, local_path)
+                logger.info(f"Downloaded {remote_path} ({attr.st_size} bytes) "
+                            f"in {time.perf_counter() - start:.2f}s")
+                return local_path
+            except Exception as e:
+                logger.error(f"Failed to download {remote_path}: {e}")
+                return None
+            finally:
+                channels.put(channel)
+        
+        try:
+            with ThreadPoolExecutor(max_workers=channels.qsize()) as executor:
+                downloaded = [path for path in executor.map(download, pending) if path]
+        finally:
+            while not channels.empty():
+                channels.get().close()
+        
+        logger.info(f"SFTP sync downloaded {len(downloaded)} of {len(pending)} files")
+        return downloaded
 
 
 class EmailSender:
@@ -900,6 +3556,11 @@ class EmailSender:
     
     def send_email(self, processing_result: Dict, log_file_path: Optional[str] = None, output_files: Optional[List[str]] = None) -> bool:
         """Send email notification with processing results."""
+        import smtplib
+        from email import encoders
+        from email.mime.base import MIMEBase
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
         if not self.enabled:
             logger.info("Email notifications are disabled")
             return False
@@ -922,7 +3583,7 @@ class EmailSender:
             # Attach processed output files
             if output_files:
                 for file_path in output_files:
-                    if file_path and os.path.exists(file_path):
+                    if file_path and os.path.isfile(file_path):
                         try:
                             with open(file_path, 'rb') as attachment:
                                 part = MIMEBase('application', 'octet-stream')
@@ -1006,6 +3667,7 @@ class EmailSender:
                 .file-item {{ padding: 5px; margin: 5px 0; }}
                 .success {{ color: green; }}
                 .error {{ color: red; }}
+                .skipped {{ color: gray; }}
             </style>
         </head>
         <body>
@@ -1021,6 +3683,21 @@ class EmailSender:
                     <p><strong>Files Processed Successfully:</strong> {processed}</p>
                     <p><strong>Errors:</strong> {errors}</p>
                     <p><strong>Total Files:</strong> {len(results)}</p>
+        """
+        
+        if "skipped" in result:
+            html += f"""
+                    <p><strong>Skipped (unchanged since last run):</strong> {result["skipped"]}</p>
+            """
+        
+        key_dedup = result.get("key_dedup")
+        if key_dedup:
+            html += f"""
+                    <p><strong>Database Queries:</strong> {key_dedup.get("queries", 0)}
+                    ({key_dedup.get("queries_saved", 0)} saved by run-wide key deduplication)</p>
+            """
+        
+        html += """
                 </div>
         """
         
@@ -1032,7 +3709,7 @@ class EmailSender:
             for res in results:
                 file_name = os.path.basename(res.get("file", "Unknown"))
                 file_status = res.get("status", "unknown")
-                status_class = "success" if file_status == "success" else "error"
+                status_class = file_status if file_status in ("success", "skipped") else "error"
                 
                 html += f"""
                     <div class="file-item">
@@ -1046,6 +3723,9 @@ class EmailSender:
                     if output:
                         html += f"<br>Output: {os.path.basename(output)}"
                 
+                if file_status == "skipped" and res.get("output"):
+                    html += f"<br>Previous output: {os.path.basename(res['output'])}"
+                
                 if file_status in ["failed", "error"]:
                     error_msg = res.get("error", "Unknown error")
                     html += f"<br>Error: {error_msg}"
@@ -1072,149 +3752,518 @@ class AutomatedProcessor:
         self.table_name = table_name
         self.column_mapping = column_mapping
         self.possible_reference_combinations = possible_reference_combinations
+        ensure_configured()
         self.file_processor = FileProcessor(INPUT_DIRECTORY, OUTPUT_DIRECTORY, SUPPORTED_EXTENSIONS)
         self.is_running = False
         self.email_sender = EmailSender(EMAIL_CONFIG)
+        self.warm_enricher = None  # DataEnricher kept open across runs in daemon mode
+    
+    @staticmethod
+    def _row_count(result) -> int:
+        """Row count of an enrichment result (streamed files report an int instead of a DataFrame)."""
+        return result if isinstance(result, int) else len(result)
     
-    def process_all_files(self) -> Dict[str, any]:
-        """Process all files in the input directory."""
+    def process_all_files(self, force: bool = False) -> Dict[str, any]:
+        """
+        Process all files in the input directory. With the processing manifest enabled,
+        files unchanged since their last successful run are skipped unless `force` is set.
+        With metrics enabled, a JSON run report and a Prometheus textfile are written
+        next to the outputs.
+        """
+        metrics = RunMetrics() if METRICS_ENABLED else None
+        result = self._process_all_files(force, metrics)
+        if metrics is not None:
+            metrics.write_reports(result, METRICS_CONFIG.get("report_dir") or OUTPUT_DIRECTORY,
+                                  METRICS_CONFIG.get("prometheus_file", "data_merge.prom"))
+        return result
+    
+    def _process_all_files(self, force: bool, metrics: Optional[RunMetrics]) -> Dict[str, any]:
         logger.info("Starting automated file processing...")
         
         # Optional SFTP prefetch before discovering files
-        try:
-            if SFTP_CONFIG.get("enabled"):
-                sftp_local_dir = SFTP_CONFIG.get("local_download_dir", INPUT_DIRECTORY)
-                remote_path = SFTP_CONFIG.get("remote_file_path")
-                if remote_path:
-                    logger.info("SFTP prefetch enabled - attempting download from remote_file_path")
-                    sftp = SFTPDownloader(
-                        host=SFTP_CONFIG.get("host"),
-                        port=SFTP_CONFIG.get("port", 22),
-                        username=SFTP_CONFIG.get("username"),
-                        password=SFTP_CONFIG.get("password")
-                    )
-                    if sftp.connect():
-                        try:
-                            downloaded = sftp.download_file(remote_path=remote_path, local_dir=sftp_local_dir)
-                            if downloaded:
-                                logger.info(f"SFTP file available at: {downloaded}")
-                            else:
-                                logger.warning("SFTP download did not produce a file")
-                        finally:
-                            sftp.disconnect()
+        with stage_timer(metrics, "sftp_fetch", files=0) as counts:
+            try:
+                if SFTP_CONFIG.get("enabled"):
+                    sftp_local_dir = SFTP_CONFIG.get("local_download_dir", INPUT_DIRECTORY)
+                    remote_dir = SFTP_CONFIG.get("remote_dir")
+                    remote_path = SFTP_CONFIG.get("remote_file_path")
+                    if remote_dir or remote_path:
+                        sftp = SFTPDownloader(
+                            host=SFTP_CONFIG.get("host"),
+                            port=SFTP_CONFIG.get("port", 22),
+                            username=SFTP_CONFIG.get("username"),
+                            password=SFTP_CONFIG.get("password")
+                        )
+                        if sftp.connect():
+                            try:
+                                if remote_dir:
+                                    logger.info(f"SFTP prefetch enabled - syncing {remote_dir}")
+                                    counts["files"] = len(sftp.sync_directory(
+                                        remote_dir=remote_dir,
+                                        local_dir=sftp_local_dir,
+                                        pattern=SFTP_CONFIG.get("remote_pattern", "*"),
+                                        max_channels=SFTP_CONFIG.get("max_channels", 4)
+                                    ))
+                                else:
+                                    logger.info("SFTP prefetch enabled - attempting download from remote_file_path")
+                                    downloaded = sftp.download_file(remote_path=remote_path, local_dir=sftp_local_dir)
+                                    if downloaded:
+                                        counts["files"] = 1
+                                        logger.info(f"SFTP file available at: {downloaded}")
+                                    else:
+                                        logger.warning("SFTP download did not produce a file")
+                            finally:
+                                sftp.disconnect()
+                        else:
+                            logger.error("Skipping SFTP download due to connection failure")
                     else:
-                        logger.error("Skipping SFTP download due to connection failure")
-                else:
-                    logger.info("SFTP enabled but no 'remote_file_path' provided; skipping download")
-        except Exception as e:
-            logger.error(f"SFTP prefetch error: {e}")
-        
-        # Discover files
-        files_to_process = self.file_processor.discover_files()
+                        logger.info("SFTP enabled but no 'remote_dir' or 'remote_file_path' provided; skipping download")
+            except Exception as e:
+                logger.error(f"SFTP prefetch error: {e}")
         
-        if not files_to_process:
-            logger.info("No files found to process")
-            return {"status": "no_files", "processed": 0, "errors": 0}
+        with stage_timer(metrics, "discovery", files=0, skipped=0) as counts:
+            # Discover files
+            files_to_process = self.file_processor.discover_files()
+            
+            if not files_to_process:
+                logger.info("No files found to process")
+                return {"status": "no_files", "processed": 0, "errors": 0}
+            
+            # Skip inputs already processed with the same content
+            manifest = None
+            fingerprints = {}
+            skipped = []
+            if MANIFEST_ENABLED:
+                manifest = ProcessingManifest(
+                    MANIFEST_CONFIG.get("path") or os.path.join(OUTPUT_DIRECTORY, "processing_manifest.json")
+                )
+                for file_path in list(files_to_process):
+                    try:
+                        unchanged, fingerprints[file_path] = manifest.check(file_path)
+                    except OSError as e:
+                        logger.warning(f"Could not fingerprint {file_path}: {e}")
+                        continue
+                    if unchanged and not force:
+                        files_to_process.remove(file_path)
+                        skipped.append({
+                            "file": file_path,
+                            "status": "skipped",
+                            "output": manifest.output_for(file_path)
+                        })
+                if skipped:
+                    logger.info(f"Skipping {len(skipped)} unchanged files (already processed; use --force to redo)")
+                if not files_to_process:
+                    manifest.save()
+                    return {"status": "no_changes", "processed": 0, "errors": 0, "skipped": len(skipped),
+                            "results": skipped}
+            counts["files"] = len(files_to_process)
+            counts["skipped"] = len(skipped)
         
-        # Initialize enricher
-        enricher = DataEnricher(**self.db_config, debug_mode=DEBUG_MODE, debug_id=DEBUG_ID)
+        # Initialize enricher (the daemon reuses its warm one)
+        enricher = self.warm_enricher
+        if enricher is not None:
+            enricher.reset_run_state()
+        else:
+            enricher = DataEnricher(**self.db_config, debug_mode=DEBUG_MODE, debug_id=DEBUG_ID)
+        enricher.metrics = metrics
         
         processed_count = 0
         error_count = 0
         results = []
         
         try:
-            # Connect to database
-            if not enricher.connect():
+            # Connect to database (or open the local snapshot/backend for offline runs)
+            if enricher is self.warm_enricher:
+                connected = self.check_warm_state()
+                enricher.begin_run_cache()
+            else:
+                connected = enricher.open_lookup()
+            if not connected:
                 logger.error("Failed to connect to database")
                 return {"status": "db_error", "processed": 0, "errors": len(files_to_process)}
             
+            # Generate output paths
+            os.makedirs(self.file_processor.output_directory, exist_ok=True)
+            output_extension = COLUMNAR_EXTENSIONS[COLUMNAR_FORMAT] if COLUMNAR_FORMAT and COLUMNAR_ONLY else None
+            output_paths = {file_path: self.file_processor.get_output_path(file_path, output_extension)
+                            for file_path in files_to_process}
+            
+            parallel = PARALLEL_FILES and FILE_WORKERS > 1 and len(files_to_process) > 1
+            pipelined = not parallel and PIPELINE_ENABLED and len(files_to_process) > 1
+            
+            # Resolve every distinct reference key of the run once, up front. Worker processes
+            # and the pipeline's reader parse files themselves, so only the serial path keeps
+            # parsed files for reuse
+            preloaded = {}
+            if RUN_KEY_DEDUP:
+                enricher.begin_run_cache()
+                preloaded, dedup_stats = self.prefetch_run_keys(
+                    enricher, files_to_process, output_paths,
+                    keep_bytes=0 if parallel or pipelined else PREFETCH_KEEP_BYTES
+                )
+            
             # Process each file
-            for file_path in files_to_process:
-                try:
-                    logger.info(f"Processing file: {file_path}")
-                    
-                    # Generate output path
-                    output_path = self.file_processor.get_output_path(file_path)
-                    
-                    # Enrich data
-                    df_result = enricher.enrich_data(
-                        excel_path=file_path,
-                        table_name=self.table_name,
-                        possible_reference_combinations=self.possible_reference_combinations,
-                        column_mapping=self.column_mapping,
-                        output_path=output_path
-                    )
-                    
-                    if df_result is not None:
-                        processed_count += 1
-                        logger.info(f"Successfully processed: {file_path}")
-                        
-                        # Note: Original file is kept in place, not moved
-                        
-                        # Handle both DataFrame and dict (multiple sheets)
-                        if isinstance(df_result, dict):
-                            total_rows = sum(len(df) for df in df_result.values())
-                            sheets_info = {name: len(df) for name, df in df_result.items()}
-                            results.append({
-                                "file": file_path,
-                                "status": "success",
-                                "rows": total_rows,
-                                "sheets": len(df_result),
-                                "sheets_info": sheets_info,
-                                "output": output_path
-                            })
-                        else:
-                            results.append({
-                                "file": file_path,
-                                "status": "success",
-                                "rows": len(df_result),
-                                "output": output_path
-                            })
-                    else:
-                        error_count += 1
-                        logger.error(f"Failed to process: {file_path}")
-                        results.append({
-                            "file": file_path,
-                            "status": "failed",
-                            "error": "Processing failed"
-                        })
-                        
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"Error processing {file_path}: {e}")
-                    results.append({
-                        "file": file_path,
-                        "status": "error",
-                        "error": str(e)
-                    })
+            if parallel:
+                results = self.process_files_parallel(enricher, files_to_process, output_paths, preloaded)
+            elif pipelined:
+                results = self.process_files_pipelined(enricher, files_to_process, output_paths, preloaded)
+            else:
+                for file_path in files_to_process:
+                    results.append(self.process_file(
+                        enricher, file_path, output_paths[file_path], self.table_name,
+                        self.possible_reference_combinations, self.column_mapping,
+                        data=preloaded.pop(file_path, None)
+                    ))
+            
+            processed_count = sum(1 for res in results if res["status"] == "success")
+            error_count = len(results) - processed_count
+            
+            if manifest is not None:
+                for res in results:
+                    if res["status"] == "success" and res["file"] in fingerprints:
+                        manifest.record(res["file"], fingerprints[res["file"]], res["output"])
+                manifest.save()
             
         except Exception as e:
             logger.error(f"Critical error during processing: {e}")
             return {"status": "critical_error", "processed": processed_count, "errors": error_count}
         
         finally:
-            enricher.disconnect()
+            if enricher is self.warm_enricher:
+                enricher.retain_run_cache(DAEMON_CONFIG.get("max_cached_keys", 200000))
+            else:
+                enricher.end_run_cache()
+                enricher.disconnect()
+            if metrics is not None:
+                metrics.queries = enricher.query_count
+                if enricher.query_profiler is not None:
+                    metrics.query_profile = enricher.query_profiler.summary()
         
         # Log summary
         logger.info(f"Processing complete: {processed_count} successful, {error_count} errors")
+        if enricher.query_profiler is not None:
+            enricher.query_profiler.log_summary()
         
         result = {
             "status": "completed",
             "processed": processed_count,
             "errors": error_count,
-            "results": results
+            "results": results + skipped
         }
+        if manifest is not None:
+            result["skipped"] = len(skipped)
+        
+        if RUN_KEY_DEDUP:
+            dedup_stats["queries"] = enricher.query_count
+            dedup_stats["queries_saved"] = max(0, dedup_stats["queries_without_dedup"] - enricher.query_count)
+            result["key_dedup"] = dedup_stats
+            logger.info(f"Run-wide key deduplication: {dedup_stats['distinct_keys']} distinct keys "
+                        f"out of {dedup_stats['sheet_keys']} per-sheet keys, {enricher.query_count} queries sent "
+                        f"instead of {dedup_stats['queries_without_dedup']}, "
+                        f"{dedup_stats['queries_saved']} queries saved")
         
         # Send email notification
         if EMAIL_CONFIG.get("enabled", False):
             log_file_path = f"data_merge_{datetime.now().strftime('%Y%m%d')}.log"
             # Collect all output file paths from successful processing
             output_files = [res.get("output") for res in results if res.get("status") == "success" and res.get("output")]
-            self.email_sender.send_email(result, log_file_path, output_files)
+            with stage_timer(metrics, "email", attachments=len(output_files)):
+                self.email_sender.send_email(result, log_file_path, output_files)
         
         return result
     
+    @staticmethod
+    def process_file(enricher: DataEnricher, file_path: str, output_path: str, table_name: str,
+                     possible_reference_combinations: List[List[str]], column_mapping: Dict[str, str],
+                     data=None) -> Dict:
+        """Enrich one file and return its entry for the run results."""
+        try:
+            logger.info(f"Processing file: {file_path}")
+            
+            # Enrich data
+            with metrics_scope(enricher.metrics, file_path):
+                df_result = enricher.enrich_data(
+                    excel_path=file_path,
+                    table_name=table_name,
+                    possible_reference_combinations=possible_reference_combinations,
+                    column_mapping=column_mapping,
+                    output_path=output_path,
+                    data=data
+                )
+            
+            return AutomatedProcessor._result_entry(file_path, output_path, df_result)
+        
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            return {
+                "file": file_path,
+                "status": "error",
+                "error": str(e)
+            }
+    
+    @staticmethod
+    def _result_entry(file_path: str, output_path: str, df_result) -> Dict:
+        """Build the results entry for a file from what enrich_data returned."""
+        if df_result is None:
+            logger.error(f"Failed to process: {file_path}")
+            return {
+                "file": file_path,
+                "status": "failed",
+                "error": "Processing failed"
+            }
+        
+        logger.info(f"Successfully processed: {file_path}")
+        
+        # Note: Original file is kept in place, not moved
+        
+        # Handle both DataFrame and dict (multiple sheets)
+        if isinstance(df_result, dict):
+            return {
+                "file": file_path,
+                "status": "success",
+                "rows": sum(AutomatedProcessor._row_count(df) for df in df_result.values()),
+                "sheets": len(df_result),
+                "sheets_info": {name: AutomatedProcessor._row_count(df) for name, df in df_result.items()},
+                "output": output_path
+            }
+        return {
+            "file": file_path,
+            "status": "success",
+            "rows": AutomatedProcessor._row_count(df_result),
+            "output": output_path
+        }
+    
+    def process_files_pipelined(self, enricher: DataEnricher, files_to_process: List[str],
+                                output_paths: Dict[str, str], preloaded: Dict) -> List[Dict]:
+        """
+        Run files through reader -> lookup -> writer threads joined by bounded queues, so
+        file N+1 is parsed while file N is looked up and file N-1 is written. Only the
+        lookup stage touches the database connection. Streamed files are handled whole by
+        the lookup stage. Per-stage busy time is logged to show the bottleneck.
+        """
+        read_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        write_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        done = object()
+        stop_reading = threading.Event()  # set when the lookup stage stops taking files
+        stage_seconds = {"read": 0.0, "lookup": 0.0, "write": 0.0}
+        results = []
+        
+        def timed(stage: str, file_path: str, func, *args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                stage_seconds[stage] += elapsed
+                logger.info(f"[{stage}] {os.path.basename(file_path)}: {elapsed:.2f}s")
+        
+        def put_read(item) -> bool:
+            """Queue an item for the lookup stage; False once it has stopped taking them."""
+            while not stop_reading.is_set():
+                try:
+                    read_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def read_stage():
+            try:
+                for file_path in files_to_process:
+                    if enricher.streaming_engine(file_path, output_paths[file_path]):
+                        item = (file_path, None, True)
+                    else:
+                        try:
+                            data = preloaded.pop(file_path, None)
+                            if data is None and enricher.validate_file(file_path):
+                                data = timed("read", file_path, enricher.read_file_safely, file_path)
+                            item = (file_path, data, False)
+                        except Exception as e:
+                            item = (file_path, e, False)
+                    if not put_read(item):
+                        return
+            finally:
+                put_read(done)
+        
+        def write_stage():
+            while True:
+                item = write_queue.get()
+                if item is done:
+                    return
+                file_path, enriched, entry = item
+                if entry is None:
+                    output_path = output_paths[file_path]
+                    try:
+                        if enriched is not None and not timed("write", file_path, enricher.write_output,
+                                                              file_path, output_path, enriched):
+                            enriched = None
+                        entry = self._result_entry(file_path, output_path, enriched)
+                    except Exception as e:
+                        logger.error(f"Error processing {file_path}: {e}")
+                        entry = {"file": file_path, "status": "error", "error": str(e)}
+                results.append(entry)
+        
+        wall_start = time.perf_counter()
+        reader = threading.Thread(target=read_stage, name="pipeline-read", daemon=True)
+        writer = threading.Thread(target=write_stage, name="pipeline-write", daemon=True)
+        reader.start()
+        writer.start()
+        try:
+            # Lookup stage runs here, on the thread that owns the enricher's connection
+            while True:
+                item = read_queue.get()
+                if item is done:
+                    break
+                file_path, data, streamed = item
+                logger.info(f"Processing file: {file_path}")
+                if streamed:
+                    entry = self.process_file(enricher, file_path, output_paths[file_path], self.table_name,
+                                              self.possible_reference_combinations, self.column_mapping)
+                    write_queue.put((file_path, None, entry))
+                elif isinstance(data, Exception):
+                    logger.error(f"Error processing {file_path}: {data}")
+                    write_queue.put((file_path, None, {"file": file_path, "status": "error", "error": str(data)}))
+                elif data is None:
+                    write_queue.put((file_path, None, None))
+                else:
+                    try:
+                        with metrics_scope(enricher.metrics, file_path):
+                            enriched = timed("lookup", file_path, enricher.enrich_loaded, data, self.table_name,
+                                             self.possible_reference_combinations, self.column_mapping)
+                        write_queue.put((file_path, enriched, None))
+                    except Exception as e:
+                        logger.error(f"Error processing {file_path}: {e}")
+                        write_queue.put((file_path, None, {"file": file_path, "status": "error", "error": str(e)}))
+        finally:
+            # If the lookup loop ended early, the reader may be blocked on the full queue
+            stop_reading.set()
+            while True:
+                try:
+                    read_queue.get_nowait()
+                except queue.Empty:
+                    break
+            reader.join()
+            write_queue.put(done)
+            writer.join()
+        
+        wall = time.perf_counter() - wall_start
+        bottleneck = max(stage_seconds, key=stage_seconds.get)
+        logger.info(f"Pipeline finished {len(files_to_process)} files in {wall:.2f}s; busy time "
+                    + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_seconds.items())
+                    + f" (bottleneck: {bottleneck})")
+        return results
+    
+    def process_files_parallel(self, enricher: DataEnricher, files_to_process: List[str],
+                               output_paths: Dict[str, str], preloaded: Dict) -> List[Dict]:
+        """
+        Spread files across a process pool with one DataEnricher connection per worker.
+        Workers start from the run cache already resolved by `enricher`; results come
+        back in input order, and worker queries are added to `enricher.query_count`
+        (worker stage timings to `enricher.metrics`, query samples to its profiler).
+        """
+        workers = min(FILE_WORKERS, len(files_to_process))
+        logger.info(f"Processing {len(files_to_process)} files across {workers} worker processes")
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_file_worker,
+                                 initargs=(self.db_config, enricher.run_lookup_cache,
+                                           enricher.metrics is not None, CONFIG_PATH)) as executor:
+            futures = [
+                executor.submit(_process_file_in_worker, file_path, output_paths[file_path], self.table_name,
+                                self.possible_reference_combinations, self.column_mapping,
+                                preloaded.pop(file_path, None))
+                for file_path in files_to_process
+            ]
+            results = []
+            for file_path, future in zip(files_to_process, futures):
+                try:
+                    entry, query_count, metric_records, query_samples = future.result()
+                    enricher.query_count += query_count
+                    if enricher.metrics is not None:
+                        enricher.metrics.merge(metric_records)
+                    if enricher.query_profiler is not None:
+                        enricher.query_profiler.merge(query_samples)
+                except Exception as e:
+                    logger.error(f"Error processing {file_path}: {e}")
+                    entry = {"file": file_path, "status": "error", "error": str(e)}
+                results.append(entry)
+        return results
+    
+    def prefetch_run_keys(self, enricher: DataEnricher, files_to_process: List[str],
+                          output_paths: Dict[str, str], keep_bytes: int = 0):
+        """
+        Read every file, collect the reference keys of all sheets and resolve each distinct
+        key once into the enricher's run cache. Parsed files are kept for enrich_data while
+        they fit in keep_bytes in total; the others are let go and read again when they are
+        enriched. Streamed files are skipped here (they are never held in memory) but still
+        share the cache while they are enriched.
+        
+        Returns:
+            (parsed data per file for reuse by enrich_data, deduplication statistics)
+        """
+        preloaded = {}
+        kept_bytes = 0
+        run_keys = {}
+        sheet_keys = 0
+        sheet_queries = 0
+        files_read = 0
+        
+        for file_path in files_to_process:
+            if enricher.streaming_engine(file_path, output_paths[file_path]):
+                continue
+            if not enricher.validate_file(file_path):
+                continue
+            data = enricher.read_file_safely(file_path)
+            if data is None:
+                continue
+            files_read += 1
+            
+            sheets = data.items() if isinstance(data, dict) else [(None, data)]
+            for sheet_name, df_sheet in sheets:
+                with metrics_scope(enricher.metrics, file_path, sheet_name), \
+                        stage_timer(enricher.metrics, "key_build", rows=len(df_sheet)):
+                    collected = enricher.collect_reference_keys(
+                        df_sheet, self.table_name, self.possible_reference_combinations, self.column_mapping
+                    )
+                if collected is None:
+                    continue
+                reference_columns, unique_keys = collected
+                run_keys.setdefault(tuple(reference_columns), {}).update(dict.fromkeys(unique_keys))
+                sheet_keys += len(unique_keys)
+                # The lookup queries enriching this sheet on its own would send
+                sheet_queries += enricher.planned_query_count(unique_keys)
+            
+            if keep_bytes:
+                frames = data.values() if isinstance(data, dict) else [data]
+                size = sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+                if kept_bytes + size <= keep_bytes:
+                    preloaded[file_path] = data
+                    kept_bytes += size
+        
+        distinct_keys = sum(len(keys) for keys in run_keys.values())
+        logger.info(f"Collected {distinct_keys} distinct reference keys from {sheet_keys} per-sheet keys "
+                    f"across {files_read} files ({len(preloaded)} kept in memory for enrichment)")
+        with stage_timer(enricher.metrics, "db_query", keys=distinct_keys):
+            for reference_columns, keys in run_keys.items():
+                enricher.prefetch_keys(list(reference_columns), list(keys), self.table_name)
+        
+        stats = {
+            "distinct_keys": distinct_keys,
+            "sheet_keys": sheet_keys,
+            "queries_without_dedup": sheet_queries
+        }
+        return preloaded, stats
+    
+    def sync_snapshot(self) -> bool:
+        """Refresh the local lookup snapshot from the database."""
+        enricher = DataEnricher(**self.db_config, debug_mode=DEBUG_MODE, debug_id=DEBUG_ID)
+        try:
+            if not enricher.connect():
+                logger.error("Failed to connect to database")
+                return False
+            return enricher.sync_snapshot(self.table_name, self.possible_reference_combinations)
+        finally:
+            enricher.disconnect()
+    
     def run_scheduled_job(self):
         """Run the scheduled processing job."""
         if self.is_running:
@@ -1252,6 +4301,7 @@ class AutomatedProcessor:
     
     def start_scheduler(self):
         """Start the scheduler using time from config.json."""
+        import schedule
         schedule_time, enabled = self.get_schedule_config()
         
         if not enabled:
@@ -1265,6 +4315,121 @@ class AutomatedProcessor:
         while True:
             schedule.run_pending()
             time.sleep(1)  # Check every second for precise scheduling
+    
+    def warm_up(self) -> bool:
+        """
+        Build the daemon's long-lived DataEnricher: load pandas and openpyxl, open the
+        lookup source (connection pool, max_allowed_packet) and cache the table schema,
+        so that scheduled runs start warm.
+        """
+        import openpyxl  # noqa: F401
+        logger.info(f"Warming up (pandas {pd.__version__})")
+        self.warm_enricher = DataEnricher(**self.db_config, debug_mode=DEBUG_MODE, debug_id=DEBUG_ID)
+        if not self.warm_enricher.open_lookup():
+            logger.error("Could not open the lookup source; the daemon will retry before the next run")
+            return False
+        columns = self.warm_enricher.get_all_columns(self.table_name)
+        logger.info(f"Warm: {len(columns)} columns of {self.table_name} cached")
+        return True
+    
+    def check_warm_state(self) -> bool:
+        """Health check of the warm DataEnricher, before every daemon run and every health_check_minutes."""
+        enricher = self.warm_enricher
+        if enricher is None:
+            return False
+        healthy = enricher.check_health(
+            cache_ttl=DAEMON_CONFIG.get("lookup_cache_ttl_minutes", 1500) * 60,
+            schema_ttl=DAEMON_CONFIG.get("schema_refresh_minutes", 1440) * 60
+        )
+        cached_keys = sum(len(known) for known in (enricher.run_lookup_cache or {}).values())
+        logger.info(f"Warm state {'healthy' if healthy else 'UNHEALTHY'}: {cached_keys} cached lookup keys, "
+                    f"{len(enricher.schema_cache)} cached schemas, {len(enricher.plan_cache)} enrichment plans")
+        return healthy
+    
+    def start_daemon(self):
+        """
+        Like start_scheduler, but in one long-lived process that keeps a warm DataEnricher
+        (connection pool, schema, enrichment plans, lookup rows) across runs, checking its
+        health between runs. With daemon.interval_minutes the job runs at that interval
+        instead of daily at scheduling.time.
+        """
+        import schedule
+        schedule_time, enabled = self.get_schedule_config()
+        
+        if not enabled:
+            logger.info("Scheduling is disabled in config.json")
+            return
+        
+        self.warm_up()
+        try:
+            interval = DAEMON_CONFIG.get("interval_minutes")
+            if interval:
+                logger.info(f"Daemon running the job every {interval} minutes")
+                schedule.every(interval).minutes.do(self.run_scheduled_job)
+            else:
+                logger.info(f"Daemon running the job daily at {schedule_time} (from config.json)")
+                schedule.every().day.at(schedule_time).do(self.run_scheduled_job)
+            cache_ttl_minutes = DAEMON_CONFIG.get("lookup_cache_ttl_minutes", 1500)
+            if cache_ttl_minutes <= (interval or 24 * 60):
+                logger.warning(f"daemon.lookup_cache_ttl_minutes ({cache_ttl_minutes}) is not longer than the "
+                               f"run interval, so lookup rows will expire before every run")
+            health_check_minutes = DAEMON_CONFIG.get("health_check_minutes", 15)
+            if health_check_minutes:
+                schedule.every(health_check_minutes).minutes.do(self.check_warm_state)
+            
+            while True:
+                schedule.run_pending()
+                time.sleep(1)
+        finally:
+            self.warm_enricher.disconnect()
+            self.warm_enricher = None
+
+
+# Per-process DataEnricher used by ProcessPoolExecutor workers
+_worker_enricher = None
+
+
+def _init_file_worker(db_config: Dict, run_lookup_cache: Optional[Dict], collect_metrics: bool = False,
+                      config_path: Optional[str] = None):
+    """
+    Open this worker's DataEnricher connection (or lookup backend) and seed its run cache.
+    Forked workers inherit the parent's settings; spawned ones (Windows) load them here.
+    """
+    global _worker_enricher
+    if CONFIG is None:
+        setup_logging()
+        configure(config_path or "config.json")
+    from multiprocessing.util import Finalize
+    enricher = DataEnricher(**db_config, debug_mode=DEBUG_MODE, debug_id=DEBUG_ID, read_only_cache=True)
+    # Runs when the worker exits; forked workers leave with os._exit, which skips atexit
+    Finalize(enricher, enricher.disconnect, exitpriority=10)
+    connected = enricher.open_lookup()
+    if not connected:
+        logger.error(f"Worker {os.getpid()} failed to connect to database")
+        return
+    enricher.run_lookup_cache = run_lookup_cache
+    enricher.metrics = RunMetrics() if collect_metrics else None
+    _worker_enricher = enricher
+
+
+def _process_file_in_worker(file_path: str, output_path: str, table_name: str,
+                            possible_reference_combinations: List[List[str]],
+                            column_mapping: Dict[str, str], data=None):
+    """Process one file in a worker; returns (results entry, queries sent, metric records, query samples)."""
+    if _worker_enricher is None:
+        raise RuntimeError("Worker has no database connection")
+    queries_before = _worker_enricher.query_count
+    metrics = _worker_enricher.metrics
+    records_before = len(metrics.records) if metrics is not None else 0
+    profiler = _worker_enricher.query_profiler
+    samples_before = len(profiler.samples) if profiler is not None else 0
+    entry = AutomatedProcessor.process_file(
+        _worker_enricher, file_path, output_path, table_name,
+        possible_reference_combinations, column_mapping, data=data
+    )
+    records = metrics.records[records_before:] if metrics is not None else []
+    samples = profiler.samples[samples_before:] if profiler is not None else []
+    return entry, _worker_enricher.query_count - queries_before, records, samples
 
 
 # ====================================================================
@@ -1272,11 +4437,14 @@ class AutomatedProcessor:
 # ====================================================================
 
 if __name__ == "__main__":
-    import sys
+    setup_logging()
+    configure()
     
-    # Check command line arguments
-    if len(sys.argv) > 1:
-        mode = sys.argv[1].lower()
+    # Check command line arguments (--force reprocesses files the manifest marks unchanged)
+    force = "--force" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    if args:
+        mode = args[0].lower()
     else:
         mode = "manual"  # Default mode
     
@@ -1314,17 +4482,37 @@ if __name__ == "__main__":
         except Exception as e:
             logger.error(f"Scheduler error: {e}")
     
+    elif mode == "daemon":
+        # Scheduled runs in one warm process: connections, schema and lookups are kept between runs
+        logger.info("Starting in daemon mode")
+        try:
+            processor.start_daemon()
+        except KeyboardInterrupt:
+            logger.info("Daemon stopped by user")
+        except Exception as e:
+            logger.error(f"Daemon error: {e}")
+    
+    elif mode == "sync":
+        # Refresh the local lookup snapshot
+        logger.info("Starting lookup snapshot sync")
+        if processor.sync_snapshot():
+            print("Snapshot sync complete")
+        else:
+            print("\nERROR: Snapshot sync failed (see log for details)")
+    
     elif mode == "process":
         # Process all files once
         logger.info("Starting one-time processing of all files")
         try:
-            result = processor.process_all_files()
+            result = processor.process_all_files(force=force)
             print("\n" + "="*60)
             print("PROCESSING COMPLETE!")
             print("="*60)
             print(f"Status: {result['status']}")
             print(f"Files processed: {result['processed']}")
             print(f"Errors: {result['errors']}")
+            if 'skipped' in result:
+                print(f"Skipped (unchanged): {result['skipped']}")
             if 'results' in result:
                 print("\nDetailed Results:")
                 for res in result['results']:
@@ -1354,7 +4542,7 @@ if __name__ == "__main__":
                 print(f"Output: {output_path}")
                 
                 try:
-                    result = processor.process_all_files()
+                    result = processor.process_all_files(force=force)
                     print("\n" + "="*60)
                     print("SUCCESS!")
                     print("="*60)
@@ -0,0 +1,161 @@
+"""
+Shared fixtures: data_merge configured from the repository's config.json with a
+lookup table held in memory, and a local SFTP server (a paramiko SFTPServer serving
+a temporary directory over an in-process Transport pair), so nothing needs MySQL or
+a real server.
+"""
+import os
+import socket
+import threading
+
+import paramiko
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def dm(tmp_path, monkeypatch):
+    """data_merge configured from config.json, run from an empty working directory."""
+    import data_merge
+    data_merge.configure(os.path.join(REPO_DIR, "config.json"))
+    monkeypatch.chdir(tmp_path)
+    for name in ("METRICS_ENABLED", "QUERY_PROFILING_ENABLED", "MANIFEST_ENABLED"):
+        monkeypatch.setattr(data_merge, name, False)
+    monkeypatch.setattr(data_merge, "EMAIL_CONFIG", {})
+    return data_merge
+
+
+@pytest.fixture
+def lookup_table():
+    """Stand-in lookup table: reference key -> database row, for 300 keys."""
+    from benchmarks.common import make_table
+    return make_table(300)
+
+
+@pytest.fixture
+def make_enricher(dm, lookup_table):
+    """Build DataEnrichers serving lookups from lookup_table through a FrameLookupBackend."""
+    enrichers = []
+
+    def make(backend=None):
+        enricher = dm.DataEnricher(host="", database="", user="", password="")
+        assert enricher.load_backend(backend or dm.FrameLookupBackend(lookup_table))
+        enrichers.append(enricher)
+        return enricher
+
+    yield make
+    for enricher in enrichers:
+        enricher.disconnect()
+
+
+class StubServer(paramiko.ServerInterface):
+    """Accepts any password and opens session channels (all SFTP needs)."""
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class StubSFTPHandle(paramiko.SFTPHandle):
+    """Read handle that records the offsets it is read at."""
+
+    def __init__(self, path, reads, flags=0):
+        super().__init__(flags)
+        self.path = path
+        self.reads = reads
+        self.readfile = open(path, "rb")
+
+    def read(self, offset, length):
+        self.reads.append((os.path.basename(self.path), offset))
+        return super().read(offset, length)
+
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class StubSFTPServer(paramiko.SFTPServerInterface):
+    """Read-only SFTP view of `root`; every read offset is appended to `reads`."""
+
+    root = None
+    reads = None
+
+    def _local(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            entries = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            return StubSFTPHandle(self._local(path), self.reads, flags)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class TransportClient:
+    """The part of paramiko.SSHClient that SFTPDownloader uses, over an existing Transport."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def open_sftp(self):
+        return paramiko.SFTPClient.from_transport(self.transport)
+
+    def close(self):
+        self.transport.close()
+
+
+@pytest.fixture
+def sftp_server(tmp_path):
+    """
+    Yield (remote directory, read log, connected SFTPDownloader). Files written to the
+    remote directory are served at "/"; the read log lists (filename, offset) reads.
+    """
+    from data_merge import SFTPDownloader
+
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    reads = []
+    server_socket, client_socket = socket.socketpair()
+
+    server_transport = paramiko.Transport(server_socket)
+    server_transport.add_server_key(paramiko.RSAKey.generate(2048))
+    server_transport.set_subsystem_handler("sftp", paramiko.SFTPServer, StubSFTPServer)
+    StubSFTPServer.root, StubSFTPServer.reads = str(remote_dir), reads
+    # Negotiation needs both ends, so the server side must not block
+    server_transport.start_server(threading.Event(), server=StubServer())
+
+    client_transport = paramiko.Transport(client_socket)
+    client_transport.connect(username="test", password="test")
+
+    downloader = SFTPDownloader("localhost", 22, "test", "test")
+    downloader.ssh_client = TransportClient(client_transport)
+    downloader.sftp_client = downloader.ssh_client.open_sftp()
+    try:
+        yield remote_dir, reads, downloader
+    finally:
+        downloader.disconnect()
+        server_transport.close()
@@ -0,0 +1,40 @@
+from benchmarks.common import make_frame
+
+
+def enrich_both_ways(dm, enricher, tmp_path, frame, chunk_size):
+    """Enrich one CSV in memory and streamed in chunks; return both outputs as bytes."""
+    source = tmp_path / "input.csv"
+    frame.to_csv(source, index=False)
+    args = (dm.TABLE_NAME, dm.POSSIBLE_REFERENCE_COMBINATIONS, dm.COLUMN_MAPPING)
+
+    in_memory = tmp_path / "in_memory.csv"
+    assert enricher.enrich_data(str(source), *args, output_path=str(in_memory)) is not None
+    streamed = tmp_path / "streamed.csv"
+    assert enricher.enrich_csv_streaming(str(source), *args, output_path=str(streamed),
+                                         chunk_size=chunk_size) == len(frame)
+    return in_memory.read_bytes(), streamed.read_bytes()
+
+
+def test_streamed_csv_is_byte_identical(dm, make_enricher, tmp_path):
+    frame = make_frame(1000, 300)
+    in_memory, streamed = enrich_both_ways(dm, make_enricher(), tmp_path, frame, chunk_size=128)
+    assert streamed == in_memory
+
+
+def test_pinned_numeric_dtypes_keep_output_identical(dm, make_enricher, tmp_path):
+    frame = make_frame(1000, 300)
+    # Whole numbers with a blank in one chunk only: float in that chunk, int in the
+    # others unless infer_csv_dtypes pins the column to float64
+    quantities = [str(i) for i in range(1000)]
+    quantities[700] = ""
+    frame["Quantity"] = quantities
+    # Numeric in every chunk but int in some, float in others
+    frame["Fare"] = [str(i) if i < 500 else str(i + 0.25) for i in range(1000)]
+    enricher = make_enricher()
+
+    source = tmp_path / "input.csv"
+    frame.to_csv(source, index=False)
+    assert enricher.infer_csv_dtypes(str(source), 128) == {"S.No": "int64", "Fare": "float64",
+                                                          "Quantity": "float64"}
+    in_memory, streamed = enrich_both_ways(dm, enricher, tmp_path, frame, chunk_size=128)
+    assert streamed == in_memory
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from benchmarks.common import InMemoryEnricher, make_frame, make_table
+from benchmarks.enrich import legacy_enrich
+
+
+def as_objects(frame):
+    return frame.astype(object).where(frame.notna(), None)
+
+
+def test_enrich_frame_matches_per_row_loop(dm):
+    enricher = InMemoryEnricher(make_table(200))
+    # 2000 rows over 200 keys: every key repeats, some rows miss the table
+    df = make_frame(2000, 200)
+    # Rows with a blank reference value never match, whatever the other columns hold
+    df.loc[[3, 500, 1999], "Airline PNR"] = None
+    df.loc[[10, 1200], "Sector"] = ""
+    plan = enricher._prepare_enrichment(list(df.columns), dm.TABLE_NAME,
+                                        dm.POSSIBLE_REFERENCE_COMBINATIONS, dm.COLUMN_MAPPING)
+
+    new_df, new_matches, new_no_matches = enricher._enrich_frame(df, plan, dm.TABLE_NAME)
+    old_df, old_matches, old_no_matches = legacy_enrich(enricher, df, plan, dm.TABLE_NAME)
+
+    assert (new_matches, new_no_matches) == (old_matches, old_no_matches)
+    assert new_matches + new_no_matches == len(df)
+    assert 0 < new_matches < len(df)
+    # Same rows in the same order, and every copy of a duplicated key filled the same way
+    assert list(new_df["S.No"]) == list(df["S.No"])
+    pd.testing.assert_frame_equal(as_objects(new_df), as_objects(old_df))
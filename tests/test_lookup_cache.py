@@ -0,0 +1,72 @@
+import pytest
+
+REFS = ["PNR_Number", "Airline_Code", "Travel_Sector"]
+
+
+def key(i):
+    return (f"PNR{i:07d}", "6E", "DEL-BOM")
+
+
+@pytest.fixture
+def clock(dm, monkeypatch):
+    """Wall clock the cache sees, moved forward by the test."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(dm.time, "time", lambda: now[0])
+    return now
+
+
+def open_cache(dm, tmp_path, **limits):
+    return dm.LookupCache(str(tmp_path / "cache.sqlite"), **limits)
+
+
+def test_entries_expire_after_ttl(dm, tmp_path, clock):
+    cache = open_cache(dm, tmp_path, ttl_hours=1)
+    cache.put_many(REFS, {key(1): {"Invoice_Number": "INV1"}})
+    clock[0] += 1800
+    cache.put_many(REFS, {key(2): {"Invoice_Number": "INV2"}})
+
+    clock[0] += 1801  # key(1) is past the hour, key(2) is not
+    assert cache.get_many(REFS, [key(1), key(2)]) == {key(2): {"Invoice_Number": "INV2"}}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.purge_expired()
+    assert cache.entries == 1
+    cache.close()
+    # Reopening purges too, and the counts are read back from the file
+    clock[0] += 1800
+    cache = open_cache(dm, tmp_path, ttl_hours=1)
+    assert (cache.entries, cache.total_bytes) == (0, 0)
+    cache.close()
+
+
+def test_least_recently_accessed_entries_evicted(dm, tmp_path, clock):
+    cache = open_cache(dm, tmp_path, max_entries=3)
+    for i in range(3):
+        clock[0] += 1
+        cache.put_many(REFS, {key(i): {"Invoice_Number": f"INV{i}"}})
+    # Reading key(0) makes key(1) the least recently used
+    clock[0] += 1
+    assert key(0) in cache.get_many(REFS, [key(0)])
+
+    clock[0] += 1
+    cache.put_many(REFS, {key(3): {"Invoice_Number": "INV3"}})
+
+    assert cache.entries == 3
+    assert set(cache.get_many(REFS, [key(i) for i in range(4)])) == {key(0), key(2), key(3)}
+    cache.close()
+
+
+def test_eviction_by_bytes(dm, tmp_path, clock):
+    cache = open_cache(dm, tmp_path)
+    cache.put_many(REFS, {key(0): {"Invoice_Number": "INV0"}})
+    entry_bytes = cache.total_bytes
+    cache.close()
+
+    cache = open_cache(dm, tmp_path, max_bytes=2 * entry_bytes)
+    for i in (1, 2):
+        clock[0] += 1
+        cache.put_many(REFS, {key(i): {"Invoice_Number": f"INV{i}"}})
+
+    assert (cache.entries, cache.total_bytes) == (2, 2 * entry_bytes)
+    assert set(cache.get_many(REFS, [key(i) for i in range(3)])) == {key(1), key(2)}
+    cache.close()
@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+REFS = ["PNR_Number", "Airline_Code", "Travel_Sector"]
+
+
+class FakeConnection:
+    """
+    Answers the snapshot query from a list of rows, honouring `watermark >= %s`. Like
+    MySQL, it compares a DATETIME column with ISO text as a datetime.
+    """
+
+    def __init__(self, rows, watermark_column):
+        self.rows = rows
+        self.watermark_column = watermark_column
+        self.params = []
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, query, params):
+        self.params.append(params)
+        def at_or_past(value):
+            if isinstance(value, datetime) and isinstance(params[0], str):
+                return value >= datetime.fromisoformat(params[0])
+            return value >= params[0]
+
+        self.pending = [row for row in self.rows if not params or at_or_past(row[self.watermark_column])]
+
+    def fetchmany(self, size):
+        batch, self.pending = self.pending[:size], self.pending[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+def row(i, invoice, updated_at):
+    return {"PNR_Number": f"PNR{i:07d}", "Airline_Code": "6E", "Travel_Sector": "DEL-BOM",
+            "Invoice_Number": invoice, "Updated_At": updated_at}
+
+
+def sync(dm, snapshot, connection):
+    return snapshot.sync(connection, dm.TABLE_NAME, REFS, REFS + ["Invoice_Number", "Updated_At"])
+
+
+def loaded(dm, path):
+    snapshot = dm.LookupSnapshot(str(path), watermark_column="Updated_At")
+    assert snapshot.load()
+    return dict(zip(snapshot.frame["PNR_Number"], snapshot.frame["Invoice_Number"]))
+
+
+@pytest.fixture
+def start():
+    return datetime(2026, 1, 1, 12, 0)
+
+
+def test_incremental_sync_appends_parts(dm, tmp_path, start):
+    path = tmp_path / "snapshot.parquet"
+    snapshot = dm.LookupSnapshot(str(path), watermark_column="Updated_At", fetch_size=2)
+    rows = [row(i, f"INV{i}", start + timedelta(minutes=i)) for i in range(5)]
+    connection = FakeConnection(rows, "Updated_At")
+    assert sync(dm, snapshot, connection) == 5
+    base = path.read_bytes()
+
+    # One changed record and one new one
+    rows[1] = row(1, "INV1-v2", start + timedelta(minutes=10))
+    rows.append(row(5, "INV5", start + timedelta(minutes=11)))
+    # Plus the row at the old watermark, fetched again by the >= comparison
+    assert sync(dm, snapshot, connection) == 3
+
+    assert path.read_bytes() == base
+    assert len(snapshot._part_paths()) == 1
+    state = json.loads((tmp_path / "snapshot.parquet.state.json").read_text())
+    # Timestamps are stored as ISO text, not as a repr, and the query is sent the same value
+    assert state["watermark"] == (start + timedelta(minutes=11)).isoformat()
+    assert connection.params[-1] == [(start + timedelta(minutes=4)).isoformat()]
+    assert loaded(dm, path) == {"PNR0000000": "INV0", "PNR0000001": "INV1-v2", "PNR0000002": "INV2",
+                                "PNR0000003": "INV3", "PNR0000004": "INV4", "PNR0000005": "INV5"}
+
+
+def test_integer_watermark_stays_a_number(dm, tmp_path):
+    path = tmp_path / "snapshot.parquet"
+    snapshot = dm.LookupSnapshot(str(path), watermark_column="Updated_At")
+    sync(dm, snapshot, FakeConnection([row(i, f"INV{i}", 100 + i) for i in range(3)], "Updated_At"))
+
+    state = json.loads((tmp_path / "snapshot.parquet.state.json").read_text())
+    assert state["watermark"] == 102
+
+
+def test_parts_folded_into_snapshot(dm, tmp_path, start, monkeypatch):
+    monkeypatch.setattr(dm.LookupSnapshot, "COMPACT_AFTER_PARTS", 2)
+    path = tmp_path / "snapshot.parquet"
+    snapshot = dm.LookupSnapshot(str(path), watermark_column="Updated_At")
+    rows = [row(0, "INV0", start)]
+    connection = FakeConnection(rows, "Updated_At")
+    sync(dm, snapshot, connection)
+    for version in range(1, 4):
+        rows[0] = row(0, f"INV0-v{version}", start + timedelta(minutes=version))
+        sync(dm, snapshot, connection)
+        assert len(snapshot._part_paths()) == (0 if version == 3 else version)
+
+    assert loaded(dm, path) == {"PNR0000000": "INV0-v3"}
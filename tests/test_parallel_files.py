@@ -0,0 +1,59 @@
+import re
+
+import pandas as pd
+
+from benchmarks.common import make_frame, make_table, seed_sqlite_table
+
+
+def without_timestamp(path):
+    """Output names carry the time they were written; drop it to compare two runs."""
+    return re.sub(r"_\d+(\.\w+)$", r"\1", path)
+
+
+def run_processor(dm, monkeypatch, tmp_path, parallel):
+    """Process the input directory serially or across two worker processes."""
+    monkeypatch.setattr(dm, "PARALLEL_FILES", parallel)
+    monkeypatch.setattr(dm, "FILE_WORKERS", 2)
+    processor = dm.AutomatedProcessor(dm.DB_CONFIG, dm.TABLE_NAME, dm.COLUMN_MAPPING,
+                                      dm.POSSIBLE_REFERENCE_COMBINATIONS)
+    result = processor.process_all_files()
+    for entry in result["results"]:
+        entry["output"] = without_timestamp(entry["output"])
+    outputs = {without_timestamp(path.name): pd.read_excel(path, sheet_name=None)
+               for path in sorted((tmp_path / "output").iterdir())}
+    for path in (tmp_path / "output").iterdir():
+        path.unlink()
+    return result, outputs
+
+
+def test_parallel_files_match_serial(dm, monkeypatch, tmp_path):
+    seed_sqlite_table(str(tmp_path / "lookup.sqlite"), dm.TABLE_NAME, make_table(300))
+    monkeypatch.setattr(dm, "LOOKUP_BACKEND", "sqlite")
+    monkeypatch.setattr(dm, "LOOKUP_BACKEND_CONFIG", {"type": "sqlite", "path": str(tmp_path / "lookup.sqlite")})
+    monkeypatch.setattr(dm, "INPUT_DIRECTORY", str(tmp_path / "input"))
+    monkeypatch.setattr(dm, "OUTPUT_DIRECTORY", str(tmp_path / "output"))
+    (tmp_path / "input").mkdir()
+    (tmp_path / "output").mkdir()
+    with pd.ExcelWriter(tmp_path / "input" / "first.xlsx") as writer:
+        make_frame(400, 300, seed=1).to_excel(writer, sheet_name="April", index=False)
+        make_frame(250, 300, seed=2).to_excel(writer, sheet_name="May", index=False)
+    make_frame(300, 300, seed=3).to_excel(tmp_path / "input" / "second.xlsx", index=False)
+
+    serial_result, serial_outputs = run_processor(dm, monkeypatch, tmp_path, parallel=False)
+    parallel_result, parallel_outputs = run_processor(dm, monkeypatch, tmp_path, parallel=True)
+
+    assert serial_result["processed"] == 2
+    # Same results dict (and so the same email), and the same enriched outputs
+    assert parallel_result == serial_result
+    assert parallel_outputs.keys() == serial_outputs.keys()
+    for name, sheets in serial_outputs.items():
+        assert list(parallel_outputs[name]) == list(sheets)
+        for sheet_name, frame in sheets.items():
+            pd.testing.assert_frame_equal(parallel_outputs[name][sheet_name], frame)
+
+
+def test_read_only_cache_missing_file_runs_without_cache(dm, monkeypatch, tmp_path):
+    monkeypatch.setattr(dm, "LOOKUP_CACHE_CONFIG", {"enabled": True, "path": str(tmp_path / "missing.sqlite")})
+    enricher = dm.DataEnricher(host="", database="", user="", password="", read_only_cache=True)
+    assert enricher.lookup_cache is None
+    assert not (tmp_path / "missing.sqlite").exists()
@@ -0,0 +1,94 @@
+import os
+
+from benchmarks.common import make_frame, make_table, seed_sqlite_table
+
+
+def hashes_counted(monkeypatch, dm):
+    """Count the files ProcessingManifest reads to hash."""
+    hashed = []
+    file_hash = dm.ProcessingManifest.file_hash.__func__
+
+    def counting(cls, file_path):
+        hashed.append(file_path)
+        return file_hash(cls, file_path)
+
+    monkeypatch.setattr(dm.ProcessingManifest, "file_hash", classmethod(counting))
+    return hashed
+
+
+def recorded_manifest(dm, tmp_path):
+    """A saved manifest recording input.csv as processed into output.csv."""
+    source = tmp_path / "input.csv"
+    source.write_text("a,b\n1,2\n")
+    (tmp_path / "output.csv").write_text("done\n")
+    manifest = dm.ProcessingManifest(str(tmp_path / "manifest.json"))
+    unchanged, fingerprint = manifest.check(str(source))
+    assert not unchanged
+    manifest.record(str(source), fingerprint, str(tmp_path / "output.csv"))
+    manifest.save()
+    return source
+
+
+def test_unchanged_file_skipped_without_hashing(dm, tmp_path, monkeypatch):
+    source = recorded_manifest(dm, tmp_path)
+    hashed = hashes_counted(monkeypatch, dm)
+
+    manifest = dm.ProcessingManifest(str(tmp_path / "manifest.json"))
+    unchanged, _ = manifest.check(str(source))
+
+    assert unchanged
+    assert hashed == []
+    assert manifest.output_for(str(source)) == str(tmp_path / "output.csv")
+
+
+def test_touched_file_with_same_content_rehashed_and_skipped(dm, tmp_path, monkeypatch):
+    source = recorded_manifest(dm, tmp_path)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    hashed = hashes_counted(monkeypatch, dm)
+
+    manifest = dm.ProcessingManifest(str(tmp_path / "manifest.json"))
+    assert manifest.check(str(source))[0]
+    assert hashed == [str(source)]
+    # The new mtime is taken, so the next check is the fast path again
+    assert manifest.check(str(source))[0]
+    assert hashed == [str(source)]
+
+
+def test_changed_content_reprocessed(dm, tmp_path):
+    source = recorded_manifest(dm, tmp_path)
+    source.write_text("a,b\n1,3\n")
+
+    manifest = dm.ProcessingManifest(str(tmp_path / "manifest.json"))
+    assert not manifest.check(str(source))[0]
+
+
+def test_deleted_output_forces_reprocessing(dm, tmp_path):
+    source = recorded_manifest(dm, tmp_path)
+    (tmp_path / "output.csv").unlink()
+
+    manifest = dm.ProcessingManifest(str(tmp_path / "manifest.json"))
+    assert not manifest.check(str(source))[0]
+
+
+def test_force_reprocesses_unchanged_files(dm, tmp_path, monkeypatch):
+    seed_sqlite_table(str(tmp_path / "lookup.sqlite"), dm.TABLE_NAME, make_table(300))
+    monkeypatch.setattr(dm, "LOOKUP_BACKEND", "sqlite")
+    monkeypatch.setattr(dm, "LOOKUP_BACKEND_CONFIG", {"type": "sqlite", "path": str(tmp_path / "lookup.sqlite")})
+    monkeypatch.setattr(dm, "INPUT_DIRECTORY", str(tmp_path / "input"))
+    monkeypatch.setattr(dm, "OUTPUT_DIRECTORY", str(tmp_path / "output"))
+    monkeypatch.setattr(dm, "MANIFEST_ENABLED", True)
+    monkeypatch.setattr(dm, "MANIFEST_CONFIG", {"enabled": True, "path": str(tmp_path / "manifest.json")})
+    (tmp_path / "input").mkdir()
+    (tmp_path / "output").mkdir()
+    make_frame(200, 300).to_excel(tmp_path / "input" / "invoices.xlsx", index=False)
+    processor = dm.AutomatedProcessor(dm.DB_CONFIG, dm.TABLE_NAME, dm.COLUMN_MAPPING,
+                                      dm.POSSIBLE_REFERENCE_COMBINATIONS)
+
+    first = processor.process_all_files()
+    assert (first["processed"], first["skipped"]) == (1, 0)
+    second = processor.process_all_files()
+    assert (second["processed"], second["skipped"]) == (0, 1)
+    assert second["results"][0]["output"] == first["results"][0]["output"]
+    forced = processor.process_all_files(force=True)
+    assert (forced["processed"], forced["skipped"]) == (1, 0)
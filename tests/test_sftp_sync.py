@@ -0,0 +1,106 @@
+import os
+
+import paramiko
+
+import data_merge
+
+
+def write_remote(remote_dir, name, data, mtime):
+    path = remote_dir / name
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_initial_sync_downloads_matching_files(sftp_server, tmp_path):
+    remote_dir, _, downloader = sftp_server
+    write_remote(remote_dir, "a.xlsx", b"a" * 5000, 1_700_000_000)
+    write_remote(remote_dir, "b.csv", b"b" * 300, 1_700_000_100)
+    write_remote(remote_dir, "notes.txt", b"skip", 1_700_000_200)
+    local_dir = tmp_path / "local"
+
+    downloaded = downloader.sync_directory("/", str(local_dir), pattern="*.[cx]*")
+
+    assert sorted(os.path.basename(p) for p in downloaded) == ["a.xlsx", "b.csv"]
+    assert (local_dir / "a.xlsx").read_bytes() == b"a" * 5000
+    assert int(os.stat(local_dir / "b.csv").st_mtime) == 1_700_000_100
+    assert sorted(os.listdir(local_dir)) == ["a.xlsx", "b.csv"]
+
+
+def test_resync_without_changes_downloads_nothing(sftp_server, tmp_path):
+    remote_dir, reads, downloader = sftp_server
+    write_remote(remote_dir, "a.csv", b"a" * 1000, 1_700_000_000)
+    local_dir = tmp_path / "local"
+    downloader.sync_directory("/", str(local_dir))
+    reads.clear()
+
+    assert downloader.sync_directory("/", str(local_dir)) == []
+    assert reads == []
+
+
+def test_changed_file_is_downloaded_again(sftp_server, tmp_path):
+    remote_dir, _, downloader = sftp_server
+    write_remote(remote_dir, "a.csv", b"old", 1_700_000_000)
+    write_remote(remote_dir, "b.csv", b"same", 1_700_000_000)
+    local_dir = tmp_path / "local"
+    downloader.sync_directory("/", str(local_dir))
+
+    write_remote(remote_dir, "a.csv", b"new!", 1_700_000_500)
+    downloaded = downloader.sync_directory("/", str(local_dir))
+
+    assert [os.path.basename(p) for p in downloaded] == ["a.csv"]
+    assert (local_dir / "a.csv").read_bytes() == b"new!"
+    assert int(os.stat(local_dir / "a.csv").st_mtime) == 1_700_000_500
+
+
+def test_killed_transfer_resumes_from_partial(sftp_server, tmp_path, monkeypatch):
+    remote_dir, reads, downloader = sftp_server
+    data = bytes(range(256)) * 64
+    write_remote(remote_dir, "big.csv", data, 1_700_000_000)
+    local_dir = tmp_path / "local"
+    local_dir.mkdir()
+    monkeypatch.setattr(data_merge, "SFTP_CHUNK_SIZE", 4096)
+
+    # Stop the transfer after the first chunk
+    original_read = paramiko.SFTPFile.read
+    calls = []
+
+    def read_once(self, size=None):
+        calls.append(size)
+        if len(calls) > 1:
+            raise KeyboardInterrupt
+        return original_read(self, size)
+
+    monkeypatch.setattr(paramiko.SFTPFile, "read", read_once)
+    try:
+        downloader._fetch(downloader.sftp_client, "/big.csv",
+                          downloader.sftp_client.stat("/big.csv"), str(local_dir / "big.csv"))
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.setattr(paramiko.SFTPFile, "read", original_read)
+    # A killed process runs no cleanup, so the partial keeps the time it was last written
+    os.utime(local_dir / "big.csv.part")
+    assert os.path.getsize(local_dir / "big.csv.part") == 4096
+    assert os.path.exists(local_dir / "big.csv.part.json")
+
+    reads.clear()
+    downloaded = downloader.sync_directory("/", str(local_dir))
+
+    assert [os.path.basename(p) for p in downloaded] == ["big.csv"]
+    assert (local_dir / "big.csv").read_bytes() == data
+    assert min(offset for name, offset in reads if name == "big.csv") == 4096
+    assert sorted(os.listdir(local_dir)) == ["big.csv"]
+
+
+def test_partial_of_another_version_is_restarted(sftp_server, tmp_path):
+    remote_dir, reads, downloader = sftp_server
+    write_remote(remote_dir, "a.csv", b"x" * 2000, 1_700_000_000)
+    local_dir = tmp_path / "local"
+    local_dir.mkdir()
+    (local_dir / "a.csv.part").write_bytes(b"y" * 500)
+    (local_dir / "a.csv.part.json").write_text('{"size": 2000, "mtime": 1600000000}')
+
+    downloader.sync_directory("/", str(local_dir))
+
+    assert (local_dir / "a.csv").read_bytes() == b"x" * 2000
+    assert min(offset for name, offset in reads if name == "a.csv") == 0
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from benchmarks.common import make_frame
+
+
+def sheets():
+    # The first sheet is enriched slowest, so threads finish out of workbook order
+    return {f"Sheet{i}": make_frame(100 * (4 - i), 300, seed=i) for i in range(4)}
+
+
+def record_threads(monkeypatch, enricher):
+    """Note which thread enriched each sheet, holding up the first one."""
+    threads = {}
+    enrich = enricher._enrich_single_dataframe
+
+    def recording(df, *args):
+        threads[args[-1]] = threading.current_thread()
+        if args[-1] == "sheet 'Sheet0'":
+            time.sleep(0.2)
+        return enrich(df, *args)
+
+    monkeypatch.setattr(enricher, "_enrich_single_dataframe", recording)
+    return threads
+
+
+def enrich_sheets(dm, enricher, data):
+    return enricher._enrich_sheets(data, dm.TABLE_NAME, dm.POSSIBLE_REFERENCE_COMBINATIONS, dm.COLUMN_MAPPING)
+
+
+def test_concurrent_sheets_keep_workbook_order(dm, make_enricher, monkeypatch):
+    monkeypatch.setattr(dm, "SHEET_WORKERS", 4)
+    data = sheets()
+    enricher = make_enricher()
+    threads = record_threads(monkeypatch, enricher)
+
+    enriched = enrich_sheets(dm, enricher, data)
+
+    assert list(enriched) == list(data)
+    assert threading.main_thread() not in threads.values()
+    assert len(set(threads.values())) > 1
+    serial = make_enricher()
+    for sheet_name, df_sheet in data.items():
+        expected = serial._enrich_single_dataframe(df_sheet, dm.TABLE_NAME, dm.POSSIBLE_REFERENCE_COMBINATIONS,
+                                                   dm.COLUMN_MAPPING, f"sheet '{sheet_name}'")
+        assert enriched[sheet_name].equals(expected)
+
+
+def test_sheets_enriched_serially_when_source_is_not_concurrent(dm, make_enricher, lookup_table, monkeypatch):
+    class SerialBackend(dm.FrameLookupBackend):
+        concurrent = False
+
+    monkeypatch.setattr(dm, "SHEET_WORKERS", 4)
+    data = sheets()
+    enricher = make_enricher(SerialBackend(lookup_table))
+    threads = record_threads(monkeypatch, enricher)
+
+    enriched = enrich_sheets(dm, enricher, data)
+
+    assert list(enriched) == list(data)
+    assert set(threads.values()) == {threading.main_thread()}
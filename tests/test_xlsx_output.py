@@ -0,0 +1,22 @@
+import openpyxl
+
+from benchmarks.common import InMemoryEnricher, make_frame, make_table
+
+
+def test_single_pass_keeps_template_column_widths(dm, tmp_path, monkeypatch):
+    source = tmp_path / "input.xlsx"
+    make_frame(50, 100).to_excel(source, index=False)
+    workbook = openpyxl.load_workbook(source)
+    widths = {"A": 8.0, "B": 20.0, "C": 12.0, "D": 30.0, "E": 15.0}
+    for letter, width in widths.items():
+        workbook.active.column_dimensions[letter].width = width
+    workbook.save(source)
+    monkeypatch.setattr(dm, "SINGLE_PASS_XLSX", True)
+    enricher = InMemoryEnricher(make_table(100))
+
+    output = tmp_path / "output.xlsx"
+    assert enricher.enrich_data(str(source), dm.TABLE_NAME, dm.POSSIBLE_REFERENCE_COMBINATIONS,
+                                dm.COLUMN_MAPPING, output_path=str(output)) is not None
+
+    written = openpyxl.load_workbook(output).active.column_dimensions
+    assert {letter: round(written[letter].width, 2) for letter in widths} == widths